@@ -0,0 +1,92 @@
+"""
+Benchmark of the user queries with and without prepared statements.
+
+Run from the repository root against a database with the schema of `database/init.sql`:
+    python -m benchmarks.bench_database [postgres_uri]
+
+The URI defaults to `db_connection` of `appsettings.yaml`. The benchmark writes users `bench<i>@bench.invalid`
+and deletes them afterwards.
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from src.config.settings import DatabasePoolSettings, get_settings
+from src.core.database import DatabaseConnection
+
+USERS = 1000
+ROUNDS = 5
+
+
+async def latencies(query: Callable[[int], Awaitable[Any]], count: int) -> List[float]:
+    """
+    Returns the latencies of :param count sequential queries in microseconds
+    :param query: coroutine function running the query of the i-th user
+    :param count: number of queries
+    :return: latencies in microseconds
+    """
+    results = []
+    for i in range(count):
+        started = time.perf_counter()
+        await query(i)
+        results.append((time.perf_counter() - started) * 1000000)
+    return results
+
+
+async def run_mode(dsn: str, prepare_threshold: Optional[int]) -> List[str]:
+    """
+    Benchmarks the statements of `src/routers/user.py` on a single pooled connection
+    :param dsn: database URI
+    :param prepare_threshold: executions before a statement is prepared, never prepared when None
+    :return: report lines
+    """
+    settings = DatabasePoolSettings(
+        min_size=1, max_size=1, prepare_threshold=prepare_threshold
+    )
+    db_connection = DatabaseConnection(dsn, settings=settings)
+    await db_connection.open()
+    queries = {
+        "upsert": lambda i: db_connection.execute(
+            "INSERT INTO users VALUES(%s, %s) ON CONFLICT (email) DO UPDATE SET value = %s;",
+            (f"bench{i % USERS}@bench.invalid", f"value{i}", f"value{i}"),
+        ),
+        "get user": lambda i: db_connection.query_one(
+            "SELECT * FROM users WHERE email = %s", (f"bench{i % USERS}@bench.invalid",)
+        ),
+        "get users": lambda i: db_connection.query_all(
+            "SELECT * FROM users WHERE email > %s ORDER BY email LIMIT %s",
+            (f"bench{i % USERS}@bench.invalid", 10),
+        ),
+    }
+    mode = "prepared" if prepare_threshold is not None else "unprepared"
+    lines = []
+    try:
+        for name, query in queries.items():
+            runs = [await latencies(query, USERS) for _ in range(ROUNDS)]
+            median = min(statistics.median(run) for run in runs)
+            p99 = min(statistics.quantiles(run, n=100)[98] for run in runs)
+            lines.append(
+                f"{name:<10} {mode:<10} median {median:8.1f} us   p99 {p99:8.1f} us"
+            )
+    finally:
+        await db_connection.execute(
+            "DELETE FROM users WHERE email LIKE %s", ("%@bench.invalid",)
+        )
+        await db_connection.close()
+    return lines
+
+
+async def main(dsn: str) -> None:
+    for prepare_threshold in (0, None):
+        for line in await run_mode(dsn, prepare_threshold):
+            print(line)
+
+
+if __name__ == "__main__":
+    uri = (
+        sys.argv[1] if len(sys.argv) > 1 else get_settings().db_connection.postgres_uri
+    )
+    asyncio.run(main(uri))
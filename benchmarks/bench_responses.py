@@ -0,0 +1,80 @@
+"""
+Benchmark of the JSON responses of `src/core/responses.py` against `jsonable_encoder` with `JSONResponse`.
+
+Run from the repository root:
+    python -m benchmarks.bench_responses
+"""
+
+import timeit
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from src.core.responses import success_response
+
+SIZES = {"10 KB": 10 * 1024, "1 MB": 1024 * 1024, "50 MB": 50 * 1024 * 1024}
+
+
+def users(size: int) -> List[Dict[str, Any]]:
+    """
+    Returns database rows of users of about :param size bytes of JSON
+    :param size: approximate size of the encoded rows in bytes
+    :return: list of user rows
+    """
+    return [
+        {"email": f"user{i:08d}@test.com", "value": f"value of user {i}"}
+        for i in range(size // 64)
+    ]
+
+
+def documents(size: int) -> List[Dict[str, Any]]:
+    """
+    Returns a converted document of about :param size bytes of JSON - a list of small objects
+    :param size: approximate size of the encoded document in bytes
+    :return: JSONType document
+    """
+    return [
+        {"id": i, "name": f"item{i}", "price": i / 4, "active": i % 2 == 0, "tag": None}
+        for i in range(size // 72)
+    ]
+
+
+def reference_response(data: Any) -> JSONResponse:
+    """
+    Returns the response the way `success_response` did before, encoded by `jsonable_encoder` and `JSONResponse`
+    :param data: data of the response
+    :return: JSON response
+    """
+    return JSONResponse(
+        {"success": True, "data": jsonable_encoder(data)}, status_code=200
+    )
+
+
+def best_time(function: Callable[[], Any], repeat: int) -> float:
+    """
+    Returns the best wall time of :param function in seconds
+    :param function: benchmarked function
+    :param repeat: number of runs
+    :return: best time in seconds
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main() -> None:
+    for kind, create in (("users", users), ("document", documents)):
+        for size_name, size in SIZES.items():
+            data = create(size)
+            repeat = 3 if size > 1024 * 1024 else 20
+            body_size = len(success_response(data).body)
+            reference = best_time(lambda: reference_response(data), repeat)
+            fast = best_time(lambda: success_response(data), repeat)
+            print(
+                f"{kind:<9} {size_name:>6} ({body_size / 1024:9.1f} KB)  "
+                f"jsonable_encoder {reference * 1000:9.2f} ms   "
+                f"orjson {fast * 1000:8.2f} ms   x{reference / fast:5.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark of the XML/JSON conversion engines.
+
+Run from the repository root:
+    python -m benchmarks.bench_xml_parser
+"""
+
+import glob
+import io
+import json
+import timeit
+from typing import Any, Callable, List
+
+from lxml import etree
+
+from src.config.annotations import JSONType
+from src.core.responses import success_response
+from src.core.xml_parser import XMLParser
+
+
+def flat_document(items: int) -> JSONType:
+    """
+    Returns a wide document - a list of small objects
+    :param items: number of objects in the list
+    :return: JSONType document
+    """
+    return [
+        {"id": i, "name": f"item{i}", "price": i / 4, "active": i % 2 == 0, "tag": None}
+        for i in range(items)
+    ]
+
+
+def corpus_document(copies: int) -> JSONType:
+    """
+    Returns the `tests/data/xml_json` corpus scaled up - a list of :param copies copies of all corpus documents
+    :param copies: number of copies of the corpus
+    :return: JSONType document
+    """
+    corpus = []
+    for json_file in sorted(glob.glob("tests/data/xml_json/*/test.json")):
+        with open(json_file) as json_fp:
+            corpus.append(json.load(json_fp))
+    return corpus * copies
+
+
+def deep_document(depth: int) -> JSONType:
+    """
+    Returns a deep document - a value nested in :param depth lists
+    :param depth: nesting depth of the document
+    :return: JSONType document
+    """
+    document: JSONType = 1
+    for _ in range(depth - 1):
+        document = [document]
+    return document
+
+
+def best_time(function: Callable[[], Any], repeat: int) -> float:
+    """
+    Returns the best wall time of :param function in seconds
+    :param function: benchmarked function
+    :param repeat: number of runs
+    :return: best time in seconds
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def run_case(name: str, document: JSONType, repeat: int) -> List[str]:
+    """
+    Benchmarks both conversion directions of :param document
+    :param name: case name
+    :param document: JSONType document
+    :param repeat: number of runs
+    :return: report lines
+    """
+    lines = []
+    try:
+        element = XMLParser.parse_xml_from_json(document)
+        xml_bytes = etree.tostring(element, encoding="utf-8")
+
+        json2etree = best_time(lambda: XMLParser.parse_xml_from_json(document), repeat)
+        etree2json = best_time(
+            lambda: XMLParser._parse_etree_to_json_type(element), repeat
+        )
+        xml2json = best_time(
+            lambda: XMLParser.parse_xml_from_file(io.BytesIO(xml_bytes)), repeat
+        )
+        # response body built from the JSONType object, as by `success_response`
+        xml2body = best_time(
+            lambda: success_response(
+                XMLParser.parse_xml_from_file(io.BytesIO(xml_bytes))
+            ).body,
+            repeat,
+        )
+        xml2bytes = best_time(
+            lambda: XMLParser.convert_xml_to_json(io.BytesIO(xml_bytes)), repeat
+        )
+        lines.append(f"{name:<24} json->etree {json2etree * 1000:10.1f} ms")
+        lines.append(f"{name:<24} etree->json {etree2json * 1000:10.1f} ms")
+        lines.append(f"{name:<24} xml->json   {xml2json * 1000:10.1f} ms")
+        lines.append(f"{name:<24} xml->body   {xml2body * 1000:10.1f} ms")
+        lines.append(f"{name:<24} xml->bytes  {xml2bytes * 1000:10.1f} ms")
+    except (RecursionError, ValueError) as exc:
+        lines.append(f"{name:<24} failed: {exc!r}")
+    return lines
+
+
+def main() -> None:
+    for items in (1000, 100000):
+        for line in run_case(f"flat {items} items", flat_document(items), repeat=5):
+            print(line)
+    for copies in (100, 10000):
+        for line in run_case(f"corpus x{copies}", corpus_document(copies), repeat=5):
+            print(line)
+
+    # deeply nested element trees cannot be parsed by libxml2 (depth limit), so only the engines are timed
+    depth = 100000
+    document = deep_document(depth)
+    try:
+        element = XMLParser.parse_xml_from_json(document)
+        etree2json = best_time(
+            lambda: XMLParser._parse_etree_to_json_type(element), repeat=3
+        )
+        json2etree = best_time(lambda: XMLParser.parse_xml_from_json(document), 3)
+        print(f"{f'deep {depth} levels':<24} json->etree {json2etree * 1000:10.1f} ms")
+        print(f"{f'deep {depth} levels':<24} etree->json {etree2json * 1000:10.1f} ms")
+    except RecursionError as exc:
+        print(f"{f'deep {depth} levels':<24} failed: {exc!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,23 @@ BEGIN;
         email VARCHAR NOT NULL PRIMARY KEY ,
         value VARCHAR
     );
+
+    -- versions of the users table, every statement writing users increments the stripe of its connection,
+    -- so concurrent writers do not wait for each other; the versions of all stripes identify the table state
+    DROP TABLE IF EXISTS "users_version";
+    CREATE TABLE users_version (
+        stripe SMALLINT NOT NULL PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    );
+    INSERT INTO users_version (stripe) SELECT generate_series(0, 15);
+
+    CREATE OR REPLACE FUNCTION increment_users_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE users_version SET version = version + 1 WHERE stripe = pg_backend_pid() % 16;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER users_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+        FOR EACH STATEMENT EXECUTE FUNCTION increment_users_version();
 COMMIT;
@@ -1,9 +1,9 @@
 from enum import Enum
 from functools import lru_cache
-from typing import Any
+from typing import Any, Dict, List, Optional
 
 import yaml
-from pydantic import BaseSettings, Field, PostgresDsn
+from pydantic import BaseSettings, Field, PostgresDsn, root_validator
 
 
 class LogLevels(str, Enum):
@@ -16,6 +16,22 @@ class LogLevels(str, Enum):
     critical = "critical"
 
 
+class EventLoops(str, Enum):
+    """Enum of permitted event loop implementations, auto uses uvloop when installed."""
+
+    auto = "auto"
+    asyncio = "asyncio"
+    uvloop = "uvloop"
+
+
+class HttpProtocols(str, Enum):
+    """Enum of permitted HTTP protocol implementations, auto uses httptools when installed."""
+
+    auto = "auto"
+    h11 = "h11"
+    httptools = "httptools"
+
+
 class UvicornSettings(BaseSettings):
     """Settings for uvicorn server"""
 
@@ -23,6 +39,29 @@ class UvicornSettings(BaseSettings):
     port: int = Field(ge=0, le=65535)
     log_level: LogLevels
     reload: bool
+    # number of worker processes, a single worker when reloading
+    workers: int = Field(default=1, ge=1)
+    loop: EventLoops = EventLoops.auto
+    http: HttpProtocols = HttpProtocols.auto
+    # every worker listens on its own socket bound with SO_REUSEPORT and the kernel balances the connections
+    # between them, otherwise the workers accept the connections of one socket bound by the supervisor
+    reuse_port: bool = False
+    # workers are restarted after max_requests requests plus a random jitter, so they do not restart together
+    max_requests: Optional[int] = Field(default=None, ge=1)
+    max_requests_jitter: int = Field(default=0, ge=0)
+    # seconds the workers get to finish their requests on shutdown before they are killed
+    graceful_timeout: float = Field(default=30, gt=0)
+    # maximal number of connections waiting to be accepted by a worker
+    backlog: int = Field(default=2048, ge=1)
+    # seconds an idle keep-alive connection is kept open
+    timeout_keep_alive: int = Field(default=5, ge=0)
+
+    @property
+    def worker_count(self) -> int:
+        """Number of worker processes of the server"""
+        if self.reload:
+            return 1
+        return self.workers
 
 
 class ApiConfigSettings(BaseSettings):
@@ -34,6 +73,55 @@ class ApiConfigSettings(BaseSettings):
     docs_url: str
 
 
+class DatabasePoolSettings(BaseSettings):
+    """Settings for pool of database connections"""
+
+    # number of connections kept open and maximal number of connections
+    min_size: int = Field(default=1, ge=0)
+    max_size: int = Field(default=10, ge=1)
+    # seconds to wait for a free connection, requests waiting longer are rejected
+    timeout: float = Field(default=30, gt=0)
+    # number of requests waiting for a connection, unlimited when 0
+    max_waiting: int = Field(default=0, ge=0)
+    # idle connections are closed after max_idle seconds, all connections after max_lifetime seconds
+    max_idle: float = Field(default=600, gt=0)
+    max_lifetime: float = Field(default=3600, gt=0)
+    # connections are checked before they are handed out
+    check: bool = True
+    # statements are prepared on a connection once executed prepare_threshold times, never when None,
+    # every connection keeps at most prepared_max statements, the least recently used ones are deallocated
+    prepare_threshold: Optional[int] = Field(default=0, ge=0)
+    prepared_max: int = Field(default=100, ge=1)
+
+    def per_worker(self, workers: int) -> "DatabasePoolSettings":
+        """
+        Returns the settings of the pool of one worker, the workers share max_size connections
+        :param workers: number of worker processes of the server
+        :return: pool settings of a worker
+        """
+        max_size = max(self.max_size // workers, 1)
+        return self.copy(
+            update={"max_size": max_size, "min_size": min(self.min_size, max_size)}
+        )
+
+
+class ReplicaBalancing(str, Enum):
+    """Enum of permitted balancing of reads between replicas."""
+
+    round_robin = "round_robin"
+    least_connections = "least_connections"
+
+
+class DatabaseReplicaSettings(BaseSettings):
+    """Settings for read replicas of the database"""
+
+    # URIs of the replicas, reads of the read-only endpoints are balanced between them
+    uris: List[str] = []
+    balancing: ReplicaBalancing = ReplicaBalancing.round_robin
+    # reads of a client are sent to the primary for read_your_writes seconds after its writes, disabled when 0
+    read_your_writes: float = Field(default=0, ge=0)
+
+
 class DatabaseConnectionSettings(BaseSettings):
     """Settings for database connection"""
 
@@ -41,6 +129,8 @@ class DatabaseConnectionSettings(BaseSettings):
     postgres_password: str
     postgres_database: str
     postgres_server: str
+    pool: DatabasePoolSettings = Field(default_factory=DatabasePoolSettings)
+    replicas: DatabaseReplicaSettings = Field(default_factory=DatabaseReplicaSettings)
 
     @property
     def postgres_uri(self) -> str:
@@ -53,10 +143,199 @@ class DatabaseConnectionSettings(BaseSettings):
         )
 
 
+class ExecutorKinds(str, Enum):
+    """Enum of permitted conversion executor kinds."""
+
+    process = "process"
+    thread = "thread"
+
+
+class ExecutorSettings(BaseSettings):
+    """Settings for executor of the conversions"""
+
+    kind: ExecutorKinds = ExecutorKinds.process
+    # number of workers, the CPUs divided between the server workers when not set
+    workers: Optional[int] = Field(default=None, ge=1)
+    # number of jobs waiting for a worker, jobs above are rejected
+    queue_size: int = Field(default=32, ge=0)
+    # timeout of a job in seconds
+    timeout: float = Field(default=60, gt=0)
+    # inputs larger than threshold (in bytes) are converted in the executor, smaller ones inline
+    threshold: int = Field(default=1024 * 1024, ge=0)
+
+
+class CacheSettings(BaseSettings):
+    """Settings for cache of the conversion results"""
+
+    enabled: bool = True
+    # total size of the results kept in memory in bytes
+    max_bytes: int = Field(default=256 * 1024 * 1024, ge=0)
+    # results larger than max_entry_bytes are not cached
+    max_entry_bytes: int = Field(default=16 * 1024 * 1024, ge=0)
+    # directory of the disk tier shared by the workers, disabled when not set
+    disk_dir: Optional[str] = None
+    disk_max_bytes: int = Field(default=1024 * 1024 * 1024, ge=0)
+
+
+class BatchSettings(BaseSettings):
+    """Settings for batch conversions"""
+
+    # number of files in one batch, larger batches are rejected
+    max_items: int = Field(default=10000, ge=1)
+    # files larger than max_item_bytes are reported as failed items
+    max_item_bytes: int = Field(default=16 * 1024 * 1024, ge=1)
+    # batches whose files (decompressed from the archives) exceed max_total_bytes together are rejected
+    max_total_bytes: int = Field(default=512 * 1024 * 1024, ge=1)
+    # number of files converted by one executor job
+    chunk_size: int = Field(default=64, ge=1)
+
+
+class ConverterSettings(BaseSettings):
+    """Settings for XML/JSON conversion"""
+
+    max_depth: Optional[int] = Field(default=10000, ge=1)
+    executor: ExecutorSettings = Field(default_factory=ExecutorSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    batch: BatchSettings = Field(default_factory=BatchSettings)
+
+
+class UserBulkSettings(BaseSettings):
+    """Settings for bulk upserts of users"""
+
+    # users are copied to the database in batches of batch_size users
+    batch_size: int = Field(default=10000, ge=1)
+
+
+class UserBatchSettings(BaseSettings):
+    """Settings for lookups and deletes of many users"""
+
+    # maximal number of emails of a request, the emails are queried in batches of batch_size emails
+    max_emails: int = Field(default=10000, ge=1)
+    batch_size: int = Field(default=1000, ge=1)
+
+
+class UserCacheSettings(BaseSettings):
+    """Settings for cache of users"""
+
+    enabled: bool = True
+    # maximal number of cached users, users are cached for ttl seconds at most
+    max_entries: int = Field(default=10000, ge=1)
+    ttl: float = Field(default=60, gt=0)
+    # Postgres channel notifying the other workers of written users, workers are not notified when None
+    notify_channel: Optional[str] = None
+
+
+class UserExportSettings(BaseSettings):
+    """Settings for export of users"""
+
+    # users are fetched from the server-side cursor in chunks of chunk_size users
+    chunk_size: int = Field(default=1000, ge=1)
+
+
+class UserWriteSettings(BaseSettings):
+    """Settings for write-behind coalescing of the writes of single users"""
+
+    # upserts and deletes of single users are committed in batches, every write is committed on its own when disabled
+    coalesce: bool = False
+    # a batch is committed flush_interval seconds after its first write or once it has max_operations writes
+    flush_interval: float = Field(default=0.005, gt=0)
+    max_operations: int = Field(default=1000, ge=1)
+
+
+class UserSettings(BaseSettings):
+    """Settings for user endpoints"""
+
+    bulk: UserBulkSettings = Field(default_factory=UserBulkSettings)
+    batch: UserBatchSettings = Field(default_factory=UserBatchSettings)
+    cache: UserCacheSettings = Field(default_factory=UserCacheSettings)
+    export: UserExportSettings = Field(default_factory=UserExportSettings)
+    writes: UserWriteSettings = Field(default_factory=UserWriteSettings)
+
+
+class RequestLimitsSettings(BaseSettings):
+    """Settings for maximal sizes of request bodies"""
+
+    # maximal body size in bytes of the requests to other paths, unlimited when not set
+    max_body_size: Optional[int] = Field(default=None, ge=0)
+    # maximal body sizes in bytes keyed by the request path
+    endpoints: Dict[str, int] = {
+        "/xml2json": 64 * 1024 * 1024,
+        "/json2xml": 64 * 1024 * 1024,
+        "/batch": 512 * 1024 * 1024,
+        "/users/bulk": 256 * 1024 * 1024,
+    }
+
+    def get_max_body_size(self, path: str) -> Optional[int]:
+        """
+        Returns the maximal body size of the requests to the path
+        :param path: request path
+        :return: maximal body size in bytes, None when unlimited
+        """
+        return self.endpoints.get(path, self.max_body_size)
+
+
+class CompressionSettings(BaseSettings):
+    """Settings for compression of responses"""
+
+    enabled: bool = True
+    # responses smaller than minimum_size bytes are not compressed, streamed responses of unknown size always are
+    minimum_size: int = Field(default=1024, ge=0)
+    # zlib compression level from 1 (fastest) to 9 (smallest)
+    level: int = Field(default=6, ge=1, le=9)
+    # streamed responses are flushed once flush_size bytes are compressed since the last flush,
+    # or by the first chunk arriving flush_interval seconds after the last flush
+    flush_size: int = Field(default=64 * 1024, ge=1)
+    flush_interval: float = Field(default=1.0, ge=0)
+
+
+class MetricsSettings(BaseSettings):
+    """Settings for metrics exposed in the Prometheus text format"""
+
+    enabled: bool = True
+    # upper bounds in seconds of the buckets of the latency histograms
+    latency_buckets: List[float] = [
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+    ]
+    # statements slower than slow_query_threshold seconds are logged, not logged when None
+    slow_query_threshold: Optional[float] = Field(default=0.5, ge=0)
+    # distinct statements recorded in their own series, further statements are recorded as "other"
+    max_statements: int = Field(default=500, ge=0)
+    # routes whose request and response sizes and durations are recorded as conversions
+    conversion_routes: List[str] = ["/xml2json", "/json2xml"]
+
+
 class Settings(BaseSettings):
     uvicorn: UvicornSettings
     db_connection: DatabaseConnectionSettings
     api_config: ApiConfigSettings
+    converter: ConverterSettings = Field(default_factory=ConverterSettings)
+    users: UserSettings = Field(default_factory=UserSettings)
+    request_limits: RequestLimitsSettings = Field(default_factory=RequestLimitsSettings)
+    compression: CompressionSettings = Field(default_factory=CompressionSettings)
+    metrics: MetricsSettings = Field(default_factory=MetricsSettings)
+
+    @root_validator(skip_on_failure=True)
+    def check_worker_caches(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Workers caching users have to notify each other of the written users"""
+        cache: UserCacheSettings = values["users"].cache
+        workers: int = values["uvicorn"].worker_count
+        if workers > 1 and cache.enabled and cache.notify_channel is None:
+            raise ValueError(
+                "users.cache.notify_channel is required when the users are cached by several workers"
+            )
+        return values
 
 
 def load_from_yaml() -> Any:
@@ -0,0 +1,232 @@
+import asyncio
+import io
+import tarfile
+import zipfile
+from itertools import islice
+from typing import IO, AsyncIterator, Iterator, List, Optional, Set, Tuple
+
+from src.config.settings import BatchSettings
+from src.core.executor import (
+    ConversionExecutor,
+    ExecutorOverloadedError,
+    ExecutorTimeoutError,
+)
+from src.core.responses import encode_json
+from src.core.xml_parser import XMLParser
+
+# name of the file, its format and its content,
+# format is None when it is not supported and content is None when the file cannot be read
+BatchItem = Tuple[str, Optional[str], Optional[bytes]]
+
+BATCH_MEDIA_TYPE = "application/x-ndjson"
+
+
+class BatchTooLargeError(Exception):
+    """Raised when a batch contains more files than permitted"""
+
+
+def get_item_format(name: str, content_type: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the format of the batch file from its content type or its name
+    :param name: name of the file
+    :param content_type: content type of the file, None for the files from archives
+    :return: "xml", "json" or None if the format is not supported
+    """
+    if content_type == "text/xml" or name.lower().endswith(".xml"):
+        return "xml"
+    if content_type == "application/json" or name.lower().endswith(".json"):
+        return "json"
+    return None
+
+
+def _iter_zip_items(file: IO[bytes], max_item_bytes: int) -> Iterator[BatchItem]:
+    with zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            item_format = get_item_format(info.filename)
+            if info.file_size > max_item_bytes:
+                yield info.filename, item_format, None
+            else:
+                yield info.filename, item_format, archive.read(info)
+
+
+def _iter_tar_items(file: IO[bytes], max_item_bytes: int) -> Iterator[BatchItem]:
+    with tarfile.open(fileobj=file) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            item_format = get_item_format(member.name)
+            member_file = archive.extractfile(member)
+            if member.size > max_item_bytes or member_file is None:
+                yield member.name, item_format, None
+            else:
+                yield member.name, item_format, member_file.read()
+
+
+def iter_batch_items(
+    file: IO[bytes], name: str, content_type: Optional[str], max_item_bytes: int
+) -> Iterator[BatchItem]:
+    """
+    Yields the files of an uploaded batch part with their formats, zip and tar archives are expanded.
+    The format of the part is decided by its content type or its name,
+    the formats of the files of archives by their names.
+    :param file: uploaded file
+    :param name: name of the uploaded file
+    :param content_type: content type of the uploaded file
+    :param max_item_bytes: files larger than max_item_bytes are yielded without their content
+    :return: iterator of the files
+    """
+    item_format = get_item_format(name, content_type)
+    if item_format is None:
+        if zipfile.is_zipfile(file):
+            file.seek(0)
+            yield from _iter_zip_items(file, max_item_bytes)
+            return
+        file.seek(0)
+        if tarfile.is_tarfile(file):
+            file.seek(0)
+            yield from _iter_tar_items(file, max_item_bytes)
+            return
+        file.seek(0)
+
+    content = file.read(max_item_bytes + 1)
+    yield name, item_format, content if len(content) <= max_item_bytes else None
+
+
+def read_batch_items(
+    files: List[Tuple[IO[bytes], str, Optional[str]]], settings: BatchSettings
+) -> List[BatchItem]:
+    """
+    Returns the files of the batch, archives are expanded.
+    The files are held in memory until they are converted, so the reading stops as soon as the batch
+    exceeds the number of files or their total size, e.g. for a small archive of highly compressed files.
+    :param files: uploaded files with their names and content types
+    :param settings: batch conversion settings
+    :return: list of the files
+    """
+    items: List[BatchItem] = []
+    total_bytes = 0
+    for file, name, content_type in files:
+        for item in iter_batch_items(file, name, content_type, settings.max_item_bytes):
+            items.append(item)
+            if len(items) > settings.max_items:
+                raise BatchTooLargeError(
+                    f"Batch contains more than {settings.max_items} files"
+                )
+            total_bytes += len(item[2] or b"")
+            if total_bytes > settings.max_total_bytes:
+                raise BatchTooLargeError(
+                    f"Files of the batch exceed {settings.max_total_bytes} bytes"
+                )
+    return items
+
+
+def _result_line(name: str, data: Optional[bytes] = None, error: str = "") -> bytes:
+    if data is None:
+        return encode_json({"name": name, "success": False, "errors": error}) + b"\n"
+    return b'{"name":' + encode_json(name) + b',"success":true,"data":' + data + b"}\n"
+
+
+def convert_batch_item(
+    name: str,
+    item_format: Optional[str],
+    content: Optional[bytes],
+    max_depth: Optional[int],
+) -> bytes:
+    """
+    Converts one file of the batch, XML to JSON or JSON to XML by its format
+    :param name: name of the file
+    :param item_format: format of the file detected when the batch was read, None when it is not supported
+    :param content: content of the file, None when the file is too large
+    :param max_depth: maximal nesting depth of the file
+    :return: NDJSON line with the converted data or with the error
+    """
+    if content is None:
+        return _result_line(name, error="File is too large")
+    try:
+        if item_format == "xml":
+            json_data = XMLParser.convert_xml_to_json(
+                io.BytesIO(content), max_depth=max_depth
+            )
+            return _result_line(name, json_data)
+        if item_format == "json":
+            xml_data = XMLParser.convert_json_to_xml(content, max_depth=max_depth)
+            return _result_line(name, encode_json(xml_data.decode("utf-8")))
+    except Exception as exc:
+        return _result_line(name, error=str(exc) or type(exc).__name__)
+    return _result_line(
+        name, error="Unsupported file type, '.xml' or '.json' file is required"
+    )
+
+
+def convert_batch_chunk(
+    items: List[BatchItem], max_depth: Optional[int]
+) -> List[bytes]:
+    """
+    Converts a chunk of the batch files in one executor job
+    :param items: files of the chunk
+    :param max_depth: maximal nesting depth of the files
+    :return: NDJSON lines of the files
+    """
+    return [
+        convert_batch_item(name, item_format, content, max_depth)
+        for name, item_format, content in items
+    ]
+
+
+def _iter_chunks(items: List[BatchItem], chunk_size: int) -> Iterator[List[BatchItem]]:
+    iterator = iter(items)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+async def _run_chunk(
+    executor: ConversionExecutor, items: List[BatchItem], max_depth: Optional[int]
+) -> List[bytes]:
+    try:
+        return await executor.run(convert_batch_chunk, items, max_depth)
+    except (ExecutorOverloadedError, ExecutorTimeoutError) as exc:
+        return [_result_line(name, error=str(exc)) for name, _, _ in items]
+
+
+async def iter_batch_results(
+    executor: ConversionExecutor,
+    items: List[BatchItem],
+    max_depth: Optional[int],
+    chunk_size: int,
+) -> AsyncIterator[bytes]:
+    """
+    Converts the batch files in the executor and yields their NDJSON lines in completion order.
+    At most one chunk per worker is submitted at a time, so a batch does not fill the executor queue.
+    :param executor: executor of the conversions
+    :param items: files of the batch
+    :param max_depth: maximal nesting depth of the files
+    :param chunk_size: number of files converted by one executor job
+    :return: async iterator of the NDJSON lines
+    """
+    chunks = _iter_chunks(items, chunk_size)
+    pending: Set["asyncio.Future[List[bytes]]"] = set()
+    try:
+        while True:
+            for chunk in chunks:
+                pending.add(
+                    asyncio.ensure_future(_run_chunk(executor, chunk, max_depth))
+                )
+                if len(pending) >= executor.workers:
+                    break
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                for line in future.result():
+                    yield line
+    finally:
+        # the client disconnected, the remaining chunks are not converted
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,262 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import IO, Any, AnyStr, Dict, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from src.config.settings import CacheSettings
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ConversionCache:
+    """
+    Content-addressed cache of conversion results.
+    Results are keyed by the hash of the input and the output format.
+    The memory tier evicts the least recently used results once their total size exceeds the limit,
+    the optional disk tier survives restarts and is shared by all workers using the same directory.
+    """
+
+    def __init__(self, settings: CacheSettings) -> None:
+        self.settings = settings
+        self.entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        # bytes written to the disk tier since it was last checked for eviction
+        self._disk_written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def _hash(self, output_format: str, max_depth: Optional[int]) -> Any:
+        return hashlib.sha256(f"{output_format}:{max_depth}:".encode())
+
+    def file_key_sync(
+        self, file: IO[bytes], output_format: str, max_depth: Optional[int]
+    ) -> str:
+        """
+        Returns the cache key of the file content, the file is read in chunks and rewound
+        :param file: input file
+        :param output_format: format of the conversion result
+        :param max_depth: maximal nesting depth of the conversion
+        :return: cache key
+        """
+        digest = self._hash(output_format, max_depth)
+        file.seek(0)
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        file.seek(0)
+        return digest.hexdigest()
+
+    async def file_key(
+        self, file: IO[bytes], output_format: str, max_depth: Optional[int]
+    ) -> Optional[str]:
+        """
+        Returns the cache key of the file content, None when the cache is disabled
+        :param file: input file
+        :param output_format: format of the conversion result
+        :param max_depth: maximal nesting depth of the conversion
+        :return: cache key
+        """
+        if not self.enabled:
+            return None
+        return await run_in_threadpool(
+            self.file_key_sync, file, output_format, max_depth
+        )
+
+    async def data_key(
+        self, data: bytes, output_format: str, max_depth: Optional[int]
+    ) -> Optional[str]:
+        """
+        Returns the cache key of the data, None when the cache is disabled
+        :param data: input data
+        :param output_format: format of the conversion result
+        :param max_depth: maximal nesting depth of the conversion
+        :return: cache key
+        """
+        if not self.enabled:
+            return None
+        digest = self._hash(output_format, max_depth)
+        await run_in_threadpool(digest.update, data)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the cached result from the memory tier or the disk tier
+        :param key: cache key
+        :return: cached result, None if it is not cached
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._read_disk(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._put_memory(key, value)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """
+        Stores the result in the cache, results larger than the maximal entry size are not cached
+        :param key: cache key
+        :param value: conversion result
+        """
+        if len(value) > self.settings.max_entry_bytes:
+            return
+        self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    async def lookup(self, key: Optional[str]) -> Optional[bytes]:
+        """
+        Returns the cached result, the disk tier is read in the threadpool
+        :param key: cache key, None when the cache is disabled
+        :return: cached result, None if it is not cached
+        """
+        if key is None:
+            return None
+        if self.settings.disk_dir is None:
+            return self.get(key)
+        return await run_in_threadpool(self.get, key)
+
+    async def store(self, key: Optional[str], value: bytes) -> None:
+        """
+        Stores the result in the cache, the disk tier is written in the threadpool
+        :param key: cache key, None when the cache is disabled
+        :param value: conversion result
+        """
+        if key is None:
+            return
+        if self.settings.disk_dir is None:
+            self.put(key, value)
+        else:
+            await run_in_threadpool(self.put, key, value)
+
+    def tee(self, key: Optional[str], chunks: Iterator[AnyStr]) -> Iterator[AnyStr]:
+        """
+        Yields the chunks and stores them in the cache when they are all consumed.
+        Chunks are not collected once they exceed the maximal entry size.
+        :param key: cache key, None when the cache is disabled
+        :param chunks: chunks of the conversion result
+        :return: iterator of the same chunks
+        """
+        collected: Optional[List[AnyStr]] = [] if key is not None else None
+        size = 0
+        for chunk in chunks:
+            if collected is not None:
+                collected.append(chunk)
+                size += len(chunk)
+                if size > self.settings.max_entry_bytes:
+                    collected = None
+            yield chunk
+
+        if key is not None and collected:
+            value = collected[0][:0].join(collected)
+            self.put(key, value.encode() if isinstance(value, str) else value)
+
+    def _put_memory(self, key: str, value: bytes) -> None:
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = value
+            self.size += len(value)
+
+            while self.size > self.settings.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.settings.disk_dir or "", key[:2], key)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if self.settings.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as fp:
+                value = fp.read()
+            # modification time orders the disk tier for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def _write_disk(self, key: str, value: bytes) -> None:
+        if self.settings.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written to a temporary file and renamed, so other workers never read a partial result
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as fp:
+            fp.write(value)
+        os.replace(temporary_path, path)
+
+        with self.lock:
+            self._disk_written += len(value)
+            sweep = self._disk_written > self.settings.disk_max_bytes // 10
+            if sweep:
+                self._disk_written = 0
+        if sweep:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Removes the least recently used results until the disk tier fits its limit"""
+        files = []
+        total_size = 0
+        for directory, _, file_names in os.walk(self.settings.disk_dir or ""):
+            for file_name in file_names:
+                # results being written by other workers are skipped
+                if file_name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        for _, file_size, path in sorted(files):
+            if total_size <= self.settings.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= file_size
+            with self.lock:
+                self.disk_evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the cache counters
+        :return: dictionary of the counters
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "entries": len(self.entries),
+                "size_bytes": self.size,
+            }
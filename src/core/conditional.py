@@ -0,0 +1,51 @@
+import hashlib
+from typing import Any, Optional
+
+from starlette import status
+from starlette.responses import Response
+
+from src.core.responses import dump_json
+
+
+def make_etag(*parts: str) -> str:
+    """
+    Returns a strong entity tag of the parts identifying the representation
+    :param parts: parts of the tag, e.g. the name of the resource and its version
+    :return: quoted entity tag
+    """
+    return '"' + "-".join(parts) + '"'
+
+
+def content_etag(data: Any) -> str:
+    """
+    Returns a strong entity tag of the JSON encoded data
+    :param data: data of the response
+    :return: quoted entity tag
+    """
+    return make_etag(hashlib.blake2b(dump_json(data), digest_size=16).hexdigest())
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Returns whether the If-None-Match header matches the entity tag.
+    The tags are compared weakly, so tags weakened by the compression of the response match as well.
+    :param if_none_match: If-None-Match header value
+    :param etag: current entity tag of the resource
+    :return: True when the client has the current representation
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+def not_modified_response(etag: str) -> Response:
+    """
+    Returns an empty response telling the client to use its representation of the resource
+    :param etag: current entity tag of the resource
+    :return: 304 response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -1,44 +1,252 @@
-from typing import Any, List, Mapping, Optional, Sequence, Tuple, Union
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from itertools import count
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
 
-import psycopg2
-from psycopg2._psycopg import connection
-from psycopg2.extras import RealDictCursor
+from psycopg import AsyncConnection
+from psycopg.rows import DictRow, dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from src.config.settings import (
+    DatabasePoolSettings,
+    DatabaseReplicaSettings,
+    ReplicaBalancing,
+)
+from src.core.metrics import QueryMetrics
+
+QueryParams = Union[Sequence[Any], Mapping[str, Any], None]
+Pool = AsyncConnectionPool[AsyncConnection[DictRow]]
+
+
+class RequestReads:
+    """
+    Reads and writes of the database by a request.
+    Reads go to the primary once the request has written, or when the client has written recently.
+    """
+
+    def __init__(self, primary: bool = False) -> None:
+        self.primary = primary
+        self.written = False
+
+
+class QueryRecord:
+    """Outcome of a statement recorded in the query metrics"""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.failed = False
+
+
+# reads and writes of the current request, None outside of requests tracked by `ReadYourWritesMiddleware`
+request_reads: ContextVar[Optional[RequestReads]] = ContextVar(
+    "request_reads", default=None
+)
+
+
+def record_write() -> None:
+    """Send the following reads of the current request to the primary, as the request has written"""
+    reads = request_reads.get()
+    if reads is not None:
+        reads.primary = reads.written = True
 
 
 class DatabaseConnection:
-    """Database connection class"""
+    """
+    Database connection class.
+    Queries are run on connections of an asynchronous pool, so concurrent requests do not share a connection
+    and do not block the event loop.
+    Repeated queries are prepared on each connection, `prepare` forces (True) or prevents (False) it per query.
+    Reads passed with `replica=True` are balanced between the pools of the replicas, all other statements
+    are run on the primary and count as writes of the request.
+    Statements run by `query_all`, `query_one` and `execute` are recorded in the query metrics when given.
+    """
 
-    conn: connection
+    pool: Pool
+    replica_pools: List[Pool]
 
     def __init__(
-        self, conn: Optional[connection] = None, dsn: Optional[str] = None
+        self,
+        dsn: str,
+        settings: Optional[DatabasePoolSettings] = None,
+        replica_settings: Optional[DatabaseReplicaSettings] = None,
+        metrics: Optional[QueryMetrics] = None,
     ) -> None:
-        self.conn = conn or psycopg2.connect(dsn, cursor_factory=RealDictCursor)
-
-    def query_all(
-        self, query: str, params: Union[Sequence[Any], Mapping[str, Any], None] = None
-    ) -> List[Tuple[Any, ...]]:
-        """Execute a query and return the results"""
-        with self.conn.cursor() as cursor:
-            cursor.execute(query, params)
-            return cursor.fetchall()
-
-    def query_one(
-        self, query: str, params: Union[Sequence[Any], Mapping[str, Any], None] = None
-    ) -> Optional[Tuple[Any, ...]]:
-        """Execute a query and return the results"""
-        with self.conn.cursor() as cursor:
-            cursor.execute(query, params)
-            return cursor.fetchone()
-
-    def execute(
-        self, query: str, params: Union[Sequence[Any], Mapping[str, Any], None] = None
+        self.settings = settings or DatabasePoolSettings()
+        self.metrics = metrics
+        self.replica_settings = replica_settings or DatabaseReplicaSettings()
+        self.pool = self._create_pool(dsn)
+        self.replica_pools = [
+            self._create_pool(uri) for uri in self.replica_settings.uris
+        ]
+        # connections borrowed from the replica pools, for least-connections balancing
+        self.replica_connections = [0] * len(self.replica_pools)
+        self._round_robin = count()
+
+    def _create_pool(self, dsn: str) -> Pool:
+        return AsyncConnectionPool(
+            dsn,
+            connection_class=AsyncConnection[DictRow],
+            # statements are committed one by one, transactions are opened explicitly
+            kwargs={"autocommit": True, "row_factory": dict_row},
+            min_size=self.settings.min_size,
+            max_size=self.settings.max_size,
+            timeout=self.settings.timeout,
+            max_waiting=self.settings.max_waiting,
+            max_idle=self.settings.max_idle,
+            max_lifetime=self.settings.max_lifetime,
+            check=self._check if self.settings.check else None,
+            configure=self._configure,
+            open=False,
+        )
+
+    async def _configure(self, conn: AsyncConnection[DictRow]) -> None:
+        # statements are prepared by psycopg, keyed by their text in a bounded LRU cache of each connection
+        conn.prepare_threshold = self.settings.prepare_threshold
+        conn.prepared_max = self.settings.prepared_max
+
+    @staticmethod
+    async def _check(conn: AsyncConnection[DictRow]) -> None:
+        # the empty query of `AsyncConnectionPool.check_connection` is not cached once prepared,
+        # so it would be prepared again on every checkout
+        await conn.execute("", prepare=False)
+
+    async def open(self) -> None:
+        """Open the pools and wait for their minimal number of connections"""
+        for pool in [self.pool, *self.replica_pools]:
+            await pool.open(wait=True, timeout=self.settings.timeout)
+
+    def _replica_index(self) -> int:
+        if self.replica_settings.balancing == ReplicaBalancing.least_connections:
+            return min(
+                range(len(self.replica_pools)),
+                key=self.replica_connections.__getitem__,
+            )
+        return next(self._round_robin) % len(self.replica_pools)
+
+    @asynccontextmanager
+    async def _connection(
+        self, replica: bool
+    ) -> AsyncIterator[AsyncConnection[DictRow]]:
+        reads = request_reads.get()
+        if (
+            not replica
+            or not self.replica_pools
+            or (reads is not None and reads.primary)
+        ):
+            if not replica:
+                record_write()
+            async with self.pool.connection() as conn:
+                yield conn
+            return
+
+        index = self._replica_index()
+        self.replica_connections[index] += 1
+        try:
+            async with self.replica_pools[index].connection() as conn:
+                yield conn
+        finally:
+            self.replica_connections[index] -= 1
+
+    @asynccontextmanager
+    async def _measured(
+        self, query: str, params: QueryParams
+    ) -> AsyncIterator[QueryRecord]:
+        record = QueryRecord()
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record.failed = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record(
+                    query,
+                    params,
+                    time.perf_counter() - started,
+                    record.rows,
+                    record.failed,
+                )
+
+    async def query_all(
+        self,
+        query: str,
+        params: QueryParams = None,
+        prepare: Optional[bool] = None,
+        replica: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Execute a query and return the results, read-only queries may be run on a replica"""
+        async with self._measured(query, params) as record:
+            async with self._connection(replica) as conn:
+                cursor = await conn.execute(query, params, prepare=prepare)
+                rows = await cursor.fetchall()
+            record.rows = len(rows)
+            return rows
+
+    async def query_one(
+        self,
+        query: str,
+        params: QueryParams = None,
+        prepare: Optional[bool] = None,
+        replica: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """Execute a query and return the results, read-only queries may be run on a replica"""
+        async with self._measured(query, params) as record:
+            async with self._connection(replica) as conn:
+                cursor = await conn.execute(query, params, prepare=prepare)
+                row = await cursor.fetchone()
+            record.rows = int(row is not None)
+            return row
+
+    async def execute(
+        self, query: str, params: QueryParams = None, prepare: Optional[bool] = None
     ) -> None:
-        """Execute a query and commit the changes"""
-        with self.conn.cursor() as cursor:
-            cursor.execute(query, params)
-        self.conn.commit()  # type: ignore
-
-    def close(self) -> None:
-        """Close the connection"""
-        self.conn.close()  # type: ignore
+        """Execute a query on the primary and commit the changes"""
+        async with self._measured(query, params) as record:
+            async with self._connection(replica=False) as conn:
+                cursor = await conn.execute(query, params, prepare=prepare)
+            # rowcount is -1 for statements not affecting rows
+            record.rows = max(cursor.rowcount, 0)
+
+    async def stream(
+        self,
+        query: str,
+        params: QueryParams = None,
+        chunk_size: int = 1000,
+        replica: bool = False,
+    ) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        """
+        Execute a query on a server-side cursor and return the results in chunks of chunk_size rows,
+        so the results are never held in memory at once. The connection is borrowed until the iteration ends.
+        """
+        async with self._connection(replica) as conn:
+            async with conn.transaction():
+                async with conn.cursor(name="stream") as cursor:
+                    await cursor.execute(query, params)
+                    rows = await cursor.fetchmany(chunk_size)
+                    while rows:
+                        yield rows
+                        rows = await cursor.fetchmany(chunk_size)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncConnection[DictRow]]:
+        """Borrow a connection of the primary, the statements run on it are committed together on exit"""
+        async with self._connection(replica=False) as conn:
+            async with conn.transaction():
+                yield conn
+
+    async def close(self) -> None:
+        """Close the pools and their connections"""
+        for pool in [self.pool, *self.replica_pools]:
+            await pool.close()
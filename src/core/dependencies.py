@@ -2,7 +2,13 @@ from typing import Optional
 
 from starlette.requests import Request
 
+from src.config.settings import ConverterSettings, UserSettings, get_settings
+from src.core.cache import ConversionCache
 from src.core.database import DatabaseConnection
+from src.core.executor import ConversionExecutor
+from src.core.metrics import MetricsRegistry
+from src.core.user_cache import UserCache
+from src.core.user_writes import UserWriteCoalescer
 
 
 async def get_accept_request_header(request: Request) -> Optional[str]:
@@ -14,6 +20,15 @@ async def get_accept_request_header(request: Request) -> Optional[str]:
     return request.headers.get("Accept")
 
 
+async def get_if_none_match_request_header(request: Request) -> Optional[str]:
+    """
+    Returns the value of the If-None-Match header of the request.
+    :param request: request
+    :return: If-None-Match header value
+    """
+    return request.headers.get("If-None-Match")
+
+
 async def get_db_connection(request: Request) -> DatabaseConnection:
     """
     Returns a database connection
@@ -21,3 +36,64 @@ async def get_db_connection(request: Request) -> DatabaseConnection:
     :return: database connection
     """
     return request.app.state.db_connection
+
+
+async def get_user_cache(request: Request) -> UserCache:
+    """
+    Returns the cache of the users
+    :param request: request
+    :return: user cache
+    """
+    return request.app.state.user_cache
+
+
+async def get_metrics_registry(request: Request) -> Optional[MetricsRegistry]:
+    """
+    Returns the registry of the metrics
+    :param request: request
+    :return: metrics registry, None when the metrics are disabled
+    """
+    return request.app.state.metrics_registry
+
+
+async def get_user_writes(request: Request) -> Optional[UserWriteCoalescer]:
+    """
+    Returns the coalescer of the writes of single users
+    :param request: request
+    :return: write coalescer, None when the writes are not coalesced
+    """
+    return request.app.state.user_writes
+
+
+async def get_converter_settings() -> ConverterSettings:
+    """
+    Returns the XML/JSON conversion settings
+    :return: conversion settings
+    """
+    return get_settings().converter
+
+
+async def get_user_settings() -> UserSettings:
+    """
+    Returns the settings of the user endpoints
+    :return: user settings
+    """
+    return get_settings().users
+
+
+async def get_conversion_executor(request: Request) -> ConversionExecutor:
+    """
+    Returns the executor of the conversions
+    :param request: request
+    :return: conversion executor
+    """
+    return request.app.state.conversion_executor
+
+
+async def get_conversion_cache(request: Request) -> ConversionCache:
+    """
+    Returns the cache of the conversion results
+    :param request: request
+    :return: conversion cache
+    """
+    return request.app.state.conversion_cache
@@ -0,0 +1,190 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, TypeVar, cast
+
+from fastapi import UploadFile
+
+from src.config.settings import ExecutorKinds, ExecutorSettings
+from src.core.uploads import spooled_file_path
+
+T = TypeVar("T")
+
+# returned by the iterator of a stream once it is exhausted
+_STREAM_END = object()
+
+
+class ExecutorOverloadedError(Exception):
+    """Raised when all workers are busy and the queue of the executor is full"""
+
+
+class ExecutorTimeoutError(Exception):
+    """Raised when a job does not finish in time"""
+
+
+def get_upload_size(file: UploadFile) -> int:
+    """
+    Returns the size of the uploaded file
+    :param file: uploaded file
+    :return: size of the file in bytes
+    """
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+class ConversionExecutor:
+    """
+    Executor running CPU-bound conversions off the event loop.
+    The number of submitted jobs and streamed conversions is bounded by the number of workers and the queue size,
+    jobs above the bound are rejected. A process pool broken by a crashed worker is replaced by a new one.
+    """
+
+    executor: Executor
+
+    def __init__(self, settings: ExecutorSettings, server_workers: int = 1) -> None:
+        self.settings = settings
+        # the default share of the CPUs keeps the server workers from oversubscribing them together
+        self.workers = settings.workers or max(
+            (os.cpu_count() or 1) // server_workers, 1
+        )
+        self.capacity = self.workers + settings.queue_size
+        self.pending = 0
+        self.executor = self._create_executor()
+
+    def _create_executor(self) -> Executor:
+        if self.settings.kind is ExecutorKinds.process:
+            # spawned workers do not inherit the event loop and threads of the server process
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="conversion"
+        )
+
+    def _replace_broken(self, executor: Executor) -> None:
+        # the jobs of the broken pool fail, the following ones are run by a new pool
+        if self.executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._create_executor()
+
+    def _submit(self, function: Callable[..., T], *args: Any) -> "Future[T]":
+        executor = self.executor
+        try:
+            return executor.submit(function, *args)
+        except BrokenProcessPool:
+            # broken by a job that crashed its worker, the pool is replaced before the job is submitted again
+            self._replace_broken(executor)
+            return self.executor.submit(function, *args)
+
+    def should_offload(self, size: int) -> bool:
+        """
+        Returns whether the input of given size is converted in the executor
+        :param size: size of the input in bytes
+        :return: True if the input is larger than the threshold
+        """
+        return size > self.settings.threshold
+
+    async def file_source(self, file: UploadFile) -> Any:
+        """
+        Returns the uploaded file in a form that can be passed to the workers.
+        Threads share the spooled file. Processes open the spooled file by its path once it is rolled over to disk,
+        so its content is not pickled; files still held in memory, or on systems without /proc, are copied.
+        :param file: uploaded file
+        :return: file object, or path of the file
+        """
+        if self.settings.kind is ExecutorKinds.thread:
+            return file.file
+        path = spooled_file_path(file.file)
+        if path is not None:
+            return path
+        return io.BytesIO(cast(bytes, await file.read()))
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        """
+        Runs the function in the executor and waits for its result.
+        Jobs waiting in the queue are cancelled on timeout, running jobs keep their worker until they finish.
+        :param function: function to run, it has to be picklable for process executor
+        :param args: arguments of the function
+        :return: result of the function
+        """
+        if self.pending >= self.capacity:
+            raise ExecutorOverloadedError("Conversion queue is full")
+
+        loop = asyncio.get_running_loop()
+        future = self._submit(function, *args)
+        executor = self.executor
+        self.pending += 1
+
+        def release(_: "Future[T]") -> None:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._release)
+
+        future.add_done_callback(release)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=self.settings.timeout
+            )
+        except asyncio.TimeoutError:
+            raise ExecutorTimeoutError(
+                f"Conversion did not finish in {self.settings.timeout} seconds"
+            )
+        except BrokenProcessPool:
+            # the job may have crashed the worker itself, so it is not retried
+            self._replace_broken(executor)
+            raise
+
+    async def stream(self, chunks: Iterator[T]) -> AsyncIterator[T]:
+        """
+        Produces the chunks of a streamed conversion off the event loop, the stream counts as a job of the executor.
+        The stream is rejected when the executor is full and fails once producing its chunks took longer
+        than the timeout, the time the client takes to receive them does not count.
+        Iterators cannot be sent to other processes, so the chunks are produced by the threads of a thread executor,
+        or by the default thread pool of the event loop next to a process executor.
+        :param chunks: chunks of the conversion, produced by the iteration
+        :return: async iterator of the chunks
+        """
+        if self.pending >= self.capacity:
+            raise ExecutorOverloadedError("Conversion queue is full")
+
+        loop = asyncio.get_running_loop()
+        executor: Optional[Executor] = (
+            self.executor if self.settings.kind is ExecutorKinds.thread else None
+        )
+        self.pending += 1
+        future: "Optional[asyncio.Future[Any]]" = None
+        try:
+            remaining = self.settings.timeout
+            while True:
+                started = time.monotonic()
+                future = loop.run_in_executor(executor, next, chunks, _STREAM_END)
+                done, _ = await asyncio.wait({future}, timeout=remaining)
+                if not done:
+                    raise ExecutorTimeoutError(
+                        f"Conversion did not finish in {self.settings.timeout} seconds"
+                    )
+                chunk = future.result()
+                if chunk is _STREAM_END:
+                    return
+                remaining -= time.monotonic() - started
+                yield cast(T, chunk)
+        finally:
+            # like timed out jobs, a chunk still being produced keeps its worker until it is finished
+            if future is not None and not future.done():
+                future.add_done_callback(lambda _: self._release())
+            else:
+                self._release()
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Cancel the queued jobs and shut the workers down"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
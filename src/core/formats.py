@@ -0,0 +1,186 @@
+import csv
+import io
+from typing import (
+    IO,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import cbor2
+import msgpack
+
+from src.core.responses import encode_json
+from src.core.xml_parser import XMLParser
+
+JSON_MEDIA_TYPE = "application/json"
+XML_MEDIA_TYPE = "text/xml"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+
+# media types of the responses of /xml2json and /json2xml, the first one is the default
+XML2JSON_MEDIA_TYPES = (
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    CBOR_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+)
+JSON2XML_MEDIA_TYPES = (
+    JSON_MEDIA_TYPE,
+    XML_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    CBOR_MEDIA_TYPE,
+)
+# media types of the exports of database tables
+EXPORT_MEDIA_TYPES = (NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE)
+
+# other names of the media types used by clients
+_MEDIA_TYPE_ALIASES = {
+    "application/x-msgpack": MSGPACK_MEDIA_TYPE,
+    "application/vnd.msgpack": MSGPACK_MEDIA_TYPE,
+    "application/ndjson": NDJSON_MEDIA_TYPE,
+    "application/jsonl": NDJSON_MEDIA_TYPE,
+}
+
+
+class UnencodableDataError(Exception):
+    """Raised when the data cannot be represented in the binary format of the response"""
+
+
+_BINARY_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    MSGPACK_MEDIA_TYPE: msgpack.packb,
+    CBOR_MEDIA_TYPE: cbor2.dumps,
+}
+
+
+def _parse_accept(accept_header: str) -> List[Tuple[str, float]]:
+    """
+    Returns media ranges of the Accept header with their quality
+    :param accept_header: value of the Accept header
+    :return: list of media ranges and their quality
+    """
+    media_ranges = []
+    for media_range in accept_header.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_type = media_type.lower()
+        media_ranges.append((_MEDIA_TYPE_ALIASES.get(media_type, media_type), quality))
+    return media_ranges
+
+
+def get_media_type(content_type: Optional[str]) -> str:
+    """
+    Returns the media type of the Content-Type header without its parameters
+    :param content_type: value of the Content-Type header
+    :return: media type, JSON when the header is missing
+    """
+    if not content_type:
+        return JSON_MEDIA_TYPE
+    media_type = content_type.split(";")[0].strip().lower()
+    return _MEDIA_TYPE_ALIASES.get(media_type, media_type)
+
+
+def negotiate_media_type(accept_header: Optional[str], offered: Sequence[str]) -> str:
+    """
+    Returns the offered media type preferred by the Accept header.
+    Media types of equal quality are preferred in the order of the header,
+    the first offered media type is returned when none of them is accepted.
+    :param accept_header: value of the Accept header
+    :param offered: media types of the response
+    :return: media type of the response
+    """
+    if not accept_header:
+        return offered[0]
+
+    media_ranges = sorted(_parse_accept(accept_header), key=lambda item: -item[1])
+    for media_range, quality in media_ranges:
+        if quality <= 0:
+            break
+        range_type, _, range_subtype = media_range.partition("/")
+        for media_type in offered:
+            media_type_type = media_type.split("/")[0]
+            if media_range == media_type or (
+                range_subtype == "*" and range_type in ("*", media_type_type)
+            ):
+                return media_type
+    return offered[0]
+
+
+def encode_success(data: Any, media_type: str) -> bytes:
+    """
+    Encodes the data wrapped into the success envelope to a binary format
+    :param data: data to be encoded
+    :param media_type: media type of the binary format - MessagePack or CBOR
+    :return: encoded success envelope
+    """
+    try:
+        return _BINARY_ENCODERS[media_type]({"success": True, "data": data})
+    except OverflowError as e:
+        # MessagePack integers are limited to 64 bits, JSON and CBOR encode larger integers
+        raise UnencodableDataError(
+            f"Data cannot be encoded as {media_type}: {e}, request JSON or CBOR instead"
+        ) from e
+
+
+def convert_xml_file(
+    file: Union[str, IO[bytes]], media_type: str, max_depth: Optional[int]
+) -> bytes:
+    """
+    Converts XML file to the data of the response of given media type.
+    JSON is written directly from the parse events and returned without the envelope,
+    binary formats are encoded from the parsed JSONType object together with the envelope.
+    :param file: XML file or its path
+    :param media_type: media type of the response - JSON, MessagePack or CBOR
+    :param max_depth: maximal nesting depth of the elements, unlimited when None
+    :return: converted data
+    """
+    if media_type == JSON_MEDIA_TYPE:
+        return XMLParser.convert_xml_to_json(file, max_depth=max_depth)
+    return encode_success(
+        XMLParser.parse_xml_from_file(file, max_depth=max_depth), media_type
+    )
+
+
+async def iter_export_chunks(
+    chunks: AsyncIterator[List[Dict[str, Any]]],
+    media_type: str,
+    fieldnames: Sequence[str],
+) -> AsyncIterator[bytes]:
+    """
+    Encodes chunks of rows as they are fetched, one encoded chunk per chunk of rows
+    :param chunks: chunks of rows
+    :param media_type: media type of the export - NDJSON or CSV
+    :param fieldnames: columns of the rows, the header of CSV
+    :return: async iterator of the encoded chunks
+    """
+    if media_type == NDJSON_MEDIA_TYPE:
+        async for rows in chunks:
+            yield b"".join(encode_json(row) + b"\n" for row in rows)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, lineterminator="\n")
+    writer.writeheader()
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # header of an empty export
+        yield buffer.getvalue().encode("utf-8")
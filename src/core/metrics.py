@@ -0,0 +1,335 @@
+import logging
+import re
+from bisect import bisect_left
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from src.config.settings import MetricsSettings
+
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# label of the statements recorded once the number of distinct statements exceeds the limit
+OTHER_STATEMENT = "other"
+
+# upper bounds in bytes of the buckets of the size histograms, from 1 KiB to 1 GiB
+SIZE_BUCKETS = [1024 * 4**exponent for exponent in range(11)]
+
+_WHITESPACE = re.compile(r"\s+")
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    labels = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + labels + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, updated without locks by the event loop"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}{labels} {_format_value(self.value)}"]
+
+
+class Gauge(Counter):
+    """Value which goes up and down, e.g. number of requests in progress"""
+
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    """Histogram with preallocated buckets, the observations are counted in their bucket only"""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        # the last bucket counts the observations larger than all the bounds
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        # bucket labels are appended to the labels of the histogram
+        prefix = labels[:-1] + "," if labels else "{"
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{prefix}le="{_format_value(bound)}"}} {cumulative}'
+            )
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+Metric = TypeVar("Metric", Counter, Gauge, Histogram)
+
+
+class MetricFamily(Generic[Metric]):
+    """Metrics of the same name, one per combination of the label values"""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        kind: str,
+        label_names: Sequence[str],
+        create: Callable[[], Metric],
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.create: Callable[[], Metric] = create
+        self.metrics: Dict[LabelValues, Metric] = {}
+
+    def labels(self, *values: str) -> Metric:
+        """
+        Returns the metric of the label values, it is created on the first use
+        :param values: values of the labels in the order of their names
+        :return: metric
+        """
+        metric = self.metrics.get(values)
+        if metric is None:
+            metric = self.metrics[values] = self.create()
+        return metric
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {_escape(self.description)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, metric in list(self.metrics.items()):
+            lines += metric.samples(self.name, _format_labels(self.label_names, values))
+        return lines
+
+
+class MetricsRegistry:
+    """Registry of the metrics of the application, rendered in the Prometheus text format"""
+
+    def __init__(self) -> None:
+        self.families: Dict[str, MetricFamily[Any]] = {}
+
+    def _register(self, family: MetricFamily[Metric]) -> MetricFamily[Metric]:
+        if family.name in self.families:
+            raise ValueError(f"Metric {family.name} is already registered")
+        self.families[family.name] = family
+        return family
+
+    def counter(
+        self, name: str, description: str, label_names: Sequence[str] = ()
+    ) -> MetricFamily[Counter]:
+        return self._register(
+            MetricFamily(name, description, "counter", label_names, Counter)
+        )
+
+    def gauge(
+        self, name: str, description: str, label_names: Sequence[str] = ()
+    ) -> MetricFamily[Gauge]:
+        return self._register(
+            MetricFamily(name, description, "gauge", label_names, Gauge)
+        )
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float],
+        label_names: Sequence[str] = (),
+    ) -> MetricFamily[Histogram]:
+        return self._register(
+            MetricFamily(
+                name,
+                description,
+                "histogram",
+                label_names,
+                partial(Histogram, sorted(buckets)),
+            )
+        )
+
+    def render(self) -> str:
+        """
+        Renders all the metrics in the Prometheus text exposition format
+        :return: text of the metrics
+        """
+        lines = []
+        for family in self.families.values():
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+
+def params_shape(params: Union[Sequence[Any], Mapping[str, Any], None]) -> str:
+    """
+    Describes the parameters of a query by their types, so their values are not logged
+    :param params: parameters of the query
+    :return: shape of the parameters, e.g. `(str, int)` or `{email: str}`
+    """
+    if params is None:
+        return "()"
+    if isinstance(params, Mapping):
+        return (
+            "{"
+            + ", ".join(
+                f"{key}: {_value_shape(value)}" for key, value in params.items()
+            )
+            + "}"
+        )
+    return "(" + ", ".join(_value_shape(value) for value in params) + ")"
+
+
+def _value_shape(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+class QueryMetrics:
+    """
+    Latency histograms, row counts and error counts of the database statements.
+    Statements are labelled by their text, so the fixed statements of the routers get their own series.
+    Statements slower than the threshold are logged with the shape of their parameters.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        settings: MetricsSettings,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.settings = settings
+        self.logger = logger or logging.getLogger("uvicorn.error")
+        self.duration = registry.histogram(
+            "db_query_duration_seconds",
+            "Duration of database statements including the wait for a connection",
+            settings.latency_buckets,
+            ["statement"],
+        )
+        self.rows = registry.counter(
+            "db_query_rows_total",
+            "Rows returned or affected by database statements",
+            ["statement"],
+        )
+        self.errors = registry.counter(
+            "db_query_errors_total", "Failed database statements", ["statement"]
+        )
+        self.statements: Dict[str, str] = {}
+
+    def _statement(self, query: str) -> str:
+        statement = self.statements.get(query)
+        if statement is None:
+            if len(self.statements) >= self.settings.max_statements:
+                return OTHER_STATEMENT
+            statement = self.statements[query] = _WHITESPACE.sub(" ", query).strip()
+        return statement
+
+    def record(
+        self,
+        query: str,
+        params: Union[Sequence[Any], Mapping[str, Any], None],
+        seconds: float,
+        rows: int,
+        failed: bool,
+    ) -> None:
+        """
+        Records an executed statement
+        :param query: text of the statement
+        :param params: parameters of the statement
+        :param seconds: duration of the statement
+        :param rows: number of returned or affected rows
+        :param failed: whether the statement failed
+        """
+        statement = self._statement(query)
+        self.duration.labels(statement).observe(seconds)
+        self.rows.labels(statement).inc(rows)
+        if failed:
+            self.errors.labels(statement).inc()
+
+        threshold = self.settings.slow_query_threshold
+        if threshold is not None and seconds >= threshold:
+            self.logger.warning(
+                f"Slow query {seconds:.3f} s: {_WHITESPACE.sub(' ', query).strip()} params {params_shape(params)}"
+            )
+
+
+class HttpMetrics:
+    """
+    Latency histograms, requests in progress and response counts of the HTTP requests per route template,
+    and the sizes of the conversions. Created once per registry, as the middleware stack may be rebuilt.
+    """
+
+    def __init__(self, registry: MetricsRegistry, settings: MetricsSettings) -> None:
+        self.conversion_routes = frozenset(settings.conversion_routes)
+        self.duration = registry.histogram(
+            "http_request_duration_seconds",
+            "Duration of HTTP requests until their response is sent",
+            settings.latency_buckets,
+            ["method", "route"],
+        )
+        self.in_progress = registry.gauge(
+            "http_requests_in_progress",
+            "HTTP requests being handled",
+            ["method", "route"],
+        )
+        self.responses = registry.counter(
+            "http_responses_total", "HTTP responses", ["method", "route", "status"]
+        )
+        self.conversion_input = registry.histogram(
+            "conversion_input_bytes",
+            "Size of converted uploads",
+            SIZE_BUCKETS,
+            ["route"],
+        )
+        self.conversion_output = registry.histogram(
+            "conversion_output_bytes",
+            "Size of conversion responses before their compression",
+            SIZE_BUCKETS,
+            ["route"],
+        )
+        self.conversion_duration = registry.histogram(
+            "conversion_duration_seconds",
+            "Duration of conversions including the upload and the response",
+            settings.latency_buckets,
+            ["route"],
+        )
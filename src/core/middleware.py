@@ -0,0 +1,414 @@
+import asyncio
+import math
+import time
+import zlib
+from http.cookies import CookieError, SimpleCookie
+from typing import Dict, FrozenSet, Optional
+
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config.settings import (
+    CompressionSettings,
+    RequestLimitsSettings,
+)
+from src.core.database import RequestReads, request_reads
+from src.core.metrics import Gauge, HttpMetrics
+from src.core.responses import error_response
+
+# cookie with the time until which the reads of the client go to the primary database
+READ_YOUR_WRITES_COOKIE = "db_primary_until"
+
+# label of the requests matching no route and of the methods not listed
+UNMATCHED_ROUTE = "unmatched"
+OTHER_METHOD = "other"
+HTTP_METHODS: FrozenSet[str] = frozenset(
+    ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+)
+# number of request paths whose route is remembered, routes of further paths are matched on every request
+MAX_ROUTE_PATHS = 1000
+
+# content codings of the compressed responses with their zlib window bits, preferred in this order
+COMPRESSION_ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+class BodyTooLargeError(Exception):
+    """Raised when the received request body exceeds the limit of its path"""
+
+
+class _BodySizeLimiter:
+    """
+    Receive and send channels of a request counting the received body size.
+    Once the body exceeds the limit, receiving fails and the response of the application is replaced by `413`.
+    """
+
+    def __init__(
+        self, scope: Scope, receive: Receive, send: Send, max_body_size: int
+    ) -> None:
+        self.scope = scope
+        self._receive = receive
+        self._send = send
+        self.max_body_size = max_body_size
+        self.received = 0
+        self.exceeded = False
+        self.response_started = False
+
+    async def receive(self) -> Message:
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self.received += len(message.get("body", b""))
+            if self.received > self.max_body_size:
+                self.exceeded = True
+                # the error aborts parsing of the body, the response to the error is replaced
+                raise BodyTooLargeError("Request body is too large")
+        return message
+
+    async def send(self, message: Message) -> None:
+        if not self.exceeded:
+            if message["type"] == "http.response.start":
+                self.response_started = True
+            await self._send(message)
+        elif message["type"] == "http.response.start":
+            await self.reject()
+
+    async def reject(self) -> None:
+        self.response_started = True
+        response = error_response(
+            f"Request body is larger than {self.max_body_size} bytes",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        await response(self.scope, self._receive, self._send)
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware rejecting requests with bodies larger than the limit of their path with `413`.
+    Requests with too large `Content-Length` are rejected before their body is read,
+    other requests are rejected as soon as the received body exceeds the limit, so it is never fully buffered.
+    """
+
+    def __init__(self, app: ASGIApp, limits: RequestLimitsSettings) -> None:
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        max_body_size = None
+        if scope["type"] == "http":
+            max_body_size = self.limits.get_max_body_size(scope["path"])
+        if max_body_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = _BodySizeLimiter(scope, receive, send, max_body_size)
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_body_size:
+            await limiter.reject()
+            return
+
+        try:
+            await self.app(scope, limiter.receive, limiter.send)
+        except BodyTooLargeError:
+            if limiter.response_started:
+                raise
+            await limiter.reject()
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware sending the reads of a client to the primary database for a while after its writes,
+    so the client reads its writes even when the replicas lag behind.
+    Responses to requests which wrote to the database set a cookie with the end of the period.
+    """
+
+    def __init__(self, app: ASGIApp, window: float) -> None:
+        self.app = app
+        self.window = window
+
+    def _primary_until(self, scope: Scope) -> float:
+        cookies = SimpleCookie()
+        cookie_header = dict(scope["headers"]).get(b"cookie", b"")
+        try:
+            cookies.load(cookie_header.decode("latin-1"))
+            return float(cookies[READ_YOUR_WRITES_COOKIE].value)
+        except (CookieError, KeyError, ValueError):
+            return 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        reads = RequestReads(primary=self._primary_until(scope) > time.time())
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and reads.written:
+                cookie = SimpleCookie()
+                cookie[READ_YOUR_WRITES_COOKIE] = str(time.time() + self.window)
+                cookie[READ_YOUR_WRITES_COOKIE]["max-age"] = math.ceil(self.window)
+                cookie[READ_YOUR_WRITES_COOKIE]["path"] = "/"
+                cookie[READ_YOUR_WRITES_COOKIE]["httponly"] = True
+                cookie[READ_YOUR_WRITES_COOKIE]["samesite"] = "lax"
+                headers = MutableHeaders(scope=message)
+                headers.append("set-cookie", cookie.output(header="").strip())
+            await send(message)
+
+        token = request_reads.set(reads)
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            request_reads.reset(token)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Chooses the content coding of the response from the Accept-Encoding header of the request
+    :param accept_encoding: Accept-Encoding header value
+    :return: gzip or deflate, None when the client accepts neither
+    """
+    qualities: Dict[str, float] = {}
+    for coding in accept_encoding.lower().split(","):
+        name, _, parameters = coding.partition(";")
+        quality = 1.0
+        parameters = parameters.replace(" ", "")
+        if parameters.startswith("q="):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0
+        qualities[name.strip()] = quality
+
+    wildcard = qualities.get("*", 0)
+    encoding = max(
+        COMPRESSION_ENCODINGS, key=lambda name: qualities.get(name, wildcard)
+    )
+    return encoding if qualities.get(encoding, wildcard) > 0 else None
+
+
+class _Compressor:
+    """
+    Send channel of a request compressing the response body.
+    The start of the response is held back until its first body chunk shows whether the response is compressed.
+    Chunks of streamed responses are compressed as they are sent, the compressed data is flushed
+    once flush_size bytes are compressed since the last flush or flush_interval seconds have passed,
+    so small chunks share the compression and the flushing overhead.
+    """
+
+    def __init__(
+        self, send: Send, encoding: str, settings: CompressionSettings
+    ) -> None:
+        self._send = send
+        self.encoding = encoding
+        self.settings = settings
+        self.start: Optional[Message] = None
+        self.compressor: "Optional[zlib._Compress]" = None
+        # size of the body compressed since the last flush and the time of the last flush
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+
+    def _compressible(self, start: Message, body: bytes, more_body: bool) -> bool:
+        headers = Headers(raw=start["headers"])
+        if start["status"] in (204, 304) or "content-encoding" in headers:
+            return False
+        if not more_body:
+            return len(body) >= self.settings.minimum_size
+        content_length = headers.get("content-length", "")
+        return not content_length.isdigit() or (
+            int(content_length) >= self.settings.minimum_size
+        )
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        assert self.compressor is not None
+        data = self.compressor.compress(body)
+        if not more_body:
+            return data + self.compressor.flush(zlib.Z_FINISH)
+        self.pending += len(body)
+        now = time.monotonic()
+        if (
+            self.pending >= self.settings.flush_size
+            or now - self.flushed_at >= self.settings.flush_interval
+        ):
+            self.pending = 0
+            self.flushed_at = now
+            data += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    async def _start(self, start: Message, message: Message) -> None:
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._compressible(start, body, more_body):
+            self.compressor = zlib.compressobj(
+                self.settings.level,
+                zlib.DEFLATED,
+                COMPRESSION_ENCODINGS[self.encoding],
+            )
+            message = {**message, "body": self._compress(body, more_body)}
+            headers = MutableHeaders(raw=start["headers"])
+            headers["content-encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["content-length"]
+            else:
+                headers["content-length"] = str(len(message["body"]))
+            # the compressed body differs from the body the strong validator was computed from
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                headers["etag"] = f"W/{etag}"
+        await self._send(start)
+        await self._send(message)
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+        elif message["type"] == "http.response.body" and self.start is not None:
+            start, self.start = self.start, None
+            await self._start(start, message)
+        elif message["type"] == "http.response.body" and self.compressor is not None:
+            more_body = message.get("more_body", False)
+            body = self._compress(message.get("body", b""), more_body)
+            # the compressor buffers chunks until it is flushed
+            if body or not more_body:
+                await self._send({**message, "body": body})
+        else:
+            await self._send(message)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with gzip or deflate negotiated from the Accept-Encoding header.
+    Small responses, already encoded responses and responses without a body are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp, settings: CompressionSettings) -> None:
+        self.app = app
+        self.settings = settings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = None
+        if scope["type"] == "http":
+            encoding = negotiate_encoding(
+                Headers(scope=scope).get("accept-encoding", "")
+            )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        compressor = _Compressor(send, encoding, self.settings)
+        await self.app(scope, receive, compressor.send)
+
+
+class _RequestRecorder:
+    """Receive and send channels of a request recording its status code and the sizes of its body and response"""
+
+    def __init__(self, receive: Receive, send: Send) -> None:
+        self._receive = receive
+        self._send = send
+        # the status code of requests failing before their response is sent
+        self.status_code = 500
+        self.started = False
+        self.received = 0
+        self.sent = 0
+
+    async def receive(self) -> Message:
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self.received += len(message.get("body", b""))
+        return message
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.status_code = message["status"]
+            self.started = True
+        elif message["type"] == "http.response.body":
+            self.sent += len(message.get("body", b""))
+        await self._send(message)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency histograms, requests in progress and response status codes per route template.
+    Requests of the conversion routes are recorded with the sizes of their uploads and responses as well.
+    The metrics are updated by the event loop without locks and the routes of the request paths are remembered,
+    so the recording costs a few dictionary lookups per request.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: HttpMetrics) -> None:
+        self.app = app
+        self.metrics = metrics
+        self.routes: Dict[str, str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        path = scope["path"]
+        route = self.routes.get(path)
+        if route is not None:
+            return route
+        route = UNMATCHED_ROUTE
+        for candidate in scope["app"].routes:
+            match, _ = candidate.matches(scope)
+            if match != Match.NONE:
+                route = candidate.path
+                break
+        if len(self.routes) < MAX_ROUTE_PATHS:
+            self.routes[path] = route
+        return route
+
+    def _record_conversion(
+        self, route: str, recorder: _RequestRecorder, seconds: float
+    ) -> None:
+        if recorder.status_code >= 400:
+            return
+        self.metrics.conversion_input.labels(route).observe(recorder.received)
+        self.metrics.conversion_output.labels(route).observe(recorder.sent)
+        self.metrics.conversion_duration.labels(route).observe(seconds)
+
+    @staticmethod
+    async def _handle_error(
+        scope: Scope, recorder: _RequestRecorder, exc: Exception
+    ) -> None:
+        """
+        Sends the response of the catch-all exception handler of the application through the recorder.
+        The handler is run by ServerErrorMiddleware outside of this middleware, which then sends no response
+        of its own, as the response has started, and re-raises the exception to the server as before.
+        :param scope: scope of the request
+        :param recorder: channels of the request
+        :param exc: exception raised by the application
+        """
+        handlers = getattr(scope.get("app"), "exception_handlers", {})
+        handler = handlers.get(500) or handlers.get(Exception)
+        if handler is None or recorder.started:
+            return
+        request = Request(scope)
+        if asyncio.iscoroutinefunction(handler):
+            response = await handler(request, exc)
+        else:
+            response = await run_in_threadpool(handler, request, exc)
+        await response(scope, recorder.receive, recorder.send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in HTTP_METHODS else OTHER_METHOD
+        route = self._route(scope)
+        in_progress: Gauge = self.metrics.in_progress.labels(method, route)
+        recorder = _RequestRecorder(receive, send)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, recorder.receive, recorder.send)
+        except Exception as exc:
+            await self._handle_error(scope, recorder, exc)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            in_progress.dec()
+            self.metrics.duration.labels(method, route).observe(seconds)
+            self.metrics.responses.labels(
+                method, route, str(recorder.status_code)
+            ).inc()
+            if route in self.metrics.conversion_routes:
+                self._record_conversion(route, recorder, seconds)
@@ -0,0 +1,34 @@
+import base64
+import binascii
+import json
+from typing import Any, Dict
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor was not issued by the application"""
+
+
+def encode_cursor(last_row: Dict[str, Any]) -> str:
+    """
+    Encodes the key of the last returned row into an opaque pagination cursor
+    :param last_row: last row of the returned page
+    :return: URL-safe cursor of the next page
+    """
+    data = json.dumps({"email": last_row["email"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """
+    Decodes the pagination cursor into the key of the last returned row
+    :param cursor: cursor returned with the previous page
+    :return: email of the last user of the previous page
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        email = json.loads(data)["email"]
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if not isinstance(email, str):
+        raise InvalidCursorError("Invalid cursor")
+    return email
@@ -1,22 +1,155 @@
-from typing import Any, Optional
+import json
+from typing import Any, AnyStr, AsyncIterator, Callable, Dict, Optional
 
+import orjson
 from fastapi.encoders import jsonable_encoder
 from starlette import status
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
 
-def success_response(response_data: Optional[Any] = None) -> JSONResponse:
+def encode_json(data: Any) -> bytes:
+    """
+    Encodes the data to JSON the same way as `JSONResponse` does.
+    :param data: The data to be encoded.
+    :return: JSON encoded data.
+    """
+    return json.dumps(
+        data, ensure_ascii=False, allow_nan=True, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dump_json(data: Any) -> bytes:
+    """
+    Encodes the data to compact UTF-8 JSON with orjson.
+    Database rows and other native types are encoded directly, other objects (e.g. pydantic models) are converted
+    by `jsonable_encoder` when orjson reaches them. Data orjson cannot encode, e.g. integers above 64 bits
+    or non-string keys, is encoded by `encode_json`.
+    :param data: The data to be encoded.
+    :return: JSON encoded data.
+    """
+    try:
+        return orjson.dumps(data, default=jsonable_encoder)
+    except orjson.JSONEncodeError:
+        return encode_json(jsonable_encoder(data))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded by `dump_json`, the default response class of the application"""
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+def success_response(
+    response_data: Optional[Any] = None, **response_fields: Any
+) -> JSONResponse:
     """
     Returns a JSON response with the given status code and the given data.
     :param response_data: The data to be returned.
+    :param response_fields: Additional fields of the response, e.g. the pagination cursor.
     :return: A JSON response with the given status code and the given data.
     """
-    response_json = {"success": True}
+    response_json: Dict[str, Any] = {"success": True}
 
     if response_data is not None:
-        response_json["data"] = jsonable_encoder(response_data)
+        response_json["data"] = response_data
+    response_json.update(response_fields)
+
+    return FastJSONResponse(response_json, status_code=status.HTTP_200_OK)
+
+
+def success_raw_response(data_json: bytes) -> Response:
+    """
+    Returns a JSON response wrapping the already encoded JSON data into the success envelope.
+    :param data_json: JSON encoded data.
+    :return: A JSON response with the given data.
+    """
+    return Response(
+        b'{"success":true,"data":' + data_json + b"}",
+        media_type="application/json",
+        status_code=status.HTTP_200_OK,
+    )
+
+
+def ndjson_error_line(error: Exception) -> str:
+    """
+    Returns the NDJSON record ending a stream of records which failed after its response started.
+    :param error: The error of the stream.
+    :return: Error record in the error envelope.
+    """
+    return dump_json({"success": False, "errors": str(error)}).decode() + "\n"
+
+
+async def _abort_on_error(
+    first_chunk: AnyStr,
+    chunks: AsyncIterator[AnyStr],
+    error_chunk: Optional[Callable[[Exception], AnyStr]],
+) -> AsyncIterator[AnyStr]:
+    """
+    Yields the chunks of a started response. When producing a chunk fails, the error chunk is sent and the error
+    is raised again, so the server aborts the connection rather than completing the truncated body.
+    :param first_chunk: The chunk produced before the response started.
+    :param chunks: The following content chunks.
+    :param error_chunk: Returns the last chunk describing the error, nothing is sent when None.
+    :return: The same chunks.
+    """
+    yield first_chunk
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except Exception as e:
+        if error_chunk is not None:
+            yield error_chunk(e)
+        raise
+
+
+async def _success_envelope(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    yield '{"success":true,"data":'
+    async for chunk in chunks:
+        yield chunk
+    yield "}"
+
+
+async def success_stream_response(data_chunks: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Returns a streaming JSON response wrapping the given JSON text chunks into the success envelope.
+    The first chunk is produced eagerly, so errors at the start of the data are raised before the response starts.
+    Later errors abort the response, as the started JSON document cannot describe them.
+    :param data_chunks: JSON text chunks of the data.
+    :return: A streaming JSON response with the given data.
+    """
+    content = _success_envelope(data_chunks)
+    # the envelope prefix and the first chunk of the data
+    first_chunk = await content.__anext__() + await content.__anext__()
+
+    return StreamingResponse(
+        _abort_on_error(first_chunk, content, None),
+        media_type="application/json",
+        status_code=status.HTTP_200_OK,
+    )
+
+
+async def stream_response(
+    content: AsyncIterator[AnyStr],
+    media_type: str,
+    error_chunk: Optional[Callable[[Exception], AnyStr]] = None,
+) -> StreamingResponse:
+    """
+    Returns a streaming response with the given content chunks.
+    The first chunk is produced eagerly, so errors at the start of the content are raised before the response starts.
+    Later errors abort the response after the error chunk, e.g. the error record of NDJSON content.
+    :param content: The content chunks to be returned.
+    :param media_type: The media type of the content.
+    :param error_chunk: Returns the chunk describing an error of the started response.
+    :return: A streaming response with the given content.
+    """
+    first_chunk = await content.__anext__()
 
-    return JSONResponse(response_json, status_code=status.HTTP_200_OK)
+    return StreamingResponse(
+        _abort_on_error(first_chunk, content, error_chunk),
+        media_type=media_type,
+        status_code=status.HTTP_200_OK,
+    )
 
 
 def error_response(
@@ -29,8 +162,8 @@ def error_response(
     :param status_code: The status code of the response.
     :return: A JSON response with the given status code and the given errors.
     """
-    response_json = {"success": False}
+    response_json: Dict[str, Any] = {"success": False}
     if errors is not None:
-        response_json["errors"] = jsonable_encoder(errors)
+        response_json["errors"] = errors
 
-    return JSONResponse(response_json, status_code=status_code)
+    return FastJSONResponse(response_json, status_code=status_code)
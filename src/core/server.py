@@ -0,0 +1,182 @@
+import copy
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from functools import partial
+from multiprocessing.context import SpawnProcess
+from types import FrameType
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from uvicorn.main import STARTUP_FAILURE
+from uvicorn.subprocess import get_subprocess
+
+from src.config.settings import UvicornSettings
+
+logger = logging.getLogger("uvicorn.error")
+
+HANDLED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+# seconds between the checks of exited workers
+SUPERVISE_INTERVAL = 0.5
+
+
+def server_options(settings: UvicornSettings) -> Dict[str, Any]:
+    """
+    Returns the options of the uvicorn server of every worker
+    :param settings: uvicorn settings
+    :return: keyword arguments of `uvicorn.Config`
+    """
+    return {
+        "host": settings.host,
+        "port": settings.port,
+        "log_level": settings.log_level.value,
+        "reload": settings.reload,
+        "loop": settings.loop.value,
+        "http": settings.http.value,
+        "backlog": settings.backlog,
+        "timeout_keep_alive": settings.timeout_keep_alive,
+    }
+
+
+def bind_reuse_port(host: str, port: int) -> socket.socket:
+    """
+    Binds a socket to the address with SO_REUSEPORT, so the sockets of all the workers share the port
+    :param host: host of the server
+    :param port: port of the server
+    :return: bound socket, listening once the server is started on it
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family=family)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def _run_worker(
+    config: uvicorn.Config,
+    reuse_port: bool,
+    sockets: Optional[List[socket.socket]] = None,
+) -> None:
+    # the application is imported by the worker, so its startup opens the database pools of the worker
+    server = uvicorn.Server(config)
+    try:
+        if reuse_port:
+            sockets = [bind_reuse_port(config.host, config.port)]
+        server.run(sockets=sockets)
+    except (Exception, SystemExit):
+        # e.g. the application or the event loop cannot be imported, or the port is in use
+        if server.started:
+            raise
+        logger.exception("Worker failed to start")
+    if not server.started:
+        sys.exit(STARTUP_FAILURE)
+
+
+class WorkerSupervisor:
+    """
+    Process running the workers of the server and restarting the exited ones.
+    Workers exit after their max_requests requests and are replaced by new workers, the server is stopped
+    when a worker fails to start, e.g. as the database is unavailable.
+    On SIGINT or SIGTERM the workers are asked to finish their requests and are killed after graceful_timeout seconds.
+    """
+
+    def __init__(self, config: uvicorn.Config, settings: UvicornSettings) -> None:
+        self.config = config
+        self.settings = settings
+        self.sockets: List[socket.socket] = []
+        self.processes: List[SpawnProcess] = []
+        self.should_exit = threading.Event()
+        self.failed = False
+
+    def signal_handler(self, sig: int, frame: Optional[FrameType]) -> None:
+        self.should_exit.set()
+
+    def run(self) -> None:
+        """Run the workers until the supervisor is signalled to exit"""
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, self.signal_handler)
+        self.startup()
+        try:
+            while not self.should_exit.wait(SUPERVISE_INTERVAL):
+                self.restart_exited()
+        finally:
+            self.shutdown()
+        if self.failed:
+            sys.exit(STARTUP_FAILURE)
+
+    def startup(self) -> None:
+        """Bind the shared socket unless the workers bind their own and start the workers"""
+        if not self.settings.reuse_port:
+            self.sockets = [self.config.bind_socket()]
+        workers = self.settings.worker_count
+        logger.info(f"Started supervisor process [{os.getpid()}] of {workers} workers")
+        self.processes = [self._spawn() for _ in range(workers)]
+
+    def _spawn(self) -> SpawnProcess:
+        config = copy.copy(self.config)
+        if self.settings.max_requests is not None:
+            config.limit_max_requests = self.settings.max_requests + random.randint(
+                0, self.settings.max_requests_jitter
+            )
+        process = get_subprocess(
+            config=config,
+            target=partial(_run_worker, config, self.settings.reuse_port),
+            sockets=self.sockets,
+        )
+        process.start()
+        return process
+
+    def restart_exited(self) -> None:
+        """Replace the exited workers by new ones, unless one of them failed to start"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            if process.exitcode == STARTUP_FAILURE:
+                logger.error(
+                    f"Worker [{process.pid}] failed to start, stopping the server"
+                )
+                self.failed = True
+                self.should_exit.set()
+                return
+            logger.info(
+                f"Worker [{process.pid}] exited with code {process.exitcode}, restarting it"
+            )
+            process.close()
+            self.processes[index] = self._spawn()
+
+    def shutdown(self) -> None:
+        """Stop the workers, the ones not done within the graceful timeout are killed"""
+        for process in self.processes:
+            process.terminate()
+        deadline = time.monotonic() + self.settings.graceful_timeout
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(
+                    f"Worker [{process.pid}] did not stop in {self.settings.graceful_timeout} s, killing it"
+                )
+                process.kill()
+                process.join()
+        for sock in self.sockets:
+            sock.close()
+        logger.info(f"Stopping supervisor process [{os.getpid()}]")
+
+
+def serve(app: str, settings: UvicornSettings) -> None:
+    """
+    Runs the server of the application in the workers of a supervisor, or reloaded on changes of the sources
+    :param app: import string of the application, imported by every worker
+    :param settings: uvicorn settings
+    """
+    options = server_options(settings)
+    if settings.reload:
+        uvicorn.run(app, **options)
+        return
+    WorkerSupervisor(uvicorn.Config(app, **options), settings).run()
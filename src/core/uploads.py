@@ -0,0 +1,87 @@
+import io
+import json
+import mmap
+import os
+from contextlib import contextmanager
+from typing import IO, Any, Iterator, Optional, Union
+
+import orjson
+
+from src.config.annotations import JSONType
+
+
+@contextmanager
+def upload_buffer(file: IO[bytes]) -> Iterator[memoryview]:
+    """
+    Exposes the content of an uploaded file as a buffer without copying it.
+    In-memory files share their buffer, files spooled to disk are memory-mapped.
+    :param file: uploaded file, `SpooledTemporaryFile` of the upload or a `BytesIO`
+    :return: context manager of the buffer, the buffer is released on exit
+    """
+    # SpooledTemporaryFile keeps its content in a BytesIO until it is rolled over to a temporary file
+    raw_file: Any = getattr(file, "_file", file)
+    if isinstance(raw_file, io.BytesIO):
+        buffer = raw_file.getbuffer()
+        try:
+            yield buffer
+        finally:
+            buffer.release()
+        return
+
+    raw_file.flush()
+    size = raw_file.seek(0, io.SEEK_END)
+    raw_file.seek(0)
+    if not size:
+        # empty files cannot be memory-mapped
+        yield memoryview(b"")
+        return
+
+    with mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        buffer = memoryview(mapped)
+        try:
+            yield buffer
+        finally:
+            buffer.release()
+
+
+def spooled_file_path(file: IO[bytes]) -> Optional[str]:
+    """
+    Returns the path other processes open the uploaded file by once it is rolled over to disk.
+    The temporary file has no name, so it is opened through the file descriptor of this process in /proc,
+    which gives the other process its own file offset.
+    :param file: uploaded file, `SpooledTemporaryFile` of the upload or a `BytesIO`
+    :return: path of the file, None for in-memory files or on systems without /proc
+    """
+    raw_file: Any = getattr(file, "_file", file)
+    if isinstance(raw_file, io.BytesIO):
+        return None
+    raw_file.flush()
+    path = f"/proc/{os.getpid()}/fd/{raw_file.fileno()}"
+    return path if os.path.exists(path) else None
+
+
+def load_json(data: Union[bytes, str, memoryview]) -> JSONType:
+    """
+    Parses JSON document, buffers are parsed without copying them into bytes.
+    Documents with NaN or Infinity literals or with integers that do not fit 64 bits
+    are parsed by the standard library, so the accepted documents and their values are the same.
+    :param data: JSON document
+    :return: JSONType
+    """
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+def load_json_file(file: Union[str, IO[bytes]]) -> JSONType:
+    """
+    Parses uploaded JSON file without reading it into bytes.
+    :param file: uploaded file, or its path from `spooled_file_path`
+    :return: JSONType
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as fp:
+            return load_json_file(fp)
+    with upload_buffer(file) as buffer:
+        return load_json(buffer)
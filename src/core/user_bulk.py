@@ -0,0 +1,164 @@
+import time
+from typing import AsyncIterator, List, Tuple
+
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from src.config.annotations import JSONType
+from src.core.database import DatabaseConnection
+from src.core.uploads import load_json
+from src.schemas.models import User, UserBulkBatch, UserBulkResult
+
+# email, value and position of the user in the upserted document
+UserRow = Tuple[str, str, int]
+
+# the staging table is private to the transaction, positions let later duplicates of an email win
+_CREATE_STAGING = (
+    "CREATE TEMPORARY TABLE users_staging "
+    "(email VARCHAR NOT NULL, value VARCHAR, position BIGINT NOT NULL) ON COMMIT DROP"
+)
+_COPY_STAGING = "COPY users_staging (email, value, position) FROM STDIN"
+_UPSERT_STAGING = (
+    "INSERT INTO users (email, value) "
+    "SELECT DISTINCT ON (email) email, value FROM users_staging ORDER BY email, position DESC "
+    "ON CONFLICT (email) DO UPDATE SET value = EXCLUDED.value"
+)
+_TRUNCATE_STAGING = "TRUNCATE users_staging"
+
+
+class InvalidBulkUserError(ValueError):
+    """Raised when an item of the bulk upsert is not a valid user"""
+
+
+async def iter_json_items(items: List[JSONType]) -> AsyncIterator[JSONType]:
+    """
+    Iterates over the items of a parsed JSON array
+    :param items: items of the array
+    :return: async iterator of the items
+    """
+    for item in items:
+        yield item
+
+
+async def iter_ndjson_items(chunks: AsyncIterator[bytes]) -> AsyncIterator[JSONType]:
+    """
+    Parses newline-delimited JSON while its chunks are received, empty lines are skipped
+    :param chunks: chunks of the document, e.g. the request stream
+    :return: async iterator of the parsed lines
+    """
+    position = 0
+    buffer = b""
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _load_line(line, position)
+                position += 1
+    if buffer.strip():
+        yield _load_line(buffer, position)
+
+
+def _load_line(line: bytes, position: int) -> JSONType:
+    try:
+        return load_json(line)
+    except ValueError as e:
+        raise InvalidBulkUserError(f"User {position} is not valid JSON: {e}") from e
+
+
+def parse_user(item: JSONType, position: int) -> UserRow:
+    """
+    Validates the item of the bulk upsert the same way as the single user endpoints do
+    :param item: parsed item
+    :param position: position of the item in the document
+    :return: row of the staging table
+    """
+    try:
+        user = User.parse_obj(item)
+    except ValidationError as e:
+        error = e.errors()[0]
+        field = ".".join(map(str, error["loc"]))
+        raise InvalidBulkUserError(
+            f"User {position} is invalid: {field}: {error['msg']}"
+        ) from e
+    return user.email, user.value, position
+
+
+def parse_users(items: List[JSONType], first_position: int) -> List[UserRow]:
+    """
+    Validates the items of a batch
+    :param items: parsed items of the batch
+    :param first_position: position of the first item in the document
+    :return: rows of the staging table
+    """
+    return [parse_user(item, first_position + i) for i, item in enumerate(items)]
+
+
+async def iter_user_batches(
+    items: AsyncIterator[JSONType], batch_size: int
+) -> AsyncIterator[List[UserRow]]:
+    """
+    Groups the items into batches and validates them.
+    The validation of emails is slow, so the batches are validated in the threadpool to keep serving other requests.
+    :param items: parsed items of the document
+    :param batch_size: number of users in a batch
+    :return: async iterator of the batches
+    """
+    batch: List[JSONType] = []
+    position = 0
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield await run_in_threadpool(parse_users, batch, position)
+            position += len(batch)
+            batch = []
+    if batch:
+        yield await run_in_threadpool(parse_users, batch, position)
+
+
+def _throughput(count: int, started: float) -> Tuple[float, float]:
+    seconds = time.perf_counter() - started
+    return seconds, count / seconds if seconds else 0.0
+
+
+async def upsert_users(
+    db_connection: DatabaseConnection, batches: AsyncIterator[List[UserRow]]
+) -> UserBulkResult:
+    """
+    Upserts the users in one transaction, every batch is copied to a staging table and merged into `users`.
+    Nothing is committed when any of the users is invalid.
+    :param db_connection: DatabaseConnection object
+    :param batches: batches of the users
+    :return: numbers of the users and upsert throughput of the batches and of the whole upsert
+    """
+    started = time.perf_counter()
+    results: List[UserBulkBatch] = []
+    async with db_connection.transaction() as conn:
+        await conn.execute(_CREATE_STAGING)
+        async for batch in batches:
+            batch_started = time.perf_counter()
+            async with conn.cursor() as cursor:
+                async with cursor.copy(_COPY_STAGING) as copy:
+                    for row in batch:
+                        await copy.write_row(row)
+                await cursor.execute(_UPSERT_STAGING)
+                upserted = cursor.rowcount
+                await cursor.execute(_TRUNCATE_STAGING)
+            seconds, users_per_second = _throughput(len(batch), batch_started)
+            results.append(
+                UserBulkBatch(
+                    count=len(batch),
+                    upserted=upserted,
+                    seconds=seconds,
+                    users_per_second=users_per_second,
+                )
+            )
+
+    count = sum(result.count for result in results)
+    seconds, users_per_second = _throughput(count, started)
+    return UserBulkResult(
+        count=count,
+        upserted=sum(result.upserted for result in results),
+        seconds=seconds,
+        users_per_second=users_per_second,
+        batches=results,
+    )
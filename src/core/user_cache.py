@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from psycopg import AsyncConnection, Error, OperationalError, sql
+
+from src.config.settings import UserCacheSettings
+from src.core.database import DatabaseConnection, request_reads
+
+User = Optional[Dict[str, Any]]
+
+# payload of the notification invalidating all the users
+INVALIDATE_ALL = ""
+
+
+class UserCache:
+    """
+    Read-through cache of users keyed by email, including the emails of missing users.
+    Entries expire after the TTL and the least recently used entries are evicted once the cache is full.
+    Writes invalidate the entries of this worker and, when a notification channel is configured,
+    of the other workers through Postgres NOTIFY.
+    """
+
+    def __init__(
+        self, settings: UserCacheSettings, logger: Optional[logging.Logger] = None
+    ) -> None:
+        self.settings = settings
+        self.logger = logger or logging.getLogger("uvicorn.error")
+        self.entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        # incremented by every invalidation, so values loaded before it are not stored
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def get(self, email: str) -> Tuple[bool, User]:
+        """
+        Returns the cached user
+        :param email: email of the user
+        :return: whether the user is cached and the user, None for a missing user
+        """
+        entry = self.entries.get(email)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(email)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, email: str, user: User, version: int) -> None:
+        """
+        Stores the user unless the cache was invalidated since the user was loaded
+        :param email: email of the user
+        :param user: user, None for a missing user
+        :param version: version of the cache before the user was loaded
+        """
+        if not self.enabled or version != self.version:
+            return
+        self.entries[email] = (time.monotonic() + self.settings.ttl, user)
+        self.entries.move_to_end(email)
+        while len(self.entries) > self.settings.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def read_through(
+        self, email: str, load: Callable[[], Awaitable[User]]
+    ) -> User:
+        """
+        Returns the cached user, users missing in the cache are loaded and stored.
+        Requests reading their own writes from the primary skip the cached users, as those may be read
+        by other requests from a lagging replica, the users loaded from the primary are stored.
+        :param email: email of the user
+        :param load: coroutine function loading the user from the database
+        :return: user, None for a missing user
+        """
+        if not self.enabled:
+            return await load()
+        reads = request_reads.get()
+        if reads is None or not reads.primary:
+            cached, user = self.get(email)
+            if cached:
+                return user
+        version = self.version
+        user = await load()
+        self.put(email, user, version)
+        return user
+
+    def drop(self, emails: Optional[Sequence[str]] = None) -> None:
+        """
+        Removes the users from the cache of this worker
+        :param emails: emails of the users, all the users when None
+        """
+        self.version += 1
+        self.invalidations += 1
+        if emails is None:
+            self.entries.clear()
+            return
+        for email in emails:
+            self.entries.pop(email, None)
+
+    async def invalidate(
+        self,
+        db_connection: DatabaseConnection,
+        emails: Optional[Sequence[str]] = None,
+    ) -> None:
+        """
+        Removes the written users from the cache of this worker and notifies the other workers.
+        The users are already committed, so a failed notification is logged and the entries of the other
+        workers expire after the TTL.
+        :param db_connection: DatabaseConnection object
+        :param emails: emails of the written users, all the users when None
+        """
+        if not self.enabled:
+            return
+        self.drop(emails)
+        channel = self.settings.notify_channel
+        if channel is None:
+            return
+        try:
+            if emails is None:
+                await db_connection.execute(
+                    "SELECT pg_notify(%s, %s)", (channel, INVALIDATE_ALL)
+                )
+            elif emails:
+                await db_connection.execute(
+                    "SELECT pg_notify(%s, email) FROM unnest(%s::varchar[]) AS email",
+                    (channel, list(emails)),
+                )
+        except Error as e:
+            self.logger.warning(f"User cache invalidations are not sent: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the cache counters
+        :return: dictionary of the counters
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+        }
+
+
+class UserCacheListener:
+    """
+    Listens to the invalidations of the other workers on a dedicated connection.
+    The cache is cleared whenever the connection is (re)established, as notifications sent meanwhile are lost.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        cache: UserCache,
+        channel: str,
+        logger: logging.Logger,
+        retry_interval: float = 1,
+    ) -> None:
+        self.dsn = dsn
+        self.cache = cache
+        self.channel = channel
+        self.logger = logger
+        self.retry_interval = retry_interval
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        """Start listening in a background task"""
+        self.task = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        listen = sql.SQL("LISTEN {}").format(sql.Identifier(self.channel))
+        while True:
+            try:
+                conn = await AsyncConnection.connect(self.dsn, autocommit=True)
+                async with conn:
+                    await conn.execute(listen)
+                    self.cache.drop()
+                    async for notify in conn.notifies():
+                        if notify.payload == INVALIDATE_ALL:
+                            self.cache.drop()
+                        else:
+                            self.cache.drop([notify.payload])
+            except OperationalError as e:
+                self.logger.warning(f"User cache invalidations are not received: {e}")
+            # users written while the connection was lost may be cached
+            self.cache.drop()
+            await asyncio.sleep(self.retry_interval)
+
+    async def stop(self) -> None:
+        """Stop listening and close the connection"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import Any, Coroutine, Dict, Optional, Set
+
+from src.config.settings import UserWriteSettings
+from src.core.database import DatabaseConnection, record_write
+from src.core.user_cache import UserCache
+
+_UPSERT_USERS = (
+    "INSERT INTO users (email, value) SELECT * FROM unnest(%s::varchar[], %s::varchar[]) "
+    "ON CONFLICT (email) DO UPDATE SET value = EXCLUDED.value"
+)
+_DELETE_USERS = "DELETE FROM users WHERE email = ANY(%s)"
+
+
+class UserWriteBatch:
+    """Writes of users committed together, the last write of an email wins"""
+
+    def __init__(self) -> None:
+        # value of the upserted users, None for the deleted users
+        self.values: Dict[str, Optional[str]] = {}
+        self.operations = 0
+        self.committed: "asyncio.Future[None]" = (
+            asyncio.get_running_loop().create_future()
+        )
+
+
+class UserWriteCoalescer:
+    """
+    Write-behind queue of upserts and deletes of users.
+    Writes are collected for flush_interval seconds or until max_operations writes and committed in one transaction,
+    with one multi-row statement for the upserts and one for the deletes. Writers wait until their batch is committed,
+    so a write is acknowledged only once it is durable. Batches are committed one by one in their order.
+    """
+
+    def __init__(
+        self,
+        db_connection: DatabaseConnection,
+        user_cache: UserCache,
+        settings: UserWriteSettings,
+        logger: Optional[logging.Logger] = None,
+    ) -> None:
+        self.db_connection = db_connection
+        self.user_cache = user_cache
+        self.settings = settings
+        self.logger = logger or logging.getLogger("uvicorn.error")
+        self.batch: Optional[UserWriteBatch] = None
+        self.lock = asyncio.Lock()
+        self.tasks: Set["asyncio.Task[None]"] = set()
+
+    async def upsert(self, email: str, value: str) -> None:
+        """
+        Upserts the user once its batch is committed
+        :param email: email of the user
+        :param value: value of the user
+        """
+        await self._write(email, value)
+
+    async def delete(self, email: str) -> None:
+        """
+        Deletes the user once its batch is committed
+        :param email: email of the user
+        """
+        await self._write(email, None)
+
+    async def _write(self, email: str, value: Optional[str]) -> None:
+        # the write is sent to the primary on behalf of the request
+        record_write()
+        if self.batch is None:
+            self.batch = UserWriteBatch()
+            self._spawn(self._flush_later(self.batch))
+        batch = self.batch
+        batch.values[email] = value
+        batch.operations += 1
+        if batch.operations >= self.settings.max_operations:
+            self.batch = None
+            self._spawn(self._flush(batch))
+        # the batch is committed even when the request is cancelled
+        await asyncio.shield(batch.committed)
+
+    def _spawn(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _flush_later(self, batch: UserWriteBatch) -> None:
+        await asyncio.sleep(self.settings.flush_interval)
+        # the batch is flushed already when it was filled before the interval elapsed
+        if self.batch is batch:
+            self.batch = None
+            await self._flush(batch)
+
+    async def _flush(self, batch: UserWriteBatch) -> None:
+        async with self.lock:
+            try:
+                await self._commit(batch.values)
+                await self.user_cache.invalidate(self.db_connection, list(batch.values))
+            except Exception as e:
+                self.logger.error(f"Writes of {len(batch.values)} users failed: {e}")
+                batch.committed.set_exception(e)
+            else:
+                batch.committed.set_result(None)
+
+    async def _commit(self, values: Dict[str, Optional[str]]) -> None:
+        upserts = {email: value for email, value in values.items() if value is not None}
+        deletes = [email for email, value in values.items() if value is None]
+        async with self.db_connection.transaction() as conn:
+            if upserts:
+                await conn.execute(
+                    _UPSERT_USERS, (list(upserts), list(upserts.values()))
+                )
+            if deletes:
+                await conn.execute(_DELETE_USERS, (deletes,))
+
+    async def close(self) -> None:
+        """Commit the pending writes and wait for the running flushes"""
+        batch, self.batch = self.batch, None
+        if batch is not None:
+            await self._flush(batch)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
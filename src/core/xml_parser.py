@@ -1,11 +1,26 @@
 import json
+import math
+import sys
 from enum import Enum
-from typing import Any, Dict, Optional, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from lxml import etree
-from lxml.etree import _Element, parse
+from lxml.etree import _Element, iterparse, parse
 
 from src.config.annotations import JSONType
+from src.core.uploads import load_json, load_json_file
 
 
 class XMLElementType(str, Enum):
@@ -46,27 +61,327 @@ class XMLElementType(str, Enum):
             raise ValueError(f"Unsupported type: {type(value)}")
 
     def parse_element_value(self, value: Optional[str]) -> Any:
-        # element value validation check
-        if value is None:
-            if self is XMLElementType.NULL:
-                return None
-            elif self is XMLElementType.OBJECT:
-                # edge case -> when json looks like {}, we do not want to return "null", but <item type="object"/>
-                return {}
-            else:
+        return _LEAF_DECODERS[self.value](value)
+
+
+def _decode_string(value: Optional[str]) -> str:
+    if value is None:
+        raise ValueError("Invalid XML file schema")
+    return value
+
+
+def _decode_integer(value: Optional[str]) -> int:
+    if value is None:
+        raise ValueError("Invalid XML file schema")
+    return int(value)
+
+
+def _decode_float(value: Optional[str]) -> float:
+    if value is None:
+        raise ValueError("Invalid XML file schema")
+    return float(value)
+
+
+def _decode_boolean(value: Optional[str]) -> bool:
+    if value is None:
+        raise ValueError("Invalid XML file schema")
+    return value == "true"
+
+
+def _decode_null(value: Optional[str]) -> None:
+    if value is not None:
+        raise NotImplementedError("Etree element type not supported: null")
+    return None
+
+
+def _decode_object(value: Optional[str]) -> Dict[str, JSONType]:
+    if value is not None:
+        raise NotImplementedError("Etree element type not supported: object")
+    # edge case -> when json looks like {}, we do not want to return "null", but <item type="object"/>
+    return {}
+
+
+def _decode_list(value: Optional[str]) -> List[JSONType]:
+    if value is not None:
+        raise NotImplementedError("Etree element type not supported: list")
+    raise ValueError("Invalid XML file schema")
+
+
+# leaf value decoders keyed by the raw `type` attribute of ITEM elements
+_LEAF_DECODERS: Dict[Optional[str], Callable[[Optional[str]], Any]] = {
+    XMLElementType.STRING.value: _decode_string,
+    XMLElementType.INTEGER.value: _decode_integer,
+    XMLElementType.FLOAT.value: _decode_float,
+    XMLElementType.BOOLEAN.value: _decode_boolean,
+    XMLElementType.NULL.value: _decode_null,
+    XMLElementType.OBJECT.value: _decode_object,
+    XMLElementType.LIST.value: _decode_list,
+}
+_CONTAINER_TYPES = frozenset((XMLElementType.OBJECT.value, XMLElementType.LIST.value))
+
+
+def _decode_leaf(item_type: Optional[str], value: Optional[str]) -> Any:
+    """
+    Decodes value of an ITEM element without children.
+    :param item_type: raw `type` attribute of the element
+    :param value: raw `value` attribute of the element
+    :return: decoded value
+    """
+    decoder = _LEAF_DECODERS.get(item_type)
+    if decoder is None:
+        raise ValueError(f"{item_type!r} is not a valid XMLElementType")
+    return decoder(value)
+
+
+# JSON string encoder of `json.dumps` with ensure_ascii=False
+_encode_json_string: Callable[[str], str] = json.encoder.encode_basestring
+
+
+def _encode_string(value: Optional[str]) -> str:
+    return _encode_json_string(_decode_string(value))
+
+
+def _encode_integer(value: Optional[str]) -> str:
+    return str(_decode_integer(value))
+
+
+def _encode_float(value: Optional[str]) -> str:
+    number = _decode_float(value)
+    # special values are written the same way as `json.dumps` does
+    if number != number:
+        return "NaN"
+    if number in (math.inf, -math.inf):
+        return "Infinity" if number > 0 else "-Infinity"
+    return repr(number)
+
+
+def _encode_boolean(value: Optional[str]) -> str:
+    return "true" if _decode_boolean(value) else "false"
+
+
+def _encode_null(value: Optional[str]) -> str:
+    _decode_null(value)
+    return "null"
+
+
+def _encode_object(value: Optional[str]) -> str:
+    _decode_object(value)
+    return "{}"
+
+
+def _encode_list(value: Optional[str]) -> str:
+    _decode_list(value)
+    return "[]"
+
+
+# leaf JSON text encoders keyed by the raw `type` attribute of ITEM elements,
+# they produce the same text as `json.dumps` of the decoded values
+_LEAF_ENCODERS: Dict[Optional[str], Callable[[Optional[str]], str]] = {
+    XMLElementType.STRING.value: _encode_string,
+    XMLElementType.INTEGER.value: _encode_integer,
+    XMLElementType.FLOAT.value: _encode_float,
+    XMLElementType.BOOLEAN.value: _encode_boolean,
+    XMLElementType.NULL.value: _encode_null,
+    XMLElementType.OBJECT.value: _encode_object,
+    XMLElementType.LIST.value: _encode_list,
+}
+
+
+def _encode_leaf(item_type: Optional[str], value: Optional[str]) -> str:
+    """
+    Encodes value of an ITEM element without children to JSON text.
+    :param item_type: raw `type` attribute of the element
+    :param value: raw `value` attribute of the element
+    :return: JSON text
+    """
+    encoder = _LEAF_ENCODERS.get(item_type)
+    if encoder is None:
+        raise ValueError(f"{item_type!r} is not a valid XMLElementType")
+    return encoder(value)
+
+
+_JSONContainer = Union[List[JSONType], Dict[str, JSONType]]
+# open containers with their elements and iterators over their remaining children,
+# the elements are kept on the stack, so lxml does not have to look for their ancestors when freeing children
+_EtreeStack = List[Tuple[_Element, Iterator[_Element], _JSONContainer]]
+
+
+def _max_depth_error(max_depth: int) -> ValueError:
+    """
+    Returns the error raised when a document is nested deeper than allowed.
+    :param max_depth: maximal nesting depth
+    :return: ValueError
+    """
+    return ValueError(f"Maximal nesting depth of {max_depth} exceeded")
+
+
+class _StreamFrame:
+    """
+    State of an open ITEM element while streaming XML to JSON.
+    """
+
+    __slots__ = ("prefix", "key", "item_type", "value", "container", "count", "leaf")
+
+    def __init__(
+        self,
+        prefix: str,
+        key: Optional[str],
+        item_type: Optional[str],
+        value: Optional[str],
+        leaf: bool,
+    ) -> None:
+        self.prefix = prefix
+        self.key = key
+        self.item_type = item_type
+        self.value = value
+        # None until the first child is seen, then "[" for lists and "{" for objects
+        self.container: Optional[str] = None
+        self.count = 0
+        # object members that are not an object nor a list are leaves, their children are ignored
+        self.leaf = leaf
+
+
+class _ChunkWriter:
+    """
+    File-like sink collecting bytes written by `etree.xmlfile`.
+    """
+
+    __slots__ = ("chunks", "size")
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+
+class _JSONTarget:
+    """
+    lxml parser target writing JSON text chunks of the parsed ITEM elements.
+    """
+
+    __slots__ = ("stack", "chunks", "size", "depth_limit", "ignored")
+
+    def __init__(self, depth_limit: int) -> None:
+        self.stack: List[_StreamFrame] = []
+        self.chunks: List[str] = []
+        # length of the JSON text written since the last close
+        self.size = 0
+        self.depth_limit = depth_limit
+        # depth of the currently ignored children of a leaf
+        self.ignored = 0
+
+    def start(self, tag: str, attrib: Mapping[str, str]) -> None:
+        stack = self.stack
+        if self.ignored or (stack and stack[-1].leaf):
+            self.ignored += 1
+            return
+
+        key = attrib.get("key")
+        item_type = attrib.get("type")
+        prefix = ""
+        if stack:
+            if len(stack) >= self.depth_limit:
+                raise _max_depth_error(self.depth_limit)
+
+            parent = stack[-1]
+            # the first child decides whether the parent is a list or an object
+            if parent.container is None:
+                parent.container = "[" if key is None else "{"
+                self.write(parent.prefix + parent.container)
+            elif (parent.container == "[") != (key is None):
                 raise ValueError("Invalid XML file schema")
 
-        # element type validation check
-        if self is XMLElementType.STRING:
-            return value
-        elif self is XMLElementType.INTEGER:
-            return int(value)
-        elif self is XMLElementType.FLOAT:
-            return float(value)
-        elif self is XMLElementType.BOOLEAN:
-            return value == "true"
+            if parent.count:
+                prefix = ","
+            if key is not None:
+                prefix += _encode_json_string(key) + ":"
+            parent.count += 1
+
+        leaf = bool(stack) and key is not None and item_type not in _CONTAINER_TYPES
+        stack.append(_StreamFrame(prefix, key, item_type, attrib.get("value"), leaf))
+
+    def end(self, tag: str) -> None:
+        if self.ignored:
+            self.ignored -= 1
+            return
+
+        frame = self.stack.pop()
+        if frame.container is not None:
+            self.write("]" if frame.container == "[" else "}")
+            return
+
+        leaf_json = _encode_leaf(frame.item_type, frame.value)
+        # keyed root leaf is returned together with its key
+        if not self.stack and frame.key is not None:
+            self.write(f"{{{_encode_json_string(frame.key)}:{leaf_json}}}")
         else:
-            raise NotImplementedError(f"Etree element type not supported: {self.value}")
+            self.write(frame.prefix + leaf_json)
+
+    def write(self, text: str) -> None:
+        self.chunks.append(text)
+        self.size += len(text)
+
+    def flushable(self) -> bool:
+        """
+        Returns whether the text written so far may be yielded as a chunk.
+        :return: True, JSON text may be split anywhere
+        """
+        return True
+
+    def close(self) -> str:
+        """
+        Returns the JSON text written since the last call.
+        :return: JSON text
+        """
+        json_text = "".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return json_text
+
+
+class _NDJSONTarget(_JSONTarget):
+    """
+    lxml parser target writing the items of the top-level list as JSON lines.
+    """
+
+    __slots__ = ()
+
+    def start(self, tag: str, attrib: Mapping[str, str]) -> None:
+        if len(self.stack) == 1:
+            if attrib.get("key") is not None:
+                raise ValueError("NDJSON output requires a top-level list")
+            # the list itself is not written and its items are not separated by commas
+            root = self.stack[0]
+            root.container = "["
+            root.count = 0
+        super().start(tag, attrib)
+
+    def end(self, tag: str) -> None:
+        if not self.ignored and len(self.stack) == 1:
+            if self.stack.pop().container is None:
+                raise ValueError("NDJSON output requires a top-level list")
+            return
+
+        item_finished = not self.ignored and len(self.stack) == 2
+        super().end(tag)
+        if item_finished:
+            self.write("\n")
+
+    def flushable(self) -> bool:
+        """
+        Returns whether the text written so far may be yielded as a chunk.
+        :return: whether no item is open, so chunks consist of whole lines
+        """
+        return len(self.stack) <= 1
 
 
 class XMLParser:
@@ -83,113 +398,389 @@ class XMLParser:
         :param element: lxml ElementTree
         :return: value of :param element
         """
-        element_type = XMLElementType(element.get("type"))
-        element_value = element.get("value")
+        return _decode_leaf(element.get("type"), element.get("value"))
+
+    @staticmethod
+    def _open_container(
+        node: _Element, stack: _EtreeStack, depth_limit: int
+    ) -> _JSONContainer:
+        """
+        Returns an empty container for the children of the node and pushes it to the stack.
+        :param node: etree node with children
+        :param stack: stack of open containers
+        :param depth_limit: maximal nesting depth of the elements
+        :return: empty list if the first child is key-less, empty dictionary otherwise
+        """
+        # the first child decides whether the node is a list or an object, the other children are checked when filled
+        container: _JSONContainer = [] if node[0].get("key") is None else {}
+        stack.append((node, node.iterchildren(), container))
+        if len(stack) >= depth_limit:
+            raise _max_depth_error(depth_limit)
+        return container
+
+    @staticmethod
+    def _fill_list(
+        children: Iterator[_Element],
+        container: List[JSONType],
+        stack: _EtreeStack,
+        depth_limit: int,
+    ) -> bool:
+        """
+        Appends values of the remaining key-less children to the list until a child container is opened.
+        :param children: iterator over the remaining children
+        :param container: list of the children values
+        :param stack: stack of open containers
+        :param depth_limit: maximal nesting depth of the elements
+        :return: True if a child container was opened, False if all children were converted
+        """
+        for child in children:
+            if child.get("key") is not None:
+                raise ValueError("Invalid XML file schema")
+
+            if len(child):
+                container.append(XMLParser._open_container(child, stack, depth_limit))
+                return True
+            container.append(_decode_leaf(child.get("type"), child.get("value")))
+
+        return False
+
+    @staticmethod
+    def _fill_dict(
+        children: Iterator[_Element],
+        container: Dict[str, JSONType],
+        stack: _EtreeStack,
+        depth_limit: int,
+    ) -> bool:
+        """
+        Assigns values of the remaining keyed children to the dictionary until a child container is opened.
+        :param children: iterator over the remaining children
+        :param container: dictionary of the children values
+        :param stack: stack of open containers
+        :param depth_limit: maximal nesting depth of the elements
+        :return: True if a child container was opened, False if all children were converted
+        """
+        for child in children:
+            child_key = child.get("key")
+            if child_key is None:
+                raise ValueError("Invalid XML file schema")
 
-        return element_type.parse_element_value(element_value)
+            # children of elements that are not an object nor a list are ignored
+            child_type = child.get("type")
+            if child_type in _CONTAINER_TYPES and len(child):
+                container[child_key] = XMLParser._open_container(
+                    child, stack, depth_limit
+                )
+                return True
+            container[child_key] = _decode_leaf(child_type, child.get("value"))
+
+        return False
 
     @staticmethod
-    def _parse_etree_to_json_type(node: _Element) -> JSONType:
+    def _parse_etree_to_json_type(
+        node: _Element, max_depth: Optional[int] = None
+    ) -> JSONType:
         """
         Converts lxml.etree.ElementTree to a :type JSONType.
+        Nested elements are converted with an explicit stack, so the nesting depth is limited only by :param max_depth.
+        Children are classified and converted in a single pass.
         :param node: etree node
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
         :return: JSONType
         """
+        depth_limit = max_depth if max_depth is not None else sys.maxsize
 
         # if the node is leaf, then return the value of the node with/without its key
-        if not node.getchildren():  # type: ignore
+        if not len(node):
             node_key = node.get("key")
             if node_key is None:
                 return XMLParser._parse_etree_node_leaf(node)
             else:
                 return {node_key: XMLParser._parse_etree_node_leaf(node)}
 
-        # if all children are key-less, then return a list of children
-        if all(map(lambda child: child.get("key") is None, node.iterchildren())):
-            return [
-                XMLParser._parse_etree_to_json_type(child)
-                for child in node.iterchildren()
-            ]
-
-        # if all children have keys, then return a dictionary of children
-        else:
-            result: Dict[str, JSONType] = {}
-            for children in node.iterchildren():
-                children_key = children.get("key")
-                children_type = XMLElementType(children.get("type"))
+        stack: _EtreeStack = []
+        result = XMLParser._open_container(node, stack, depth_limit)
 
-                if children_key is None:
-                    raise ValueError("Invalid XML file schema")
+        while stack:
+            _, children, container = stack[-1]
+            if isinstance(container, list):
+                opened = XMLParser._fill_list(children, container, stack, depth_limit)
+            else:
+                opened = XMLParser._fill_dict(children, container, stack, depth_limit)
 
-                if children_type in [XMLElementType.OBJECT, XMLElementType.LIST]:
-                    result[children_key] = XMLParser._parse_etree_to_json_type(children)
+            # the container is complete when no child container was opened
+            if not opened:
+                stack.pop()
 
-                # if the element is not an object nor a list, then return the value of the element
-                else:
-                    result[children_key] = XMLParser._parse_etree_node_leaf(children)
+        return result
 
-            return result
+    @staticmethod
+    def _iter_json_children(
+        data: JSONType,
+    ) -> Iterator[Tuple[Optional[str], JSONType]]:
+        """
+        Returns an iterator over (key, value) children of a JSON object or list.
+        :param data: JSON object or list
+        :return: iterator of (key, value) pairs, keys of list items are None
+        """
+        if isinstance(data, dict):
+            return iter(data.items())
+        return ((None, item) for item in data)  # type: ignore
 
     @staticmethod
-    def _parse_json_data_to_etree(data: JSONType) -> _Element:
+    def _parse_json_data_to_etree(
+        data: JSONType, max_depth: Optional[int] = None
+    ) -> _Element:
         """
         Converts a :type JSONType to lxml.etree.ElementTree.
+        Nested values are converted with an explicit stack, so the nesting depth is limited only by :param max_depth.
         :param data: JSONType data
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
         :return: lxml.etree.ElementTree
         """
+        depth_limit = max_depth if max_depth is not None else sys.maxsize
+        element = etree.Element("ITEM", XMLParser._item_attrib(data, None))
+
+        # open containers with iterators over their remaining children
+        stack: List[Tuple[Iterator[Tuple[Optional[str], JSONType]], _Element]] = []
+        if isinstance(data, (dict, list)) and data:
+            stack.append((XMLParser._iter_json_children(data), element))
+
+        while stack:
+            children, parent = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                continue
+            if len(stack) >= depth_limit:
+                raise _max_depth_error(depth_limit)
+
+            key, value = child
+            child_element = etree.SubElement(
+                parent, "ITEM", XMLParser._item_attrib(value, key)
+            )
+            # if the element is a non-empty object or list, then its children are appended next
+            if isinstance(value, (dict, list)) and value:
+                stack.append((XMLParser._iter_json_children(value), child_element))
+
+        return element
+
+    @staticmethod
+    def parse_xml_from_file(file: Any, max_depth: Optional[int] = None) -> JSONType:
+        """
+        Parses XML file to JSONType object
+        :param file: XML file path or file object
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :return: JSONType
+        """
+        xml_parsed = parse(file, etree.XMLParser(huge_tree=True))
+        return XMLParser._parse_etree_to_json_type(
+            node=xml_parsed.getroot(), max_depth=max_depth
+        )
+
+    @staticmethod
+    def iter_json_from_file(
+        file: Any, *, max_depth: Optional[int] = None, chunk_size: int = 64 * 1024
+    ) -> Iterator[str]:
+        """
+        Incrementally converts XML file to JSON text chunks.
+        Finished elements are cleared while parsing, so memory does not grow with the document size.
+        :param file: XML file path or file object
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :param chunk_size: minimal length of the yielded chunks, except the last one
+        :return: iterator of JSON text chunks
+        """
+        depth_limit = max_depth if max_depth is not None else sys.maxsize
+        return XMLParser._iter_target_chunks(file, _JSONTarget(depth_limit), chunk_size)
+
+    @staticmethod
+    def iter_ndjson_from_file(
+        file: Any, *, max_depth: Optional[int] = None, chunk_size: int = 64 * 1024
+    ) -> Iterator[str]:
+        """
+        Incrementally converts XML file with a top-level list to NDJSON text chunks of whole lines,
+        one line per list item, so an error line can follow any chunk.
+        :param file: XML file path or file object
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :param chunk_size: minimal length of the yielded chunks, except the last one
+        :return: iterator of NDJSON text chunks
+        """
+        depth_limit = max_depth if max_depth is not None else sys.maxsize
+        return XMLParser._iter_target_chunks(
+            file, _NDJSONTarget(depth_limit), chunk_size
+        )
+
+    @staticmethod
+    def _iter_target_chunks(
+        file: Any, target: _JSONTarget, chunk_size: int
+    ) -> Iterator[str]:
+        """
+        Feeds the parse events of XML file to the target and yields its text chunks.
+        Finished elements are cleared while parsing, so memory does not grow with the document size.
+        :param file: XML file path or file object
+        :param target: parser target writing the text chunks
+        :param chunk_size: minimal length of the yielded chunks, except the last one
+        :return: iterator of text chunks
+        """
+        for event, element in iterparse(file, events=("start", "end"), huge_tree=True):
+            if event == "start":
+                target.start(element.tag, element.attrib)
+            else:
+                target.end(element.tag)
+                # drop the finished element and its already processed siblings,
+                # the root element has no parent but may follow comments or processing instructions
+                element.clear()
+                parent = element.getparent()
+                if parent is not None:
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+            if target.size >= chunk_size and target.flushable():
+                yield target.close()
+
+        if target.size:
+            yield target.close()
+
+    @staticmethod
+    def convert_xml_to_json(file: Any, max_depth: Optional[int] = None) -> bytes:
+        """
+        Converts XML file to UTF-8 encoded JSON text.
+        JSON is written directly from the parse events, neither the element tree nor JSONType objects are built.
+        :param file: XML file path or file object
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :return: JSON document
+        """
+        depth_limit = max_depth if max_depth is not None else sys.maxsize
+        parser = etree.XMLParser(target=_JSONTarget(depth_limit), huge_tree=True)
+        json_text: str = parse(file, parser)
+        return json_text.encode("utf-8")
+
+    @staticmethod
+    def _item_attrib(data: JSONType, key: Optional[str]) -> Dict[str, str]:
+        """
+        Returns attributes of the ITEM element representing the given value.
+        :param data: JSONType data
+        :param key: key of the value in its parent object
+        :return: ITEM element attributes
+        """
         element_type = XMLElementType.from_value(data)
-        element = etree.Element("ITEM", attrib={"type": element_type.value})
-        element_value: Optional[str] = None
-
-        # Set element children and value based on the type of the item
-        # if the element is an object, then assign children to element keys recursively
-        if element_type is XMLElementType.OBJECT:
-            for key, value in data.items():  # type: ignore
-                child = XMLParser._parse_json_data_to_etree(value)
-                child.set("key", key)
-                element.append(child)
-        # if the element is a list, then append children to element
-        elif element_type is XMLElementType.LIST:
-            for value in data:  # type: ignore
-                child = XMLParser._parse_json_data_to_etree(value)
-                element.append(child)
-        # if the element type is a string leaf, then set the value of the element
-        elif element_type is XMLElementType.STRING:
-            element_value = data  # type: ignore
-        # if the element type is a leaf and not a string, then set the json-dumped value of the element
+        attrib = {"type": element_type.value}
+
+        if element_type is XMLElementType.STRING:
+            attrib["value"] = data  # type: ignore
         elif element_type in [
             XMLElementType.INTEGER,
             XMLElementType.FLOAT,
             XMLElementType.BOOLEAN,
         ]:
-            element_value = json.dumps(data)
-        # if the element type is null, then do not set the value of the element
-        elif element_type is XMLElementType.NULL:
-            pass
-        # if the element type is not one of above type, then raise an error
-        else:
-            raise NotImplementedError("Unsupported type for parsing")
+            attrib["value"] = json.dumps(data)
 
-        if element_value is not None:
-            element.set("value", element_value)
+        if key is not None:
+            attrib["key"] = key
+        return attrib
 
-        return element
+    @staticmethod
+    def iter_xml_from_json(
+        data: JSONType, *, max_depth: Optional[int] = None, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """
+        Incrementally serializes a :type JSONType to XML bytes without building the element tree.
+        The output is equal to `etree.tostring` of the element returned by `parse_xml_from_json`.
+        :param data: JSONType data
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :param chunk_size: minimal size of the yielded chunks
+        :return: iterator of XML byte chunks
+        """
+        depth_limit = max_depth if max_depth is not None else sys.maxsize
+        writer = _ChunkWriter()
+        # open container elements with iterators over their remaining (key, value) children
+        stack: List[
+            Tuple[Iterator[Tuple[Optional[str], JSONType]], ContextManager[Any]]
+        ] = []
+
+        with etree.xmlfile(writer, encoding="utf-8") as xml_file:
+            children: Iterator[Tuple[Optional[str], JSONType]] = iter([(None, data)])
+            while True:
+                child = next(children, None)
+                if child is None:
+                    if not stack:
+                        break
+                    children, element = stack.pop()
+                    element.__exit__(None, None, None)
+                    continue
+                if len(stack) >= depth_limit:
+                    raise _max_depth_error(depth_limit)
+
+                key, value = child
+                attrib = XMLParser._item_attrib(value, key)
+                # non-empty containers are written incrementally, everything else as a single element
+                if isinstance(value, (dict, list)) and value:
+                    element = xml_file.element("ITEM", attrib)
+                    element.__enter__()
+                    stack.append((children, element))
+                    children = XMLParser._iter_json_children(value)
+                else:
+                    xml_file.write(etree.Element("ITEM", attrib))
+
+                if writer.size >= chunk_size:
+                    yield writer.pop()
+
+        if writer.size:
+            yield writer.pop()
 
     @staticmethod
-    def parse_xml_from_file(file: Any) -> JSONType:
+    def iter_xml_from_json_file(
+        file: Union[str, IO[bytes]],
+        *,
+        max_depth: Optional[int] = None,
+        chunk_size: int = 64 * 1024,
+    ) -> Iterator[bytes]:
         """
-        Parses XML file to JSONType object
-        :param file:
-        :return:
+        Incrementally serializes uploaded JSON file to XML bytes, the file is parsed by the first iteration
+        :param file: uploaded JSON file or its path
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :param chunk_size: minimal size of the yielded chunks
+        :return: iterator of XML byte chunks
         """
-        xml_parsed = parse(file)
-        return XMLParser._parse_etree_to_json_type(node=xml_parsed.getroot())
+        yield from XMLParser.iter_xml_from_json(
+            load_json_file(file), max_depth=max_depth, chunk_size=chunk_size
+        )
 
     @staticmethod
-    def parse_xml_from_json(data: JSONType) -> _Element:
+    def parse_xml_from_json(
+        data: JSONType, max_depth: Optional[int] = None
+    ) -> _Element:
         """
         Parses JSON string to JSONType object
         :param data: JSONType data
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
         :return: etree.Element
         """
-        return XMLParser._parse_json_data_to_etree(data)
+        return XMLParser._parse_json_data_to_etree(data, max_depth=max_depth)
+
+    @staticmethod
+    def convert_json_to_xml(
+        data: Union[bytes, str, memoryview], max_depth: Optional[int] = None
+    ) -> bytes:
+        """
+        Converts JSON document to XML document
+        :param data: JSON document
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :return: XML document
+        """
+        return b"".join(
+            XMLParser.iter_xml_from_json(load_json(data), max_depth=max_depth)
+        )
+
+    @staticmethod
+    def convert_json_file_to_xml(
+        file: Union[str, IO[bytes]], max_depth: Optional[int] = None
+    ) -> bytes:
+        """
+        Converts uploaded JSON file to XML document, the file is parsed without reading it into bytes
+        :param file: uploaded JSON file or its path
+        :param max_depth: maximal nesting depth of the elements, unlimited when None
+        :return: XML document
+        """
+        return b"".join(
+            XMLParser.iter_xml_from_json(load_json_file(file), max_depth=max_depth)
+        )
@@ -1,27 +1,69 @@
 import logging
+from typing import Union
 
-import uvicorn
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
+from psycopg_pool import PoolTimeout, TooManyRequests
 from starlette import status
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 
 from src.config.settings import get_settings
+from src.core.cache import ConversionCache
 from src.core.database import DatabaseConnection
-from src.core.responses import error_response
+from src.core.executor import (
+    ConversionExecutor,
+    ExecutorOverloadedError,
+    ExecutorTimeoutError,
+)
+from src.core.formats import UnencodableDataError
+from src.core.metrics import HttpMetrics, MetricsRegistry, QueryMetrics
+from src.core.middleware import (
+    BodySizeLimitMiddleware,
+    CompressionMiddleware,
+    MetricsMiddleware,
+    ReadYourWritesMiddleware,
+)
+from src.core.responses import FastJSONResponse, error_response
+from src.core.server import serve
+from src.core.user_cache import UserCache, UserCacheListener
+from src.core.user_writes import UserWriteCoalescer
 from src.routers import api_router
 
 settings = get_settings()
 
+# metrics of this worker, recorded by the middleware and the database connection and exposed at /metrics
+metrics_registry = MetricsRegistry() if settings.metrics.enabled else None
+query_metrics = (
+    QueryMetrics(
+        metrics_registry, settings.metrics, logging.getLogger("uvicorn.access")
+    )
+    if metrics_registry is not None
+    else None
+)
+
 app = FastAPI(
     title=settings.api_config.title,
     description=settings.api_config.description,
     version=settings.api_config.version,
     docs_url=settings.api_config.docs_url,
+    default_response_class=FastJSONResponse,
 )
 
+if settings.db_connection.replicas.read_your_writes:
+    app.add_middleware(
+        ReadYourWritesMiddleware,
+        window=settings.db_connection.replicas.read_your_writes,
+    )
+app.add_middleware(BodySizeLimitMiddleware, limits=settings.request_limits)
+if metrics_registry is not None:
+    # inside the compression, so the sizes of the conversion responses are recorded uncompressed
+    app.add_middleware(
+        MetricsMiddleware, metrics=HttpMetrics(metrics_registry, settings.metrics)
+    )
+if settings.compression.enabled:
+    app.add_middleware(CompressionMiddleware, settings=settings.compression)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -32,21 +74,65 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_event() -> None:
-    # setup logger
+    # setup logger of the worker, the records carry its pid
     logger = logging.getLogger("uvicorn.access")
     handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s - [%(process)d] - %(levelname)s - %(message)s")
+    )
     logger.addHandler(handler)
     app.state.logger = logger
+    # expose metrics
+    app.state.metrics_registry = metrics_registry
+    if metrics_registry is not None and settings.uvicorn.worker_count > 1:
+        logger.warning(
+            "Metrics are kept per worker, a scrape of /metrics returns the metrics of the worker answering it"
+        )
     # setup db connection
-    db_connection = DatabaseConnection(dsn=settings.db_connection.postgres_uri)
+    db_connection = DatabaseConnection(
+        dsn=settings.db_connection.postgres_uri,
+        settings=settings.db_connection.pool.per_worker(settings.uvicorn.worker_count),
+        replica_settings=settings.db_connection.replicas,
+        metrics=query_metrics,
+    )
+    await db_connection.open()
     app.state.db_connection = db_connection
+    # setup user cache and the listener of invalidations of the other workers
+    user_cache = UserCache(settings.users.cache, logger)
+    app.state.user_cache = user_cache
+    app.state.user_cache_listener = None
+    if user_cache.enabled and settings.users.cache.notify_channel is not None:
+        user_cache_listener = UserCacheListener(
+            dsn=settings.db_connection.postgres_uri,
+            cache=user_cache,
+            channel=settings.users.cache.notify_channel,
+            logger=logger,
+        )
+        await user_cache_listener.start()
+        app.state.user_cache_listener = user_cache_listener
+    # setup coalescing of the writes of single users
+    app.state.user_writes = (
+        UserWriteCoalescer(db_connection, user_cache, settings.users.writes, logger)
+        if settings.users.writes.coalesce
+        else None
+    )
+    # setup conversion executor
+    app.state.conversion_executor = ConversionExecutor(
+        settings.converter.executor, server_workers=settings.uvicorn.worker_count
+    )
+    # setup conversion cache
+    app.state.conversion_cache = ConversionCache(settings.converter.cache)
 
 
 @app.on_event("shutdown")
 async def shutdown_event() -> None:
+    if app.state.user_writes is not None:
+        await app.state.user_writes.close()
+    if app.state.user_cache_listener is not None:
+        await app.state.user_cache_listener.stop()
     db_connection = app.state.db_connection
-    db_connection.close()
+    await db_connection.close()
+    app.state.conversion_executor.shutdown()
 
 
 # exception handling
@@ -58,15 +144,46 @@ async def exception_handler(request: Request, exc: Exception) -> JSONResponse:
     return error_response(errors=str(exc), status_code=status.HTTP_400_BAD_REQUEST)
 
 
+@app.exception_handler(ExecutorOverloadedError)
+async def executor_overloaded_handler(
+    request: Request, exc: ExecutorOverloadedError
+) -> JSONResponse:
+    return error_response(
+        errors=str(exc), status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@app.exception_handler(PoolTimeout)
+@app.exception_handler(TooManyRequests)
+async def database_pool_busy_handler(
+    request: Request, exc: Union[PoolTimeout, TooManyRequests]
+) -> JSONResponse:
+    logger = request.app.state.logger
+    logger.error(f"{exc}")
+    return error_response(
+        errors="Database is busy", status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@app.exception_handler(ExecutorTimeoutError)
+async def executor_timeout_handler(
+    request: Request, exc: ExecutorTimeoutError
+) -> JSONResponse:
+    logger = request.app.state.logger
+    logger.error(f"{exc}")
+    return error_response(errors=str(exc), status_code=status.HTTP_504_GATEWAY_TIMEOUT)
+
+
+@app.exception_handler(UnencodableDataError)
+async def unencodable_data_handler(
+    request: Request, exc: UnencodableDataError
+) -> JSONResponse:
+    return error_response(
+        errors=str(exc), status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+    )
+
+
 app.include_router(api_router)
 
 if __name__ == "__main__":
-    settings = get_settings()
-    server = settings.uvicorn
-    uvicorn.run(
-        app="main:app",
-        host=server.host,
-        port=server.port,
-        log_level=server.log_level,
-        reload=server.reload,
-    )
+    serve("main:app", get_settings().uvicorn)
@@ -0,0 +1,32 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from starlette import status
+from starlette.responses import Response
+
+from src.core.dependencies import get_metrics_registry
+from src.core.metrics import METRICS_MEDIA_TYPE, MetricsRegistry
+from src.core.responses import error_response
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=Response)
+async def get_metrics(
+    metrics_registry: Optional[MetricsRegistry] = Depends(get_metrics_registry),
+) -> Response:
+    """
+    Returns the metrics of this worker in the Prometheus text format, e.g. latency histograms,
+    row counts and error counts of the database statements.
+
+    Parameters:
+    - **metrics_registry**: registry of the metrics, None when the metrics are disabled
+    \f
+    :param metrics_registry: registry of the metrics, None when the metrics are disabled
+    :return: metrics in the Prometheus text format
+    """
+    if metrics_registry is None:
+        return error_response(
+            "Metrics are disabled", status_code=status.HTTP_404_NOT_FOUND
+        )
+    return Response(metrics_registry.render(), media_type=METRICS_MEDIA_TYPE)
@@ -1,89 +1,309 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
 from fastapi import APIRouter, Depends, Query
 from pydantic import EmailStr
 from starlette import status
-from starlette.responses import JSONResponse
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
+from src.config.settings import UserSettings
+from src.core.conditional import (
+    content_etag,
+    etag_matches,
+    make_etag,
+    not_modified_response,
+)
 from src.core.database import DatabaseConnection
-from src.core.dependencies import get_db_connection
+from src.core.dependencies import (
+    get_accept_request_header,
+    get_db_connection,
+    get_if_none_match_request_header,
+    get_user_cache,
+    get_user_settings,
+    get_user_writes,
+)
+from src.core.formats import (
+    EXPORT_MEDIA_TYPES,
+    NDJSON_MEDIA_TYPE,
+    get_media_type,
+    iter_export_chunks,
+    negotiate_media_type,
+)
+from src.core.pagination import InvalidCursorError, decode_cursor, encode_cursor
 from src.core.responses import error_response, success_response
+from src.core.uploads import load_json
+from src.core.user_bulk import (
+    InvalidBulkUserError,
+    iter_json_items,
+    iter_ndjson_items,
+    iter_user_batches,
+    upsert_users,
+)
+from src.core.user_cache import UserCache
+from src.core.user_writes import UserWriteCoalescer
 from src.schemas import requests, responses
 
 router = APIRouter()
 
 
+# digest of the versions of all stripes of `users_version` (see `database/init.sql`), changed by every write of users
+_USERS_VERSION = "SELECT md5(string_agg(version::text, '.' ORDER BY stripe)) AS users_version FROM users_version"
+# the page is read together with the version in one statement, so the version matches the page
+_USERS_PAGE = (
+    f"SELECT version.users_version, page.* FROM ({_USERS_VERSION}) AS version LEFT JOIN "
+    "(SELECT * FROM users ORDER BY email LIMIT %s OFFSET %s) AS page ON true ORDER BY page.email"
+)
+_USERS_PAGE_AFTER = (
+    f"SELECT version.users_version, page.* FROM ({_USERS_VERSION}) AS version LEFT JOIN "
+    "(SELECT * FROM users WHERE email > %s ORDER BY email LIMIT %s) AS page ON true ORDER BY page.email"
+)
+
+
+async def _query_users_page(
+    db_connection: DatabaseConnection,
+    offset: int,
+    limit: int,
+    last_email: Optional[str],
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Queries a page of users sorted by email and the version of the users table
+    :param db_connection: DatabaseConnection object
+    :param offset: offset of the first user
+    :param limit: number of users
+    :param last_email: email of the last user of the previous page, the page starts at offset when None
+    :return: version of the users table and the users
+    """
+    if last_email is None:
+        rows = await db_connection.query_all(_USERS_PAGE, (limit, offset), replica=True)
+    else:
+        rows = await db_connection.query_all(
+            _USERS_PAGE_AFTER, (last_email, limit), replica=True
+        )
+    # an empty page is a single row with the version only
+    version = rows[0].pop("users_version")
+    for row in rows[1:]:
+        del row["users_version"]
+    return version, [row for row in rows if row["email"] is not None]
+
+
 @router.get("/users", response_model=responses.UserListResponse)
 async def get_users(
     offset: int = Query(default=0),
     limit: int = Query(default=10),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Depends(get_if_none_match_request_header),
     db_connection: DatabaseConnection = Depends(get_db_connection),
-) -> JSONResponse:
+) -> Response:
     """
-    Returns a list of users
+    Returns a list of users sorted by email.
+    The page is followed by `next_cursor` when more users exist, passing it as `cursor`
+    returns the next page by seeking the email index instead of skipping `offset` rows.
+    The `ETag` of the page changes with every write of users, a request with the current tag in `If-None-Match`
+    is answered with `304 Not Modified` after reading the version of the users table only.
 
     Parameters:
-    - **offset**: offset of the first user to return - default 0
+    - **offset**: offset of the first user to return - default 0, cannot be combined with cursor
     - **limit**: limit of users to return - default 10
+    - **cursor**: `next_cursor` of the previous page
+    - **if_none_match**: If-None-Match header of the request
     - **db_connection**: DatabaseConnection object
     \f
     :param limit: number of users to return - default 10
     :param offset: offset of the first user to return - default 0
+    :param cursor: cursor of the page returned with the previous page
+    :param if_none_match: If-None-Match header of the request
     :param db_connection: DatabaseConnection object
-    :return: list of all users
+    :return: list of users and the cursor of the next page
     """
-    users = db_connection.query_all(
-        "SELECT * FROM users ORDER BY email LIMIT %s OFFSET %s", (limit, offset)
+    last_email = None
+    if cursor is not None and offset:
+        return error_response(
+            "Cursor cannot be combined with offset",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    if cursor is not None:
+        try:
+            last_email = decode_cursor(cursor)
+        except InvalidCursorError as e:
+            return error_response(str(e), status_code=status.HTTP_400_BAD_REQUEST)
+
+    if if_none_match:
+        current = await db_connection.query_one(_USERS_VERSION, replica=True)
+        assert current is not None
+        etag = make_etag("users", current["users_version"])
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+
+    # one more user is queried to tell whether the next page exists
+    version, users = await _query_users_page(
+        db_connection, offset, limit + 1, last_email
     )
-    return success_response(users)
+    next_cursor = None
+    if len(users) > limit > 0:
+        next_cursor = encode_cursor(users[limit - 1])
+    response = success_response(users[:limit], next_cursor=next_cursor)
+    response.headers["ETag"] = make_etag("users", version)
+    return response
+
+
+@router.get("/users/export")
+async def export_users(
+    accept_header: Optional[str] = Depends(get_accept_request_header),
+    db_connection: DatabaseConnection = Depends(get_db_connection),
+    user_settings: UserSettings = Depends(get_user_settings),
+) -> StreamingResponse:
+    """
+    Exports all users sorted by email.
+    The users are read from a server-side cursor and streamed while they are read,
+    as newline-delimited JSON (`application/x-ndjson`, default) or CSV (`text/csv`) by the `Accept` header.
+
+    Parameters:
+    - **accept_header**: Accept header of the request
+    - **db_connection**: DatabaseConnection object
+    - **user_settings**: settings of the user endpoints
+    \f
+    :param accept_header: Accept header of the request
+    :param db_connection: DatabaseConnection object
+    :param user_settings: settings of the user endpoints
+    :return: streamed users
+    """
+    media_type = negotiate_media_type(accept_header, EXPORT_MEDIA_TYPES)
+    chunks = db_connection.stream(
+        "SELECT email, value FROM users ORDER BY email",
+        chunk_size=user_settings.export.chunk_size,
+        replica=True,
+    )
+    return StreamingResponse(
+        iter_export_chunks(chunks, media_type, fieldnames=("email", "value")),
+        media_type=media_type,
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.post("/users/bulk", response_model=responses.UserBulkResponse)
+async def upsert_users_bulk(
+    request: Request,
+    db_connection: DatabaseConnection = Depends(get_db_connection),
+    user_cache: UserCache = Depends(get_user_cache),
+    user_settings: UserSettings = Depends(get_user_settings),
+) -> JSONResponse:
+    """
+    Creates or updates the values of many users in one transaction.
+    The body is a JSON array of users, or newline-delimited JSON users (`application/x-ndjson`)
+    which are upserted while the body is received.
+    The users are copied to the database in batches, when an email repeats, its last value is stored.
+    Nothing is stored when any of the users is invalid.
+
+    Parameters:
+    - **db_connection**: DatabaseConnection object
+    - **user_cache**: cache of the users
+    - **user_settings**: settings of the user endpoints
+
+    Returns the numbers of the received and upserted users and the upsert throughput of every batch.
+    \f
+    :param request: request with the users in its body
+    :param db_connection: DatabaseConnection object
+    :param user_cache: cache of the users
+    :param user_settings: settings of the user endpoints
+    :return: counts and throughput of the batches
+    """
+    if get_media_type(request.headers.get("Content-Type")) == NDJSON_MEDIA_TYPE:
+        items = iter_ndjson_items(request.stream())
+    else:
+        data = load_json(await request.body())
+        if not isinstance(data, list):
+            return error_response(
+                "Users must be a JSON array", status_code=status.HTTP_400_BAD_REQUEST
+            )
+        items = iter_json_items(data)
+
+    try:
+        result = await upsert_users(
+            db_connection, iter_user_batches(items, user_settings.bulk.batch_size)
+        )
+    except InvalidBulkUserError as e:
+        return error_response(str(e), status_code=status.HTTP_400_BAD_REQUEST)
+    await user_cache.invalidate(db_connection)
+    return success_response(result)
 
 
 @router.get("/user", response_model=responses.UserResponse)
 async def get_user_associated_value(
     email: EmailStr = Query(..., description="Email address of the user"),
+    if_none_match: Optional[str] = Depends(get_if_none_match_request_header),
     db_connection: DatabaseConnection = Depends(get_db_connection),
-) -> JSONResponse:
+    user_cache: UserCache = Depends(get_user_cache),
+) -> Response:
     """
     Returns the user object with the provided email address.
+    The `ETag` of the user is the hash of its value, a request with the current tag in `If-None-Match`
+    is answered with `304 Not Modified`, without querying the database when the user is cached.
 
     Parameters:
     - **email**: email address of the user
+    - **if_none_match**: If-None-Match header of the request
     - **db_connection**: DatabaseConnection object
+    - **user_cache**: cache of the users
     \f
     :param email: email address of the user
+    :param if_none_match: If-None-Match header of the request
     :param db_connection: `DatabaseConnection` object
+    :param user_cache: cache of the users
     :return: user object with the provided email address.
     """
-    user = db_connection.query_one("SELECT * FROM users WHERE email = %s", (email,))
-    if user is not None:
-        return success_response(user)
-    else:
+    user = await user_cache.read_through(
+        email,
+        lambda: db_connection.query_one(
+            "SELECT * FROM users WHERE email = %s", (email,), replica=True
+        ),
+    )
+    if user is None:
         return error_response("User not found", status_code=status.HTTP_404_NOT_FOUND)
 
+    etag = content_etag(user)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    response = success_response(user)
+    response.headers["ETag"] = etag
+    return response
+
 
 @router.post("/user", response_model=responses.ServiceBaseResponse)
 async def create_user_associated_value(
     user_in: requests.UserCreateRequest,
     email: EmailStr = Query(..., description="Email address of the user"),
     db_connection: DatabaseConnection = Depends(get_db_connection),
+    user_cache: UserCache = Depends(get_user_cache),
+    user_writes: Optional[UserWriteCoalescer] = Depends(get_user_writes),
 ) -> JSONResponse:
     """
     Creates the plain text value associated with the provided email address.
+    When the writes are coalesced, the user is committed together with the concurrent writes.
 
     Parameters:
     - **email**: email address of the user
     - **user_in**: `UserCreateRequest` object
     - **db_connection**: DatabaseConnection object
+    - **user_cache**: cache of the users
+    - **user_writes**: coalescer of the writes, None when the writes are not coalesced
 
     Returns success if the user was created successfully.
     \f
     :param email: email address of the user
     :param user_in: `UserCreateRequest` object
     :param db_connection: DatabaseConnection object
+    :param user_cache: cache of the users
+    :param user_writes: coalescer of the writes, None when the writes are not coalesced
     :return: success if the user was created successfully.
     """
-    db_connection.execute(
+    if user_writes is not None:
+        await user_writes.upsert(email, user_in.value)
+        return success_response()
+    await db_connection.execute(
         "INSERT INTO users VALUES(%s, %s) ON CONFLICT (email) DO UPDATE SET value = %s;",
         (email, user_in.value, user_in.value),
     )
+    await user_cache.invalidate(db_connection, [email])
     return success_response()
 
 
@@ -91,21 +311,156 @@ async def create_user_associated_value(
 async def delete_user_associated_value(
     email: EmailStr = Query(..., description="Email address of the user"),
     db_connection: DatabaseConnection = Depends(get_db_connection),
+    user_cache: UserCache = Depends(get_user_cache),
+    user_writes: Optional[UserWriteCoalescer] = Depends(get_user_writes),
 ) -> JSONResponse:
     """
     Deletes plain text value associated with the provided email address.
+    When the writes are coalesced, the user is deleted together with the concurrent writes.
 
     Parameters:
     - **email**: email address of the user
     - **db_connection**: DatabaseConnection object
+    - **user_cache**: cache of the users
+    - **user_writes**: coalescer of the writes, None when the writes are not coalesced
 
     Returns success if the user was deleted successfully.
     \f
     :param email: email address of the user
     :param db_connection: DatabaseConnection object
+    :param user_cache: cache of the users
+    :param user_writes: coalescer of the writes, None when the writes are not coalesced
     :return: success if the user was deleted successfully.
     """
+    if user_writes is not None:
+        await user_writes.delete(email)
+        return success_response()
 
-    db_connection.execute("DELETE FROM users WHERE email = %s", (email,))
+    await db_connection.execute("DELETE FROM users WHERE email = %s", (email,))
+    await user_cache.invalidate(db_connection, [email])
 
     return success_response()
+
+
+def _iter_email_batches(
+    emails: Sequence[str], batch_size: int
+) -> Iterator[Sequence[str]]:
+    """
+    Splits the emails into batches queried at once
+    :param emails: unique emails
+    :param batch_size: number of emails in a batch
+    :return: iterator of the batches
+    """
+    for start in range(0, len(emails), batch_size):
+        end = start + batch_size
+        yield emails[start:end]
+
+
+@router.post("/users/lookup", response_model=responses.UserBatchResponse)
+async def get_users_associated_values(
+    users_in: requests.UserBatchRequest,
+    db_connection: DatabaseConnection = Depends(get_db_connection),
+    user_settings: UserSettings = Depends(get_user_settings),
+) -> JSONResponse:
+    """
+    Returns the users with the provided email addresses.
+    The emails are queried in batches, one query per batch.
+
+    Parameters:
+    - **users_in**: `UserBatchRequest` object with the emails of the users
+    - **db_connection**: DatabaseConnection object
+    - **user_settings**: settings of the user endpoints
+
+    Returns the found users keyed by their email, and the emails of the users that were not found.
+    \f
+    :param users_in: `UserBatchRequest` object
+    :param db_connection: DatabaseConnection object
+    :param user_settings: settings of the user endpoints
+    :return: found users keyed by email and emails of the missing users
+    """
+    batch_settings = user_settings.batch
+    emails = list(dict.fromkeys(users_in.emails))
+    if len(emails) > batch_settings.max_emails:
+        return error_response(
+            f"At most {batch_settings.max_emails} emails can be looked up at once",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    found: Dict[str, Dict[str, Any]] = {}
+    for batch in _iter_email_batches(emails, batch_settings.batch_size):
+        for user in await db_connection.query_all(
+            "SELECT * FROM users WHERE email = ANY(%s)", (batch,), replica=True
+        ):
+            found[user["email"]] = user
+    # the rows of a batch are returned in any order, the users are keyed in the order of the request
+    users = {email: found[email] for email in emails if email in found}
+    missing = [email for email in emails if email not in found]
+    return success_response({"users": users, "missing": missing})
+
+
+@router.post("/users/delete", response_model=responses.UserBatchDeleteResponse)
+async def delete_users_associated_values(
+    users_in: requests.UserBatchRequest,
+    db_connection: DatabaseConnection = Depends(get_db_connection),
+    user_cache: UserCache = Depends(get_user_cache),
+    user_settings: UserSettings = Depends(get_user_settings),
+) -> JSONResponse:
+    """
+    Deletes the users with the provided email addresses.
+    The emails are deleted in batches, one query per batch.
+
+    Parameters:
+    - **users_in**: `UserBatchRequest` object with the emails of the users
+    - **db_connection**: DatabaseConnection object
+    - **user_cache**: cache of the users
+    - **user_settings**: settings of the user endpoints
+
+    Returns the emails of the deleted users, and the emails of the users that did not exist.
+    \f
+    :param users_in: `UserBatchRequest` object
+    :param db_connection: DatabaseConnection object
+    :param user_cache: cache of the users
+    :param user_settings: settings of the user endpoints
+    :return: emails of the deleted and of the missing users
+    """
+    batch_settings = user_settings.batch
+    emails = list(dict.fromkeys(users_in.emails))
+    if len(emails) > batch_settings.max_emails:
+        return error_response(
+            f"At most {batch_settings.max_emails} emails can be deleted at once",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    deleted: Set[str] = set()
+    for batch in _iter_email_batches(emails, batch_settings.batch_size):
+        batch_deleted = [
+            user["email"]
+            for user in await db_connection.query_all(
+                "DELETE FROM users WHERE email = ANY(%s) RETURNING email", (batch,)
+            )
+        ]
+        # every batch is committed on its own, so it is invalidated before the next one may fail
+        await user_cache.invalidate(db_connection, batch_deleted)
+        deleted.update(batch_deleted)
+    return success_response(
+        {
+            "deleted": [email for email in emails if email in deleted],
+            "missing": [email for email in emails if email not in deleted],
+        }
+    )
+
+
+@router.get("/user-cache/stats")
+async def get_user_cache_stats(
+    user_cache: UserCache = Depends(get_user_cache),
+) -> JSONResponse:
+    """
+    Returns counters of the user cache - hits, misses, evictions, invalidations and its size.
+
+    Parameters:
+    - **user_cache**: cache of the users
+    \f
+    :param user_cache: cache of the users
+    :return: cache counters
+    """
+    return success_response(user_cache.stats())
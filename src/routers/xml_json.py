@@ -1,30 +1,91 @@
-import json
-from typing import Optional, Union
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, Depends, File, UploadFile
-from lxml import etree
+from fastapi import APIRouter, Depends, File, Query, UploadFile
 from starlette import status
-from starlette.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
-from src.config.annotations import JSONType
-from src.core.dependencies import get_accept_request_header
-from src.core.responses import error_response, success_response
+from src.config.settings import ConverterSettings
+from src.core.batch import (
+    BATCH_MEDIA_TYPE,
+    BatchTooLargeError,
+    iter_batch_results,
+    read_batch_items,
+)
+from src.core.cache import ConversionCache
+from src.core.dependencies import (
+    get_accept_request_header,
+    get_conversion_cache,
+    get_conversion_executor,
+    get_converter_settings,
+)
+from src.core.executor import ConversionExecutor, get_upload_size
+from src.core.formats import (
+    JSON2XML_MEDIA_TYPES,
+    JSON_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    XML2JSON_MEDIA_TYPES,
+    XML_MEDIA_TYPE,
+    convert_xml_file,
+    encode_success,
+    negotiate_media_type,
+)
+from src.core.responses import (
+    error_response,
+    ndjson_error_line,
+    stream_response,
+    success_raw_response,
+    success_response,
+    success_stream_response,
+)
 from src.core.xml_parser import XMLParser
 
 router = APIRouter()
 
 
+def _xml2json_response(data: bytes, media_type: str) -> Response:
+    """
+    Returns the response with converted XML data
+    :param data: JSON data without the envelope or binary data with the envelope
+    :param media_type: media type of the data
+    :return: response
+    """
+    if media_type == JSON_MEDIA_TYPE:
+        return success_raw_response(data)
+    return Response(content=data, media_type=media_type)
+
+
 @router.post("/xml2json")
-async def convert_xml2json_request(file: UploadFile = File(...)) -> JSONResponse:
+async def convert_xml2json_request(
+    file: UploadFile = File(...),
+    stream: bool = Query(default=False, description="Stream the converted JSON"),
+    accept_header: Optional[str] = Depends(get_accept_request_header),
+    converter_settings: ConverterSettings = Depends(get_converter_settings),
+    executor: ConversionExecutor = Depends(get_conversion_executor),
+    cache: ConversionCache = Depends(get_conversion_cache),
+) -> Response:
     """
-    Convert XML to JSON
+    Convert XML to JSON.
+    The format of the response is negotiated by `accept` request header -
+    JSON by default, MessagePack (`application/msgpack`), CBOR (`application/cbor`)
+    or NDJSON (`application/x-ndjson`) with one line per item of the top-level list.
 
     Parameters:
     - **file**: XML file as multipart/form-data**: input JSON file as multipart/form-data
+    - **stream**: when set, the JSON is streamed while the XML is being parsed - default false
+    - **accept_header**: request header `accept`
+    - **converter_settings**: XML/JSON conversion settings
+    - **executor**: executor of the conversions of large files
+    - **cache**: cache of the conversion results
 
     Returns JSON as a response.
     \f
     :param file: XML file as multipart/form-data
+    :param stream: stream the converted JSON with constant memory usage
+    :param accept_header: request header `accept`
+    :param converter_settings: XML/JSON conversion settings
+    :param executor: executor of the conversions of large files
+    :param cache: cache of the conversion results
     """
     if file.content_type != "text/xml":
         return error_response(
@@ -32,27 +93,80 @@ async def convert_xml2json_request(file: UploadFile = File(...)) -> JSONResponse
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    xml_data: JSONType = XMLParser.parse_xml_from_file(file.file)
-    return success_response(xml_data)
+    media_type = negotiate_media_type(accept_header, XML2JSON_MEDIA_TYPES)
+    max_depth = converter_settings.max_depth
+    cache_key = await cache.file_key(file.file, media_type, max_depth)
+    cached_data = await cache.lookup(cache_key)
+    if cached_data is not None:
+        return _xml2json_response(cached_data, media_type)
+
+    # streamed conversions are produced within the bounds of the executor
+    if media_type == NDJSON_MEDIA_TYPE:
+        lines = XMLParser.iter_ndjson_from_file(file.file, max_depth=max_depth)
+        return await stream_response(
+            executor.stream(cache.tee(cache_key, lines)),
+            media_type=media_type,
+            error_chunk=ndjson_error_line,
+        )
+    if stream and media_type == JSON_MEDIA_TYPE:
+        json_chunks = XMLParser.iter_json_from_file(file.file, max_depth=max_depth)
+        return await success_stream_response(
+            executor.stream(cache.tee(cache_key, json_chunks))
+        )
+
+    if executor.should_offload(get_upload_size(file)):
+        file_source = await executor.file_source(file)
+        data = await executor.run(convert_xml_file, file_source, media_type, max_depth)
+    else:
+        data = convert_xml_file(file.file, media_type, max_depth)
+
+    await cache.store(cache_key, data)
+    return _xml2json_response(data, media_type)
+
+
+@router.get("/conversion-cache/stats")
+async def get_conversion_cache_stats(
+    cache: ConversionCache = Depends(get_conversion_cache),
+) -> JSONResponse:
+    """
+    Returns counters of the conversion results cache - hits, misses, evictions and its size.
+
+    Parameters:
+    - **cache**: cache of the conversion results
+    \f
+    :param cache: cache of the conversion results
+    :return: cache counters
+    """
+    return success_response(cache.stats())
 
 
 @router.post("/json2xml")
 async def convert_json2xml_request(
     file: UploadFile = File(...),
     accept_header: Optional[str] = Depends(get_accept_request_header),
+    converter_settings: ConverterSettings = Depends(get_converter_settings),
+    executor: ConversionExecutor = Depends(get_conversion_executor),
+    cache: ConversionCache = Depends(get_conversion_cache),
 ) -> Union[Response, JSONResponse]:
     """
     Endpoint that converts JSON to XML.
-    When `accept` request header is set to `text/xml`, returns XML as response.
+    When `accept` request header is set to `text/xml`, streams XML as response.
+    When it is set to `application/msgpack` or `application/cbor`, returns XML string in the binary format.
     Otherwise, returns JSON as response.
 
     Request Path parameters:
     - **file**: input JSON file as multipart/form-data
     - **accept_header**: request header `accept`
+    - **converter_settings**: XML/JSON conversion settings
+    - **executor**: executor of the conversions of large files
+    - **cache**: cache of the conversion results
 
     \f
     :param file: input JSON file as multipart/form-data
     :param accept_header: request header `accept`
+    :param converter_settings: XML/JSON conversion settings
+    :param executor: executor of the conversions of large files
+    :param cache: cache of the conversion results
     :returns: XML in data JSON key by default.
     """
     if file.content_type != "application/json":
@@ -60,15 +174,79 @@ async def convert_json2xml_request(
             "'application/json' file's content type is required",
             status_code=status.HTTP_400_BAD_REQUEST,
         )
-    # read the file and parse it to json
-    file_data = await file.read()
-    json_data = json.loads(file_data)
+    media_type = negotiate_media_type(accept_header, JSON2XML_MEDIA_TYPES)
+    max_depth = converter_settings.max_depth
+    cache_key = await cache.file_key(file.file, XML_MEDIA_TYPE, max_depth)
+    xml_data = await cache.lookup(cache_key)
 
-    # parse the xml from the json
-    xml_data = XMLParser.parse_xml_from_json(json_data)
-    xml_data_str = etree.tostring(xml_data, encoding="utf-8")
+    if xml_data is None:
+        if media_type == XML_MEDIA_TYPE:
+            # the json is parsed and the xml serialized within the bounds of the executor as the chunks are produced
+            xml_chunks = XMLParser.iter_xml_from_json_file(
+                file.file, max_depth=max_depth
+            )
+            return await stream_response(
+                executor.stream(cache.tee(cache_key, xml_chunks)),
+                media_type=media_type,
+            )
 
-    if accept_header == "text/xml":
-        return Response(content=xml_data_str, media_type="text/xml")
+        # the spooled upload is parsed in place, it is not read into bytes
+        if executor.should_offload(get_upload_size(file)):
+            file_source = await executor.file_source(file)
+            xml_data = await executor.run(
+                XMLParser.convert_json_file_to_xml, file_source, max_depth
+            )
+        else:
+            xml_data = XMLParser.convert_json_file_to_xml(
+                file.file, max_depth=max_depth
+            )
+        await cache.store(cache_key, xml_data)
+
+    if media_type == XML_MEDIA_TYPE:
+        return Response(content=xml_data, media_type=media_type)
+    elif media_type == JSON_MEDIA_TYPE:
+        return success_response(xml_data)
     else:
-        return success_response(xml_data_str)
+        binary_data = encode_success(xml_data.decode("utf-8"), media_type)
+        return Response(content=binary_data, media_type=media_type)
+
+
+@router.post("/batch")
+async def convert_batch_request(
+    files: List[UploadFile] = File(...),
+    converter_settings: ConverterSettings = Depends(get_converter_settings),
+    executor: ConversionExecutor = Depends(get_conversion_executor),
+) -> Response:
+    """
+    Convert a batch of files, XML files to JSON and JSON files to XML.
+    Files are uploaded as multipart/form-data parts or as zip or tar archives.
+    Results are streamed as newline-delimited JSON in the order the conversions finish,
+    a file that fails to convert is reported in its own line.
+
+    Parameters:
+    - **files**: XML and JSON files or their archives as multipart/form-data
+    - **converter_settings**: XML/JSON conversion settings
+    - **executor**: executor of the conversions
+
+    Returns a line `{"name": ..., "success": true, "data": ...}`
+    or `{"name": ..., "success": false, "errors": ...}` for each file.
+    \f
+    :param files: XML and JSON files or their archives as multipart/form-data
+    :param converter_settings: XML/JSON conversion settings
+    :param executor: executor of the conversions
+    """
+    batch_settings = converter_settings.batch
+    uploads = [(file.file, file.filename, file.content_type) for file in files]
+    try:
+        items = await run_in_threadpool(read_batch_items, uploads, batch_settings)
+    except BatchTooLargeError as exc:
+        return error_response(
+            str(exc), status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    results = iter_batch_results(
+        executor, items, converter_settings.max_depth, batch_settings.chunk_size
+    )
+    return StreamingResponse(
+        results, media_type=BATCH_MEDIA_TYPE, status_code=status.HTTP_200_OK
+    )
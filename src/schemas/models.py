@@ -1,6 +1,33 @@
+from typing import Dict, List
+
 from pydantic import BaseModel, EmailStr
 
 
 class User(BaseModel):
     email: EmailStr
     value: str
+
+
+class UserBulkBatch(BaseModel):
+    count: int
+    upserted: int
+    seconds: float
+    users_per_second: float
+
+
+class UserBulkResult(BaseModel):
+    count: int
+    upserted: int
+    seconds: float
+    users_per_second: float
+    batches: List[UserBulkBatch]
+
+
+class UserBatchResult(BaseModel):
+    users: Dict[str, User]
+    missing: List[EmailStr]
+
+
+class UserBatchDeleteResult(BaseModel):
+    deleted: List[EmailStr]
+    missing: List[EmailStr]
@@ -1,5 +1,11 @@
-from pydantic import BaseModel
+from typing import List
+
+from pydantic import BaseModel, EmailStr
 
 
 class UserCreateRequest(BaseModel):
     value: str
+
+
+class UserBatchRequest(BaseModel):
+    emails: List[EmailStr]
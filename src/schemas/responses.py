@@ -1,8 +1,13 @@
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel
 
-from src.schemas.models import User
+from src.schemas.models import (
+    User,
+    UserBatchDeleteResult,
+    UserBatchResult,
+    UserBulkResult,
+)
 
 
 class ServiceBaseResponse(BaseModel):
@@ -11,7 +16,20 @@ class ServiceBaseResponse(BaseModel):
 
 class UserListResponse(ServiceBaseResponse):
     data: List[User]
+    next_cursor: Optional[str] = None
 
 
 class UserResponse(ServiceBaseResponse):
     data: User
+
+
+class UserBulkResponse(ServiceBaseResponse):
+    data: UserBulkResult
+
+
+class UserBatchResponse(ServiceBaseResponse):
+    data: UserBatchResult
+
+
+class UserBatchDeleteResponse(ServiceBaseResponse):
+    data: UserBatchDeleteResult
@@ -0,0 +1,145 @@
+import io
+import json
+import tarfile
+import zipfile
+from typing import IO, Dict, List, Optional, Tuple
+
+import pytest
+
+from src.config.settings import BatchSettings, ExecutorKinds, ExecutorSettings
+from src.core.batch import (
+    BatchItem,
+    BatchTooLargeError,
+    iter_batch_results,
+    read_batch_items,
+)
+from src.core.executor import ConversionExecutor
+from src.core.xml_parser import XMLParser
+
+XML_DATA = b'<ITEM type="object"><ITEM type="integer" value="7" key="apple"/></ITEM>'
+JSON_DATA = b'{"apple": 7}'
+
+
+def zip_archive(files: Dict[str, bytes]) -> io.BytesIO:
+    archive_file = io.BytesIO()
+    with zipfile.ZipFile(archive_file, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    archive_file.seek(0)
+    return archive_file
+
+
+def tar_archive(files: Dict[str, bytes]) -> io.BytesIO:
+    archive_file = io.BytesIO()
+    with tarfile.open(fileobj=archive_file, mode="w:gz") as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    archive_file.seek(0)
+    return archive_file
+
+
+def test_read_batch_items() -> None:
+    """
+    Test that multipart files are read as they are and that zip and tar archives are expanded
+    """
+    files: List[Tuple[IO[bytes], str, Optional[str]]] = [
+        (io.BytesIO(XML_DATA), "part", "text/xml"),
+        (zip_archive({"a.xml": XML_DATA, "b.json": JSON_DATA}), "batch.zip", None),
+        (tar_archive({"dir/c.json": JSON_DATA, "d.xml": b"x" * 11}), "batch.tgz", None),
+    ]
+    items = read_batch_items(files, BatchSettings(max_item_bytes=len(XML_DATA)))
+    assert items == [
+        ("part", "xml", XML_DATA),
+        ("a.xml", "xml", XML_DATA),
+        ("b.json", "json", JSON_DATA),
+        ("dir/c.json", "json", JSON_DATA),
+        ("d.xml", "xml", b"x" * 11),
+    ]
+
+    files = [(zip_archive({"a.xml": XML_DATA, "b.json": JSON_DATA}), "batch.zip", None)]
+    with pytest.raises(BatchTooLargeError):
+        read_batch_items(files, BatchSettings(max_items=1))
+
+
+def test_read_batch_items_total_bytes() -> None:
+    """
+    Test that the reading of a small archive of highly compressed files stops once their total size exceeds the limit
+    """
+    archive_file = io.BytesIO()
+    with zipfile.ZipFile(archive_file, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index in range(100):
+            archive.writestr(f"{index}.xml", b"\0" * 1024 * 1024)
+    archive_file.seek(0)
+    assert len(archive_file.getvalue()) < 1024 * 1024
+
+    files: List[Tuple[IO[bytes], str, Optional[str]]] = [
+        (archive_file, "bomb.zip", None)
+    ]
+    with pytest.raises(BatchTooLargeError, match="exceed"):
+        read_batch_items(files, BatchSettings(max_total_bytes=4 * 1024 * 1024))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", [ExecutorKinds.process, ExecutorKinds.thread])
+async def test_batch_results(kind: ExecutorKinds) -> None:
+    """
+    Test that every file of the batch gets its own result line and that failed files do not fail the batch
+    :param kind: executor kind
+    """
+    items: List[BatchItem] = [(f"{i}.xml", "xml", XML_DATA) for i in range(10)]
+    items += [
+        ("a.json", "json", JSON_DATA),
+        ("invalid.json", "json", b"{"),
+        ("large.xml", "xml", None),
+        ("data.csv", None, b"a,b"),
+    ]
+    executor = ConversionExecutor(ExecutorSettings(kind=kind, workers=2))
+    try:
+        lines: List[bytes] = [
+            line async for line in iter_batch_results(executor, items, None, 3)
+        ]
+    finally:
+        executor.shutdown()
+
+    results = {result["name"]: result for result in map(json.loads, lines)}
+    assert len(lines) == len(results) == len(items)
+    assert all(line.endswith(b"\n") for line in lines)
+    for i in range(10):
+        assert results[f"{i}.xml"] == {
+            "name": f"{i}.xml",
+            "success": True,
+            "data": {"apple": 7},
+        }
+    assert results["a.json"]["data"] == XMLParser.convert_json_to_xml(JSON_DATA).decode(
+        "utf-8"
+    )
+    for name in ["invalid.json", "large.xml", "data.csv"]:
+        assert results[name]["success"] is False
+        assert results[name]["errors"]
+
+
+@pytest.mark.asyncio
+async def test_batch_results_content_type() -> None:
+    """
+    Test that multipart parts without an extension are converted by the format of their content type
+    """
+    files: List[Tuple[IO[bytes], str, Optional[str]]] = [
+        (io.BytesIO(XML_DATA), "part", "text/xml"),
+        (io.BytesIO(JSON_DATA), "other", "application/json"),
+        (io.BytesIO(b"a,b"), "data", "text/csv"),
+    ]
+    items = read_batch_items(files, BatchSettings())
+    executor = ConversionExecutor(ExecutorSettings(kind=ExecutorKinds.thread))
+    try:
+        lines = [line async for line in iter_batch_results(executor, items, None, 3)]
+    finally:
+        executor.shutdown()
+
+    results = {result["name"]: result for result in map(json.loads, lines)}
+    assert results["part"]["data"] == {"apple": 7}
+    assert results["other"]["data"] == XMLParser.convert_json_to_xml(JSON_DATA).decode(
+        "utf-8"
+    )
+    assert results["data"]["success"] is False
@@ -0,0 +1,101 @@
+import io
+import os
+
+import pytest
+
+from src.config.settings import CacheSettings
+from src.core.cache import ConversionCache
+
+
+def test_cache_key() -> None:
+    """
+    Test that the key depends on the content, the output format and the depth limit, and that the file is rewound
+    """
+    cache = ConversionCache(CacheSettings())
+    file = io.BytesIO(b"<ITEM/>")
+
+    key = cache.file_key_sync(file, "json", 10)
+    assert file.tell() == 0
+    assert key == cache.file_key_sync(io.BytesIO(b"<ITEM/>"), "json", 10)
+    assert key != cache.file_key_sync(io.BytesIO(b"<ITEM />"), "json", 10)
+    assert key != cache.file_key_sync(file, "xml", 10)
+    assert key != cache.file_key_sync(file, "json", None)
+
+
+def test_cache_memory_eviction() -> None:
+    """
+    Test that the least recently used results are evicted once the total size exceeds the limit
+    """
+    cache = ConversionCache(CacheSettings(max_bytes=10, max_entry_bytes=5))
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+
+    cache.put("c", b"cccc")
+    cache.put("d", b"dddddd")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.get("d") is None
+
+    assert cache.stats() == {
+        "hits": 3,
+        "disk_hits": 0,
+        "misses": 2,
+        "evictions": 1,
+        "disk_evictions": 0,
+        "entries": 2,
+        "size_bytes": 8,
+    }
+
+
+def test_cache_disk_tier(tmp_path: str) -> None:
+    """
+    Test that results survive in the disk tier and that it is bounded
+
+    :param tmp_path: temporary directory of the disk tier
+    """
+    settings = CacheSettings(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=10)
+    cache = ConversionCache(settings)
+    cache.put("aa", b"aaaa")
+
+    restarted_cache = ConversionCache(settings)
+    assert restarted_cache.get("aa") == b"aaaa"
+    assert restarted_cache.stats()["disk_hits"] == 1
+
+    os.utime(os.path.join(str(tmp_path), "aa", "aa"), (0, 0))
+    cache.put("bb", b"bbbb")
+    cache.put("cc", b"cccc")
+    assert cache.get("aa") is None
+    assert cache.get("bb") == b"bbbb"
+    assert cache.stats()["disk_evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_tee() -> None:
+    """
+    Test that the streamed chunks are stored once consumed and that oversized results are not stored
+    """
+    cache = ConversionCache(CacheSettings(max_entry_bytes=8))
+    key = await cache.data_key(b"{}", "json", None)
+    assert key is not None
+
+    assert list(cache.tee(key, iter(["{", "}"]))) == ["{", "}"]
+    assert await cache.lookup(key) == b"{}"
+
+    assert list(cache.tee("large", iter([b"12345", b"67890"]))) == [b"12345", b"67890"]
+    assert await cache.lookup("large") is None
+
+
+@pytest.mark.asyncio
+async def test_cache_disabled() -> None:
+    """
+    Test that the disabled cache does not compute keys and does not store results
+    """
+    cache = ConversionCache(CacheSettings(enabled=False))
+    key = await cache.data_key(b"{}", "json", None)
+    assert key is None
+
+    await cache.store(key, b"{}")
+    assert await cache.lookup(key) is None
+    assert cache.stats()["entries"] == 0
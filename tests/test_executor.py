@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from tempfile import SpooledTemporaryFile
+from typing import Iterator
+
+import pytest
+from fastapi import UploadFile
+
+from src.config.settings import ExecutorKinds, ExecutorSettings
+from src.core.executor import (
+    ConversionExecutor,
+    ExecutorOverloadedError,
+    ExecutorTimeoutError,
+)
+from src.core.xml_parser import XMLParser
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", [ExecutorKinds.process, ExecutorKinds.thread])
+async def test_executor_conversion(kind: ExecutorKinds) -> None:
+    """
+    Test that the conversion in the executor returns the same result as the inline conversion
+    :param kind: executor kind
+    """
+    executor = ConversionExecutor(ExecutorSettings(kind=kind, workers=1))
+    json_data = b'{"apple": 7, "many": [true, null]}'
+    try:
+        xml_data = await executor.run(XMLParser.convert_json_to_xml, json_data, None)
+    finally:
+        executor.shutdown()
+    assert xml_data == XMLParser.convert_json_to_xml(json_data)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [10, 100000])
+async def test_executor_file_source(size: int) -> None:
+    """
+    Test that the process workers open uploads rolled over to disk by their path, smaller ones get their content
+    :param size: number of items of the uploaded JSON list
+    """
+    json_data = json.dumps(list(range(size))).encode()
+    upload = UploadFile("data.json", file=SpooledTemporaryFile(max_size=1000))
+    await upload.write(json_data)
+    await upload.seek(0)
+
+    executor = ConversionExecutor(
+        ExecutorSettings(kind=ExecutorKinds.process, workers=1)
+    )
+    try:
+        file_source = await executor.file_source(upload)
+        assert isinstance(file_source, str) == (len(json_data) > 1000)
+        xml_data = await executor.run(XMLParser.convert_json_file_to_xml, file_source)
+    finally:
+        executor.shutdown()
+    assert xml_data == XMLParser.convert_json_to_xml(json_data)
+
+
+@pytest.mark.asyncio
+async def test_executor_bounded_queue() -> None:
+    """
+    Test that the jobs above the capacity are rejected and that timed out jobs release their worker when finished
+    """
+    executor = ConversionExecutor(
+        ExecutorSettings(
+            kind=ExecutorKinds.thread, workers=1, queue_size=1, timeout=0.1
+        )
+    )
+    try:
+        results = await asyncio.gather(
+            *[executor.run(time.sleep, 0.3) for _ in range(3)], return_exceptions=True
+        )
+        assert [type(result) for result in results] == [
+            ExecutorTimeoutError,
+            ExecutorTimeoutError,
+            ExecutorOverloadedError,
+        ]
+        # the running job keeps its worker, the queued one was cancelled
+        assert executor.pending == 1
+        await asyncio.sleep(0.4)
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+def slow_chunks(count: int, seconds: float) -> Iterator[int]:
+    for chunk in range(count):
+        time.sleep(seconds)
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_executor_stream() -> None:
+    """
+    Test that streams count as jobs of the executor and fail once producing their chunks exceeds the timeout,
+    while the time the client takes between the chunks does not count
+    """
+    executor = ConversionExecutor(
+        ExecutorSettings(
+            kind=ExecutorKinds.thread, workers=1, queue_size=0, timeout=0.2
+        )
+    )
+    try:
+        stream = executor.stream(slow_chunks(3, 0.05))
+        assert await stream.__anext__() == 0
+        assert executor.pending == 1
+        with pytest.raises(ExecutorOverloadedError):
+            await executor.stream(slow_chunks(1, 0)).__anext__()
+        with pytest.raises(ExecutorOverloadedError):
+            await executor.run(time.sleep, 0)
+        await asyncio.sleep(0.3)
+        assert [chunk async for chunk in stream] == [1, 2]
+        assert executor.pending == 0
+
+        with pytest.raises(ExecutorTimeoutError):
+            _ = [chunk async for chunk in executor.stream(slow_chunks(10, 0.05))]
+        # the chunk being produced keeps its worker until it is finished
+        await asyncio.sleep(0.1)
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_executor_broken_pool() -> None:
+    """
+    Test that a process pool broken by a crashed worker is replaced, so the following jobs are converted
+    """
+    executor = ConversionExecutor(
+        ExecutorSettings(kind=ExecutorKinds.process, workers=1)
+    )
+    json_data = b'{"apple": 7}'
+    try:
+        with pytest.raises(BrokenProcessPool):
+            await executor.run(os._exit, 1)
+        xml_data = await executor.run(XMLParser.convert_json_to_xml, json_data)
+        assert xml_data == XMLParser.convert_json_to_xml(json_data)
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+def test_executor_threshold() -> None:
+    """
+    Test that only inputs above the threshold are offloaded
+    """
+    executor = ConversionExecutor(
+        ExecutorSettings(kind=ExecutorKinds.thread, workers=1, threshold=100)
+    )
+    executor.shutdown()
+    assert not executor.should_offload(100)
+    assert executor.should_offload(101)
+
+
+def test_executor_default_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that the CPUs are divided between the server workers unless the number of workers is set
+    """
+    monkeypatch.setattr("os.cpu_count", lambda: 32)
+    settings = ExecutorSettings(kind=ExecutorKinds.thread)
+    assert ConversionExecutor(settings).workers == 32
+    assert ConversionExecutor(settings, server_workers=8).workers == 4
+    assert ConversionExecutor(settings, server_workers=64).workers == 1
+    explicit = ExecutorSettings(kind=ExecutorKinds.thread, workers=3)
+    assert ConversionExecutor(explicit, server_workers=8).workers == 3
@@ -0,0 +1,141 @@
+import io
+import json
+from typing import Optional
+
+import cbor2
+import msgpack
+import pytest
+from starlette.requests import Request
+
+from src import main
+from src.core.formats import (
+    CBOR_MEDIA_TYPE,
+    JSON2XML_MEDIA_TYPES,
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    XML2JSON_MEDIA_TYPES,
+    XML_MEDIA_TYPE,
+    UnencodableDataError,
+    convert_xml_file,
+    negotiate_media_type,
+)
+from src.core.xml_parser import XMLParser
+from tests.test_xml_json import json_xml_valid_case_files
+
+
+@pytest.mark.parametrize(
+    "accept_header, media_type",
+    [
+        (None, JSON_MEDIA_TYPE),
+        ("*/*", JSON_MEDIA_TYPE),
+        (
+            "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            JSON_MEDIA_TYPE,
+        ),
+        ("application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/x-msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/cbor;q=0.5, application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/msgpack;q=0, application/cbor", CBOR_MEDIA_TYPE),
+        ("application/x-ndjson", NDJSON_MEDIA_TYPE),
+        ("text/xml", JSON_MEDIA_TYPE),
+        ("image/png", JSON_MEDIA_TYPE),
+    ],
+)
+def test_negotiate_xml2json_media_type(
+    accept_header: Optional[str], media_type: str
+) -> None:
+    """
+    Test that the media type of /xml2json response is negotiated by the Accept header
+
+    :param accept_header: value of the Accept header
+    :param media_type: expected media type
+    """
+    assert negotiate_media_type(accept_header, XML2JSON_MEDIA_TYPES) == media_type
+
+
+def test_negotiate_json2xml_media_type() -> None:
+    """
+    Test that the XML text is returned only when it is requested
+    """
+    assert negotiate_media_type("text/xml", JSON2XML_MEDIA_TYPES) == XML_MEDIA_TYPE
+    assert negotiate_media_type("text/*", JSON2XML_MEDIA_TYPES) == XML_MEDIA_TYPE
+    assert negotiate_media_type("*/*", JSON2XML_MEDIA_TYPES) == JSON_MEDIA_TYPE
+
+
+@pytest.mark.parametrize("json_file, xml_file", json_xml_valid_case_files())
+def test_binary_formats_valid_files(xml_file: str, json_file: str) -> None:
+    """
+    Test that the binary formats decode to the same data as the JSON response
+
+    :param xml_file: path to xml file
+    :param json_file: path to json file
+    """
+    with open(json_file, "r") as json_fp:
+        json_data = json.load(json_fp)
+    with open(xml_file, "rb") as xml_fp:
+        xml_data = xml_fp.read()
+
+    expected = {"success": True, "data": json_data}
+    msgpack_data = convert_xml_file(io.BytesIO(xml_data), MSGPACK_MEDIA_TYPE, None)
+    assert msgpack.unpackb(msgpack_data) == expected
+    cbor_data = convert_xml_file(io.BytesIO(xml_data), CBOR_MEDIA_TYPE, None)
+    assert cbor2.loads(cbor_data) == expected
+    json_bytes = convert_xml_file(io.BytesIO(xml_data), JSON_MEDIA_TYPE, None)
+    assert json.loads(json_bytes) == json_data
+
+
+@pytest.mark.parametrize("json_file, xml_file", json_xml_valid_case_files())
+def test_ndjson_valid_files(xml_file: str, json_file: str) -> None:
+    """
+    Test that documents with a top-level list are converted to one line per item and other documents are rejected
+
+    :param xml_file: path to xml file
+    :param json_file: path to json file
+    """
+    with open(json_file, "r") as json_fp:
+        json_data = json.load(json_fp)
+
+    if not isinstance(json_data, list):
+        with pytest.raises(ValueError):
+            "".join(XMLParser.iter_ndjson_from_file(xml_file))
+        return
+
+    ndjson_text = "".join(XMLParser.iter_ndjson_from_file(xml_file))
+    assert ndjson_text.endswith("\n")
+    assert [json.loads(line) for line in ndjson_text.splitlines()] == json_data
+
+
+def test_ndjson_items() -> None:
+    """
+    Test that nested lists and objects are written as single lines
+    """
+    json_data = [1, {"a": [1.5, None, {}]}, [2, [3]], "a\nb"]
+    xml_data = b"".join(XMLParser.iter_xml_from_json(json_data))
+
+    ndjson_text = "".join(XMLParser.iter_ndjson_from_file(io.BytesIO(xml_data)))
+    assert ndjson_text == '1\n{"a":[1.5,null,{}]}\n[2,[3]]\n"a\\nb"\n'
+
+
+@pytest.mark.asyncio
+async def test_binary_formats_large_integers() -> None:
+    """
+    Test that integers beyond 64 bits are encoded as CBOR and rejected as MessagePack with an unprocessable response
+    """
+    json_data = [2**64, -(2**63) - 1, 1]
+    xml_data = b"".join(XMLParser.iter_xml_from_json(json_data))
+
+    cbor_data = convert_xml_file(io.BytesIO(xml_data), CBOR_MEDIA_TYPE, None)
+    assert cbor2.loads(cbor_data) == {"success": True, "data": json_data}
+    with pytest.raises(UnencodableDataError) as exc_info:
+        convert_xml_file(io.BytesIO(xml_data), MSGPACK_MEDIA_TYPE, None)
+
+    response = await main.unencodable_data_handler(
+        Request({"type": "http"}), exc_info.value
+    )
+    assert response.status_code == 422
+    assert json.loads(response.body) == {
+        "success": False,
+        "errors": str(exc_info.value),
+    }
+    assert MSGPACK_MEDIA_TYPE in str(exc_info.value)
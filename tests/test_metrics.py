@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+
+from src.config.settings import MetricsSettings
+from src.core.metrics import (
+    OTHER_STATEMENT,
+    MetricsRegistry,
+    QueryMetrics,
+    params_shape,
+)
+
+
+def test_render_histogram() -> None:
+    """
+    Test that the histogram buckets are cumulative and that labels are escaped
+    """
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", [0.5, 0.1], ["path"])
+    for value in (0.05, 0.1, 0.3, 2):
+        histogram.labels('/a"b').observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{path="/a\\"b",le="0.1"} 2',
+        'latency_seconds_bucket{path="/a\\"b",le="0.5"} 3',
+        'latency_seconds_bucket{path="/a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{path="/a\\"b"} 2.45',
+        'latency_seconds_count{path="/a\\"b"} 4',
+    ]
+
+
+def test_render_counter_and_gauge() -> None:
+    """
+    Test that counters and gauges without labels are rendered as single samples
+    """
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests").labels().inc(3)
+    gauge = registry.gauge("in_progress", "Requests in progress").labels()
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    rendered = registry.render()
+    assert "# TYPE requests_total counter\nrequests_total 3\n" in rendered
+    assert "# TYPE in_progress gauge\nin_progress 1\n" in rendered
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Requests")
+
+
+def test_params_shape() -> None:
+    """
+    Test that only the types of the parameters are described, not their values
+    """
+    assert params_shape(None) == "()"
+    assert params_shape(("secret@test.com", 10, ["a", "b"])) == "(str, int, list[2])"
+    assert params_shape({"email": "secret@test.com"}) == "{email: str}"
+
+
+def test_query_metrics(caplog: pytest.LogCaptureFixture) -> None:
+    """
+    Test that statements are recorded by their normalised text, slow statements are logged without the values
+    of their parameters and statements beyond the limit are recorded together
+    """
+    registry = MetricsRegistry()
+    metrics = QueryMetrics(
+        registry,
+        MetricsSettings(slow_query_threshold=1, max_statements=2),
+        logging.getLogger("test_metrics"),
+    )
+    with caplog.at_level(logging.WARNING, logger="test_metrics"):
+        metrics.record("SELECT *\n  FROM users", None, 0.01, 6, False)
+        metrics.record(
+            "SELECT * FROM users WHERE email = %s", ("a@test.com",), 2, 0, True
+        )
+        metrics.record("SELECT 1", None, 0.01, 1, False)
+        metrics.record("SELECT 2", None, 0.01, 1, False)
+
+    assert metrics.rows.labels("SELECT * FROM users").value == 6
+    assert metrics.errors.labels("SELECT * FROM users WHERE email = %s").value == 1
+    assert metrics.duration.labels(OTHER_STATEMENT).counts[-1] == 0
+    assert sum(metrics.duration.labels(OTHER_STATEMENT).counts) == 2
+    assert [record.getMessage() for record in caplog.records] == [
+        "Slow query 2.000 s: SELECT * FROM users WHERE email = %s params (str)"
+    ]
+    assert (
+        'db_query_errors_total{statement="SELECT * FROM users WHERE email = %s"} 1'
+        in registry.render()
+    )
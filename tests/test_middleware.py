@@ -0,0 +1,364 @@
+import asyncio
+import time
+import zlib
+from typing import AsyncIterator, Iterator, List, Optional
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.types import Message
+
+from src import main
+from src.config.settings import (
+    CompressionSettings,
+    MetricsSettings,
+    RequestLimitsSettings,
+)
+from src.core.database import RequestReads, request_reads
+from src.core.metrics import HttpMetrics, MetricsRegistry
+from src.core.middleware import (
+    READ_YOUR_WRITES_COOKIE,
+    UNMATCHED_ROUTE,
+    BodySizeLimitMiddleware,
+    CompressionMiddleware,
+    MetricsMiddleware,
+    ReadYourWritesMiddleware,
+    negotiate_encoding,
+)
+
+app = FastAPI()
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits=RequestLimitsSettings(max_body_size=None, endpoints={"/upload": 1000}),
+)
+
+
+@app.post("/upload")
+async def upload(file: UploadFile = File(...)) -> int:
+    return len(await file.read())
+
+
+@app.post("/unlimited")
+async def unlimited(file: UploadFile = File(...)) -> int:
+    return len(await file.read())
+
+
+client = TestClient(app)
+
+reads_app = FastAPI()
+reads_app.add_middleware(ReadYourWritesMiddleware, window=60)
+
+
+@reads_app.post("/write")
+async def write() -> None:
+    reads: Optional[RequestReads] = request_reads.get()
+    assert reads is not None
+    reads.written = True
+
+
+@reads_app.get("/read")
+async def read() -> bool:
+    reads: Optional[RequestReads] = request_reads.get()
+    assert reads is not None
+    return reads.primary
+
+
+def test_body_size_limit() -> None:
+    """
+    Test that requests with bodies larger than the limit of their path are rejected
+    """
+    response = client.post("/upload", files={"file": ("a", b"x" * 100)})
+    assert response.status_code == 200
+    assert response.json() == 100
+
+    response = client.post("/upload", files={"file": ("a", b"x" * 2000)})
+    assert response.status_code == 413
+    assert response.json()["success"] is False
+
+    response = client.post("/unlimited", files={"file": ("a", b"x" * 2000)})
+    assert response.status_code == 200
+
+
+def test_body_size_limit_without_content_length() -> None:
+    """
+    Test that bodies streamed without `Content-Length` are rejected once they exceed the limit
+    """
+
+    def body() -> Iterator[bytes]:
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a"\r\n\r\n'
+        for _ in range(100):
+            yield b"x" * 100
+        yield b"\r\n--b--\r\n"
+
+    response = client.post(
+        "/upload",
+        data=body(),
+        headers={"content-type": "multipart/form-data; boundary=b"},
+    )
+    assert response.status_code == 413
+
+
+def test_read_your_writes() -> None:
+    """
+    Test that the reads of a client go to the primary after its writes, until the cookie expires
+    """
+    reads_client = TestClient(reads_app)
+    assert reads_client.get("/read").json() is False
+
+    response = reads_client.post("/write")
+    primary_until = float(response.cookies.get(READ_YOUR_WRITES_COOKIE) or 0)
+    assert time.time() < primary_until <= time.time() + 60
+    assert reads_client.get("/read").json() is True
+    assert TestClient(reads_app).get("/read").json() is False
+
+    reads_client.cookies.set(READ_YOUR_WRITES_COOKIE, str(time.time() - 1))
+    assert reads_client.get("/read").json() is False
+    reads_client.cookies.set(READ_YOUR_WRITES_COOKIE, "invalid")
+    assert reads_client.get("/read").json() is False
+
+
+compressed_app = FastAPI()
+XML_CHUNK = b'<ITEM type="str" value="value"/>' * 10
+compressed_app.add_middleware(
+    CompressionMiddleware,
+    settings=CompressionSettings(minimum_size=100, level=6, flush_size=len(XML_CHUNK)),
+)
+
+
+@compressed_app.get("/xml")
+async def xml() -> Response:
+    return Response(
+        XML_CHUNK * 10, media_type="application/xml", headers={"ETag": '"v1"'}
+    )
+
+
+@compressed_app.get("/small")
+async def small() -> Response:
+    return PlainTextResponse("small")
+
+
+@compressed_app.get("/stream")
+async def stream() -> Response:
+    async def chunks() -> AsyncIterator[bytes]:
+        for _ in range(3):
+            yield XML_CHUNK
+
+    return StreamingResponse(chunks(), media_type="application/xml")
+
+
+@compressed_app.get("/tiny-chunks")
+async def tiny_chunks() -> Response:
+    async def chunks() -> AsyncIterator[bytes]:
+        for i in range(20000):
+            yield f"[{i}]\n".encode()
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@compressed_app.get("/not-modified")
+async def not_modified() -> Response:
+    return Response(status_code=304, headers={"ETag": '"v1"'})
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip, deflate, br", "gzip"),
+        ("deflate", "deflate"),
+        ("gzip;q=0.5, deflate", "deflate"),
+        ("GZIP", "gzip"),
+        ("*", "gzip"),
+        ("*, gzip;q=0", "deflate"),
+        ("br, identity", None),
+        ("gzip;q=0, deflate;q=0", None),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding(accept_encoding: str, encoding: Optional[str]) -> None:
+    """
+    Test that gzip or deflate is chosen by the qualities of the Accept-Encoding header
+
+    :param accept_encoding: Accept-Encoding header value
+    :param encoding: expected encoding
+    """
+    assert negotiate_encoding(accept_encoding) == encoding
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+def test_compression(encoding: str) -> None:
+    """
+    Test that responses are compressed by the negotiated encoding, unless they are small or have no body
+
+    :param encoding: accepted encoding
+    """
+    compressed_client = TestClient(compressed_app)
+    headers = {"Accept-Encoding": encoding}
+    response = compressed_client.get("/xml", headers=headers)
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"v1"'
+    assert int(response.headers["content-length"]) < len(XML_CHUNK)
+    assert response.content == XML_CHUNK * 10
+
+    response = compressed_client.get("/small", headers=headers)
+    assert "content-encoding" not in response.headers
+    assert response.text == "small"
+
+    response = compressed_client.get("/not-modified", headers=headers)
+    assert response.status_code == 304
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+
+    response = compressed_client.get("/xml", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+
+
+def run_compressed_stream(path: str) -> List[Message]:
+    """
+    Runs a streamed response of the compressed application accepting gzip
+    :param path: path of the streamed response
+    :return: sent messages
+    """
+    messages: List[Message] = []
+
+    async def receive() -> Message:
+        # the client stays connected until the response ends
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "root_path": "",
+        "scheme": "http",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", b"gzip")],
+        "server": ("test", 80),
+        "client": ("test", 1),
+        "http_version": "1.1",
+    }
+    asyncio.run(compressed_app(scope, receive, send))
+    return messages
+
+
+def test_streaming_compression() -> None:
+    """
+    Test that chunks of a streamed response are flushed once flush_size bytes are compressed,
+    so the client can decompress them before the response ends
+    """
+    messages = run_compressed_stream("/stream")
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    *chunks, end = [message["body"] for message in messages[1:]]
+    assert len(chunks) == 3
+    for chunk in chunks:
+        assert decompressor.decompress(chunk) == XML_CHUNK
+    # the end of the stream carries the gzip trailer only
+    assert messages[-1]["more_body"] is False
+    assert decompressor.decompress(end) == b"" and decompressor.eof
+
+
+def test_streaming_compression_small_chunks() -> None:
+    """
+    Test that small chunks of a streamed response are compressed together,
+    so the compressed body is smaller than the raw body
+    """
+    messages = run_compressed_stream("/tiny-chunks")
+    raw_body = b"".join(f"[{i}]\n".encode() for i in range(20000))
+    bodies = [message["body"] for message in messages[1:]]
+    assert zlib.decompress(b"".join(bodies), 16 + zlib.MAX_WBITS) == raw_body
+    assert len(b"".join(bodies)) < len(raw_body) / 2
+    assert len(bodies) < 20000 / 10
+
+
+metrics_registry = MetricsRegistry()
+http_metrics = HttpMetrics(
+    metrics_registry, MetricsSettings(conversion_routes=["/convert"])
+)
+metrics_app = FastAPI()
+metrics_app.add_middleware(MetricsMiddleware, metrics=http_metrics)
+# the middleware stack is rebuilt by every added middleware
+metrics_app.add_middleware(CompressionMiddleware, settings=CompressionSettings())
+
+
+@metrics_app.get("/items/{item_id}")
+async def item(item_id: int) -> int:
+    return item_id
+
+
+@metrics_app.post("/convert")
+async def convert(file: UploadFile = File(...)) -> Response:
+    content = await file.read()
+    if content == b"invalid":
+        raise ValueError("Invalid file")
+    return Response(content * 2, media_type="application/octet-stream")
+
+
+@metrics_app.exception_handler(Exception)
+async def bad_request_handler(request: Request, exc: Exception) -> Response:
+    return PlainTextResponse(str(exc), status_code=400)
+
+
+def test_metrics_middleware() -> None:
+    """
+    Test that requests are recorded by their method, route template and status code,
+    and that the sizes of the conversions are recorded
+    """
+    metrics_client = TestClient(metrics_app)
+    for item_id in ("1", "2", "x"):
+        metrics_client.get(f"/items/{item_id}")
+    metrics_client.get("/missing")
+    metrics_client.post("/convert", files={"file": ("a", b"x" * 5000)})
+
+    assert http_metrics.responses.labels("GET", "/items/{item_id}", "200").value == 2
+    assert http_metrics.responses.labels("GET", "/items/{item_id}", "422").value == 1
+    assert http_metrics.responses.labels("GET", UNMATCHED_ROUTE, "404").value == 1
+    assert http_metrics.in_progress.labels("GET", "/items/{item_id}").value == 0
+    assert sum(http_metrics.duration.labels("GET", "/items/{item_id}").counts) == 3
+    # the multipart upload is larger than the file, the response is twice the file
+    assert http_metrics.conversion_input.labels("/convert").sum > 5000
+    assert http_metrics.conversion_output.labels("/convert").sum == 10000
+
+    rendered = metrics_registry.render()
+    assert (
+        'http_responses_total{method="GET",route="/items/{item_id}",status="200"} 2'
+        in rendered
+    )
+    assert 'conversion_output_bytes_bucket{route="/convert",le="16384"} 1' in rendered
+
+
+def test_metrics_middleware_handled_error() -> None:
+    """
+    Test that errors turned into responses by the catch-all exception handler are recorded by their status code
+    """
+    metrics_client = TestClient(metrics_app, raise_server_exceptions=False)
+    response = metrics_client.post("/convert", files={"file": ("a", b"invalid")})
+    assert response.status_code == 400
+    assert response.text == "Invalid file"
+
+    assert http_metrics.responses.labels("POST", "/convert", "400").value == 1
+    assert http_metrics.responses.labels("POST", "/convert", "500").value == 0
+
+
+def test_metrics_middleware_rebuilt() -> None:
+    """
+    Test that rebuilding the middleware stack records into the same metrics,
+    and that the application with all its middlewares is built
+    """
+    metrics_app.build_middleware_stack()
+    metrics_app.build_middleware_stack()
+    with pytest.raises(ValueError):
+        HttpMetrics(metrics_registry, MetricsSettings())
+
+    assert main.app.middleware_stack is not None
+    if main.metrics_registry is not None:
+        assert "http_request_duration_seconds" in main.metrics_registry.families
@@ -0,0 +1,142 @@
+import asyncio
+import datetime
+import io
+import json
+from typing import Any, Awaitable, List, Optional, Tuple
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from pydantic import EmailStr
+from starlette.responses import JSONResponse, Response
+from starlette.types import Message
+
+from src.config.settings import ExecutorKinds, ExecutorSettings
+from src.core.executor import ConversionExecutor
+from src.core.formats import NDJSON_MEDIA_TYPE
+from src.core.responses import (
+    dump_json,
+    error_response,
+    ndjson_error_line,
+    stream_response,
+    success_response,
+    success_stream_response,
+)
+from src.core.xml_parser import XMLParser
+from src.schemas.models import User
+
+
+def reference_body(content: Any) -> Any:
+    return json.loads(JSONResponse(jsonable_encoder(content)).body)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        [{"email": "é@test.com", "value": "value"}] * 3,
+        {"users": {"a@test.com": {"email": "a@test.com", "value": None}}},
+        "<?xml version='1.0' encoding='utf-8'?>\n<ROOT/>",
+        User(email=EmailStr("a@test.com"), value="value"),
+        {"created": datetime.datetime(2022, 1, 1, 12), "count": 2**70},
+        {1: "non-string key"},
+    ],
+)
+def test_success_response_envelope(data: Any) -> None:
+    """
+    Test that the responses have the same envelope and content as the responses encoded by `jsonable_encoder`
+    and `JSONResponse`
+
+    :param data: data of the response
+    """
+    response = success_response(data, next_cursor="cursor")
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == reference_body(
+        {"success": True, "data": data, "next_cursor": "cursor"}
+    )
+
+
+def test_error_response_envelope() -> None:
+    """
+    Test that the error responses keep their envelope and status code
+    """
+    response = error_response([{"loc": ["email"]}], status_code=404)
+    assert response.status_code == 404
+    assert response.body == b'{"success":false,"errors":[{"loc":["email"]}]}'
+    assert success_response().body == b'{"success":true}'
+
+
+def test_dump_json_unsupported() -> None:
+    """
+    Test that data neither orjson nor `jsonable_encoder` can encode is rejected
+    """
+    with pytest.raises(ValueError):
+        dump_json({"data": object()})
+
+
+def run_response(
+    response: Awaitable[Response],
+) -> Tuple[List[Message], Optional[Exception]]:
+    """Creates and runs the ASGI response, returns the sent messages and the raised error"""
+    messages: List[Message] = []
+
+    async def receive() -> Message:
+        await asyncio.Event().wait()
+        return {}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    async def run() -> None:
+        await (await response)({"type": "http"}, receive, send)
+
+    try:
+        asyncio.run(run())
+    except Exception as e:
+        return messages, e
+    return messages, None
+
+
+BAD_ITEM_XML = (
+    b'<ITEM type="list"><ITEM type="integer" value="1"/>'
+    b'<ITEM type="integer" value="x"/><ITEM type="integer" value="3"/></ITEM>'
+)
+
+
+def test_stream_response_bad_item() -> None:
+    """
+    Test that an invalid item in the middle of a NDJSON stream ends it with an error record
+    and aborts the response instead of completing it
+    """
+    lines = XMLParser.iter_ndjson_from_file(io.BytesIO(BAD_ITEM_XML), chunk_size=1)
+    executor = ConversionExecutor(ExecutorSettings(kind=ExecutorKinds.thread))
+    try:
+        response = stream_response(
+            executor.stream(lines), NDJSON_MEDIA_TYPE, error_chunk=ndjson_error_line
+        )
+        messages, error = run_response(response)
+    finally:
+        executor.shutdown()
+
+    assert isinstance(error, ValueError)
+    assert messages[0]["status"] == 200
+    bodies = [message["body"] for message in messages[1:]]
+    assert bodies[0] == b"1\n"
+    assert json.loads(bodies[-1]) == {"success": False, "errors": str(error)}
+    # the body is never completed
+    assert all(message.get("more_body") for message in messages[1:])
+
+
+def test_success_stream_response_bad_item() -> None:
+    """
+    Test that an invalid item in the middle of a streamed JSON document aborts the response
+    """
+    chunks = XMLParser.iter_json_from_file(io.BytesIO(BAD_ITEM_XML), chunk_size=1)
+    executor = ConversionExecutor(ExecutorSettings(kind=ExecutorKinds.thread))
+    try:
+        messages, error = run_response(success_stream_response(executor.stream(chunks)))
+    finally:
+        executor.shutdown()
+
+    assert isinstance(error, ValueError)
+    body = b"".join(message["body"] for message in messages[1:])
+    assert body == b'{"success":true,"data":[1'
+    assert all(message.get("more_body") for message in messages[1:])
@@ -0,0 +1,222 @@
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.request
+from http.client import HTTPException
+from typing import Any, Dict
+
+import pytest
+import uvicorn
+from pydantic import ValidationError
+from starlette.types import Receive, Scope, Send
+from uvicorn.main import STARTUP_FAILURE
+
+from src.config.settings import (
+    DatabasePoolSettings,
+    EventLoops,
+    HttpProtocols,
+    LogLevels,
+    Settings,
+    UserCacheSettings,
+    UserSettings,
+    UvicornSettings,
+)
+from src.core.server import WorkerSupervisor, bind_reuse_port, server_options
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    """Application answering the pid of the worker"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            await send({"type": message["type"] + ".complete"})
+            if message["type"] == "lifespan.shutdown":
+                return
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(os.getpid()).encode()})
+
+
+async def failing_app(scope: Scope, receive: Receive, send: Send) -> None:
+    """Application failing its startup"""
+    await receive()
+    await send({"type": "lifespan.startup.failed", "message": "no database"})
+
+
+def uvicorn_settings(**kwargs: Any) -> UvicornSettings:
+    return UvicornSettings(
+        **{
+            "host": "127.0.0.1",
+            "port": 8000,
+            "log_level": LogLevels.warning,
+            "reload": False,
+            **kwargs,
+        }
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def test_worker_count() -> None:
+    """
+    Test that a single worker is run by default and when reloading
+    """
+    assert uvicorn_settings().worker_count == 1
+    assert uvicorn_settings(workers=4).worker_count == 4
+    assert uvicorn_settings(workers=4, reload=True).worker_count == 1
+
+
+def test_worker_settings() -> None:
+    """
+    Test that the workers share the connections of the pool and that several workers caching users notify each other
+    """
+    pool = DatabasePoolSettings(min_size=4, max_size=10)
+    assert pool.per_worker(1) == pool
+    assert (pool.per_worker(4).min_size, pool.per_worker(4).max_size) == (2, 2)
+    assert pool.per_worker(16).max_size == 1
+
+    config: Dict[str, Any] = {
+        "db_connection": {
+            "postgres_user": "user",
+            "postgres_password": "password",
+            "postgres_database": "database",
+            "postgres_server": "localhost",
+        },
+        "api_config": {"version": "1", "docs_url": "/docs"},
+    }
+    Settings(uvicorn=uvicorn_settings(), **config)
+    Settings(
+        uvicorn=uvicorn_settings(workers=4),
+        users=UserSettings(cache=UserCacheSettings(notify_channel="users")),
+        **config,
+    )
+    Settings(
+        uvicorn=uvicorn_settings(workers=4),
+        users=UserSettings(cache=UserCacheSettings(enabled=False)),
+        **config,
+    )
+    with pytest.raises(ValidationError, match="notify_channel"):
+        Settings(uvicorn=uvicorn_settings(workers=4), **config)
+
+
+def test_server_options() -> None:
+    """
+    Test that the settings are passed to the uvicorn configuration
+    """
+    settings = uvicorn_settings(
+        loop=EventLoops.asyncio, http=HttpProtocols.h11, backlog=128
+    )
+    config = uvicorn.Config("tests.test_server:app", **server_options(settings))
+    assert config.loop == "asyncio"
+    assert config.http == "h11"
+    assert config.backlog == 128
+    assert config.port == 8000
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="no SO_REUSEPORT")
+def test_bind_reuse_port() -> None:
+    """
+    Test that the sockets of the workers share the port
+    """
+    port = free_port()
+    sockets = [bind_reuse_port("127.0.0.1", port) for _ in range(2)]
+    try:
+        assert [sock.getsockname()[1] for sock in sockets] == [port, port]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def get_pid(port: int) -> int:
+    """Requests the pid of a worker, retried while the workers are starting or restarting"""
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{port}/", timeout=5
+            ) as response:
+                return int(response.read())
+        except (OSError, HTTPException):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@pytest.mark.parametrize(
+    "reuse_port",
+    [
+        False,
+        pytest.param(
+            True,
+            marks=pytest.mark.skipif(
+                not hasattr(socket, "SO_REUSEPORT"), reason="no SO_REUSEPORT"
+            ),
+        ),
+    ],
+)
+def test_worker_supervisor(reuse_port: bool) -> None:
+    """
+    Test that the workers serving their max_requests requests are replaced and stop gracefully on shutdown
+    :param reuse_port: whether the workers bind their own sockets
+    """
+    port = free_port()
+    settings = uvicorn_settings(
+        port=port, workers=2, reuse_port=reuse_port, max_requests=1, graceful_timeout=10
+    )
+    supervisor = WorkerSupervisor(
+        uvicorn.Config("tests.test_server:app", **server_options(settings)), settings
+    )
+    supervisor.startup()
+    # the supervisor replaces the exited workers in the background, like its `run` loop
+    stopped = threading.Event()
+
+    def supervise() -> None:
+        while not stopped.wait(0.05):
+            supervisor.restart_exited()
+
+    supervising = threading.Thread(target=supervise)
+    supervising.start()
+    try:
+        # the workers exit on the tick of their event loop after their first request
+        pids = {get_pid(port)}
+        deadline = time.monotonic() + 30
+        while len(pids) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+            pids.add(get_pid(port))
+    finally:
+        stopped.set()
+        supervising.join()
+        supervisor.shutdown()
+    assert len(pids) >= 3
+    # no worker had to be killed, those still starting are stopped by SIGTERM
+    assert all(
+        process.exitcode in (0, -signal.SIGTERM) for process in supervisor.processes
+    )
+
+
+@pytest.mark.parametrize("app_name", ["failing_app", "missing_app"])
+def test_worker_supervisor_startup_failure(app_name: str) -> None:
+    """
+    Test that the server is stopped rather than restarting the workers failing to start
+    :param app_name: application failing its startup or missing
+    """
+    settings = uvicorn_settings(port=free_port(), workers=1)
+    supervisor = WorkerSupervisor(
+        uvicorn.Config(f"tests.test_server:{app_name}", **server_options(settings)),
+        settings,
+    )
+    supervisor.startup()
+    try:
+        supervisor.processes[0].join(30)
+        supervisor.restart_exited()
+    finally:
+        supervisor.shutdown()
+    assert supervisor.failed
+    assert supervisor.should_exit.is_set()
+    assert supervisor.processes[0].exitcode == STARTUP_FAILURE
@@ -0,0 +1,91 @@
+import io
+import json
+from tempfile import SpooledTemporaryFile
+
+import pytest
+
+from src.core.uploads import (
+    load_json,
+    load_json_file,
+    spooled_file_path,
+    upload_buffer,
+)
+
+JSON_DOCUMENTS = [
+    b'{"apple": 7, "many": [1.5, true, null, "\\u00e9"]}',
+    b"[NaN, Infinity, -Infinity]",
+    b"[123456789012345678901234567890, -0, 1e400]",
+    b'"\\ud800"',
+    b"\xef\xbb\xbf[1]",
+]
+
+
+@pytest.mark.parametrize("data", JSON_DOCUMENTS)
+def test_load_json(data: bytes) -> None:
+    """
+    Test that JSON documents are parsed to the same values as by the standard library
+
+    :param data: JSON document
+    """
+    assert json.dumps(load_json(memoryview(data))) == json.dumps(json.loads(data))
+
+
+@pytest.mark.parametrize("data", [b"{", b"[1,]", b"NaNa"])
+def test_load_json_invalid(data: bytes) -> None:
+    """
+    Test that invalid JSON documents are rejected with the standard library error
+
+    :param data: JSON document
+    """
+    with pytest.raises(json.JSONDecodeError):
+        load_json(memoryview(data))
+
+
+@pytest.mark.parametrize("size", [0, 10, 100000])
+def test_upload_buffer(size: int) -> None:
+    """
+    Test that the content of in-memory and rolled over spooled files is exposed and released
+
+    :param size: size of the file content
+    """
+    content = b"x" * size
+    file = SpooledTemporaryFile(max_size=1000)
+    file.write(content)
+
+    with upload_buffer(file) as buffer:
+        assert buffer == content
+    # the buffer is released, so the file can be written again
+    file.write(b"y")
+    file.close()
+
+
+def test_load_json_file() -> None:
+    """
+    Test that uploaded files are parsed in place
+    """
+    document = {"many": list(range(10000))}
+    file = SpooledTemporaryFile(max_size=1000)
+    file.write(json.dumps(document).encode())
+    file.seek(0)
+
+    assert load_json_file(file) == document
+    assert load_json_file(io.BytesIO(b"[]")) == []
+
+
+def test_spooled_file_path() -> None:
+    """
+    Test that rolled over spooled files are opened by their path with their own offset, in-memory files have none
+    """
+    document = {"many": list(range(10000))}
+    file = SpooledTemporaryFile(max_size=1000)
+    file.write(b"[")
+    assert spooled_file_path(file) is None
+
+    file.write(json.dumps(document).encode() + b"]")
+    path = spooled_file_path(file)
+    assert path is not None
+    offset = file.tell()
+    assert load_json_file(path) == [document]
+    # the file offset of the upload is not moved
+    assert file.tell() == offset
+    file.close()
@@ -0,0 +1,99 @@
+import time
+from typing import Any, Dict, List, Optional, cast
+
+import pytest
+from psycopg import OperationalError
+
+from src.config.settings import UserCacheSettings
+from src.core.database import DatabaseConnection
+from src.core.user_cache import UserCache
+
+
+def user(email: str) -> Dict[str, str]:
+    return {"email": email, "value": "value"}
+
+
+@pytest.mark.asyncio
+async def test_read_through() -> None:
+    """
+    Test that users and missing users are loaded once and served from the cache afterwards
+    """
+    cache = UserCache(UserCacheSettings())
+    loaded: List[str] = []
+
+    async def load(email: str) -> Optional[Dict[str, str]]:
+        loaded.append(email)
+        return user(email) if email != "missing@test.com" else None
+
+    for _ in range(3):
+        assert await cache.read_through(
+            "a@test.com", lambda: load("a@test.com")
+        ) == user("a@test.com")
+        assert (
+            await cache.read_through(
+                "missing@test.com", lambda: load("missing@test.com")
+            )
+            is None
+        )
+    assert loaded == ["a@test.com", "missing@test.com"]
+    assert cache.stats()["hits"] == 4
+
+    cache.drop(["a@test.com"])
+    await cache.read_through("a@test.com", lambda: load("a@test.com"))
+    await cache.read_through("missing@test.com", lambda: load("missing@test.com"))
+    assert loaded == ["a@test.com", "missing@test.com", "a@test.com"]
+
+
+def test_cache_bounds(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that the least recently used users are evicted and that the users expire after the TTL
+    """
+    cache = UserCache(UserCacheSettings(max_entries=2, ttl=10))
+    cache.put("a@test.com", user("a@test.com"), cache.version)
+    cache.put("b@test.com", user("b@test.com"), cache.version)
+    assert cache.get("a@test.com")[0]
+    cache.put("c@test.com", user("c@test.com"), cache.version)
+    assert cache.get("a@test.com")[0]
+    assert not cache.get("b@test.com")[0]
+    assert cache.stats()["evictions"] == 1
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert not cache.get("a@test.com")[0]
+    assert not cache.get("c@test.com")[0]
+
+
+def test_stale_put() -> None:
+    """
+    Test that users loaded before an invalidation are not stored, as they may be older than the write
+    """
+    cache = UserCache(UserCacheSettings())
+    version = cache.version
+    cache.drop(["other@test.com"])
+    cache.put("a@test.com", user("a@test.com"), version)
+    assert not cache.get("a@test.com")[0]
+
+    cache = UserCache(UserCacheSettings(enabled=False))
+    cache.put("a@test.com", user("a@test.com"), cache.version)
+    assert not cache.get("a@test.com")[0]
+
+
+@pytest.mark.asyncio
+async def test_invalidate_failed_notify(caplog: pytest.LogCaptureFixture) -> None:
+    """
+    Test that a failed notification of the other workers is logged, as the users are already written
+    """
+
+    class FailingConnection:
+        async def execute(self, query: str, params: Any = None) -> None:
+            raise OperationalError("connection lost")
+
+    cache = UserCache(UserCacheSettings(notify_channel="users"))
+    cache.put("a@test.com", user("a@test.com"), cache.version)
+    db_connection = cast(DatabaseConnection, FailingConnection())
+    await cache.invalidate(db_connection, ["a@test.com"])
+    await cache.invalidate(db_connection)
+    assert not cache.get("a@test.com")[0]
+    assert (
+        caplog.text.count("User cache invalidations are not sent: connection lost") == 2
+    )
@@ -1,22 +1,47 @@
 import asyncio
 import json
+import logging
 import tempfile
-from typing import Generator
+import time
+from typing import Any, AsyncGenerator, Callable, List
 
 import pytest
 import pytest_asyncio
-from psycopg2._psycopg import connection
+from psycopg import Connection
 from pydantic import EmailStr
 from pytest_postgresql import factories
-from starlette.responses import JSONResponse
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Message
 
-from src.core.database import DatabaseConnection
+from src.config.settings import (
+    DatabasePoolSettings,
+    DatabaseReplicaSettings,
+    MetricsSettings,
+    ReplicaBalancing,
+    UserBatchSettings,
+    UserBulkSettings,
+    UserCacheSettings,
+    UserExportSettings,
+    UserSettings,
+    UserWriteSettings,
+)
+from src.core.database import DatabaseConnection, RequestReads, request_reads
+from src.core.metrics import MetricsRegistry, QueryMetrics
+from src.core.pagination import encode_cursor
+from src.core.user_cache import UserCache, UserCacheListener
+from src.core.user_writes import UserWriteCoalescer
 from src.routers.user import (
     create_user_associated_value,
     delete_user_associated_value,
+    delete_users_associated_values,
+    export_users,
+    get_user_associated_value,
     get_users,
+    get_users_associated_values,
+    upsert_users_bulk,
 )
-from src.schemas.requests import UserCreateRequest
+from src.schemas.requests import UserBatchRequest, UserCreateRequest
 
 socket_dir = tempfile.TemporaryDirectory()
 postgresql_proc = factories.postgresql_proc(port=None, unixsocketdir=socket_dir.name)
@@ -24,6 +49,14 @@ postgresql_mocked = factories.postgresql(
     "postgresql_proc",
     load=["database/init.sql"],
 )
+# second database server standing in for a read replica, its data is written by the tests
+postgresql_replica_proc = factories.postgresql_proc(
+    port=None, unixsocketdir=socket_dir.name
+)
+postgresql_replica = factories.postgresql(
+    "postgresql_replica_proc",
+    load=["database/init.sql"],
+)
 
 EMAIL_LIST = [
     "leia@test.com",
@@ -35,23 +68,36 @@ EMAIL_LIST = [
 ]
 
 
-@pytest.fixture(scope="function")
-def db_connection_mocked(
-    postgresql_mocked: connection,
-) -> Generator[DatabaseConnection, None, None]:
-    db_connection = DatabaseConnection(conn=postgresql_mocked)
+@pytest_asyncio.fixture(scope="function")
+async def db_connection_mocked(
+    postgresql_mocked: Connection,
+) -> AsyncGenerator[DatabaseConnection, None]:
+    db_connection = DatabaseConnection(
+        dsn=postgresql_mocked.info.dsn,
+        settings=DatabasePoolSettings(min_size=1, max_size=4),
+    )
+    await db_connection.open()
     yield db_connection
-    db_connection.close()
+    await db_connection.close()
+
+
+@pytest.fixture(scope="function")
+def user_cache() -> UserCache:
+    return UserCache(UserCacheSettings())
 
 
 @pytest_asyncio.fixture(scope="function")
-async def mock_users(db_connection_mocked: DatabaseConnection) -> None:
+async def mock_users(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache
+) -> None:
     _ = await asyncio.gather(
         *[
             create_user_associated_value(
                 user_in=UserCreateRequest(value="test_value"),
                 email=EmailStr(email),
                 db_connection=db_connection_mocked,
+                user_cache=user_cache,
+                user_writes=None,
             )
             for email in EMAIL_LIST
         ]
@@ -60,8 +106,8 @@ async def mock_users(db_connection_mocked: DatabaseConnection) -> None:
 
 @pytest.mark.asyncio
 async def test_query_empty_users(db_connection_mocked: DatabaseConnection) -> None:
-    users_result: JSONResponse = await get_users(
-        offset=0, limit=10, db_connection=db_connection_mocked
+    users_result: Response = await get_users(
+        offset=0, limit=10, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
     assert len(user_result_data) == 0
@@ -69,12 +115,13 @@ async def test_query_empty_users(db_connection_mocked: DatabaseConnection) -> No
 
 @pytest.mark.asyncio
 async def test_insert_users(
-    db_connection_mocked: DatabaseConnection, n: int = 10
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache, n: int = 10
 ) -> None:
     """
     Test that the users are inserted correctly.
     The test is performed on :param n different users and the number of the users is verified
     :param db_connection_mocked: Database connection
+    :param user_cache: User cache
     :param n: Number of users to insert
     :return: None
     """
@@ -87,66 +134,70 @@ async def test_insert_users(
                 user_in=test_user_in,
                 email=EmailStr(test_user_email),
                 db_connection=db_connection_mocked,
+                user_cache=user_cache,
+                user_writes=None,
             )
             for test_user_email, test_user_in in test_user_email_value_arr
         ]
     )
-    results = db_connection_mocked.query_all("SELECT * from users")
+    results = await db_connection_mocked.query_all("SELECT * from users")
     assert len(results) == n
 
 
 @pytest.mark.asyncio
-async def test_update_user_value(db_connection_mocked: DatabaseConnection) -> None:
+async def test_update_user_value(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache
+) -> None:
     """
     Test that the user value is updated correctly
     :param db_connection_mocked: Database connection
+    :param user_cache: User cache
     :return: None
     """
     test_user_email = "user@test.com"
     test_user_in_value1 = UserCreateRequest(value="test_value")
     test_user_in_value2 = UserCreateRequest(value="test_value2")
-    _ = await asyncio.gather(
-        *[
-            create_user_associated_value(
-                user_in=test_user_in_value1,
-                email=EmailStr(test_user_email),
-                db_connection=db_connection_mocked,
-            ),
-            create_user_associated_value(
-                user_in=test_user_in_value2,
-                email=EmailStr(test_user_email),
-                db_connection=db_connection_mocked,
-            ),
-        ]
-    )
-    results = db_connection_mocked.query_all("SELECT * from users")
-    assert results[0][1] == "test_value2"
+    # requests run on different connections of the pool, so the order of concurrent requests is not defined
+    for test_user_in in [test_user_in_value1, test_user_in_value2]:
+        await create_user_associated_value(
+            user_in=test_user_in,
+            email=EmailStr(test_user_email),
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_writes=None,
+        )
+    results = await db_connection_mocked.query_all("SELECT * from users")
+    assert results[0]["value"] == "test_value2"
 
 
 @pytest.mark.asyncio
-async def test_delete_user(db_connection_mocked: DatabaseConnection) -> None:
+async def test_delete_user(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache
+) -> None:
     """
     Test that the user is deleted correctly
     :param db_connection_mocked: Database connection
+    :param user_cache: User cache
     :param mock_users: Mocked users
     :return: None
     """
     test_user_email = "user@test.com"
     test_user_in_value1 = UserCreateRequest(value="test_value")
-    _ = await asyncio.gather(
-        *[
-            create_user_associated_value(
-                user_in=test_user_in_value1,
-                email=EmailStr(test_user_email),
-                db_connection=db_connection_mocked,
-            ),
-            delete_user_associated_value(
-                email=EmailStr(test_user_email), db_connection=db_connection_mocked
-            ),
-        ]
+    await create_user_associated_value(
+        user_in=test_user_in_value1,
+        email=EmailStr(test_user_email),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_writes=None,
+    )
+    await delete_user_associated_value(
+        email=EmailStr(test_user_email),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_writes=None,
     )
 
-    results = db_connection_mocked.query_all("SELECT * from users")
+    results = await db_connection_mocked.query_all("SELECT * from users")
     assert len(results) == 0
 
 
@@ -160,11 +211,11 @@ async def test_users_alphabetical_sorting(
     :param mock_users: Mocked users
     :return: None
     """
-    users_result: JSONResponse = await get_users(
-        offset=0, limit=10, db_connection=db_connection_mocked
+    users_result: Response = await get_users(
+        offset=0, limit=10, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
-    email_results = [result[0] for result in user_result_data]
+    email_results = [result["email"] for result in user_result_data]
     assert email_results == list(sorted(EMAIL_LIST))
 
 
@@ -178,14 +229,14 @@ async def test_offset_users(
     :param mock_users: Mocked users
     :return: None
     """
-    users_result: JSONResponse = await get_users(
-        offset=3, limit=10, db_connection=db_connection_mocked
+    users_result: Response = await get_users(
+        offset=3, limit=10, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
     assert len(user_result_data) == 3
 
     users_result = await get_users(
-        offset=10, limit=10, db_connection=db_connection_mocked
+        offset=10, limit=10, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
     assert len(user_result_data) == 0
@@ -202,25 +253,916 @@ async def test_limit_users(
     :return: None
     """
     users_result = await get_users(
-        offset=0, limit=1, db_connection=db_connection_mocked
+        offset=0, limit=1, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
     assert len(user_result_data) == 1
 
     users_result = await get_users(
-        offset=0, limit=100, db_connection=db_connection_mocked
+        offset=0, limit=100, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
     assert len(user_result_data) == 6
 
     users_result = await get_users(
-        offset=0, limit=0, db_connection=db_connection_mocked
+        offset=0, limit=0, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
     assert len(user_result_data) == 0
 
     users_result = await get_users(
-        offset=100, limit=0, db_connection=db_connection_mocked
+        offset=100, limit=0, db_connection=db_connection_mocked, if_none_match=None
     )
     user_result_data = json.loads(users_result.body)["data"]
     assert len(user_result_data) == 0
+
+
+@pytest.mark.asyncio
+async def test_cursor_users(
+    db_connection_mocked: DatabaseConnection, mock_users: None
+) -> None:
+    """
+    Test that following the cursors returns all users once and in alphabetical order
+    :param db_connection_mocked: Database connection
+    :param mock_users: Mocked users
+    :return: None
+    """
+    users_result = await get_users(
+        offset=0, limit=4, db_connection=db_connection_mocked, if_none_match=None
+    )
+    users_result_json = json.loads(users_result.body)
+    assert len(users_result_json["data"]) == 4
+    assert users_result_json["next_cursor"] is not None
+
+    emails = [user["email"] for user in users_result_json["data"]]
+    cursor = users_result_json["next_cursor"]
+    while cursor is not None:
+        users_result = await get_users(
+            offset=0,
+            limit=1,
+            cursor=cursor,
+            db_connection=db_connection_mocked,
+            if_none_match=None,
+        )
+        users_result_json = json.loads(users_result.body)
+        emails += [user["email"] for user in users_result_json["data"]]
+        cursor = users_result_json["next_cursor"]
+    assert emails == list(sorted(EMAIL_LIST))
+
+    users_result = await get_users(
+        offset=0, limit=6, db_connection=db_connection_mocked, if_none_match=None
+    )
+    assert json.loads(users_result.body)["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_users(db_connection_mocked: DatabaseConnection) -> None:
+    """
+    Test that cursors not returned by the application and cursors combined with offset are rejected
+    :param db_connection_mocked: Database connection
+    :return: None
+    """
+    for cursor in ["not-a-cursor", "e30", "W10"]:
+        users_result = await get_users(
+            offset=0,
+            limit=10,
+            cursor=cursor,
+            db_connection=db_connection_mocked,
+            if_none_match=None,
+        )
+        assert users_result.status_code == 400
+
+    users_result = await get_users(
+        offset=0, limit=1, db_connection=db_connection_mocked, if_none_match=None
+    )
+    assert users_result.status_code == 200
+    users_result = await get_users(
+        offset=1,
+        limit=1,
+        cursor=encode_cursor({"email": EMAIL_LIST[0]}),
+        db_connection=db_connection_mocked,
+        if_none_match=None,
+    )
+    assert users_result.status_code == 400
+
+
+def bulk_request(chunks: List[bytes], content_type: str) -> Request:
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks
+    ]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive() -> Message:
+        return messages.pop(0)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/users/bulk",
+        "headers": [(b"content-type", content_type.encode("latin-1"))],
+    }
+    return Request(scope, receive)
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_users(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache, mock_users: None
+) -> None:
+    """
+    Test that JSON arrays and NDJSON streams of users are upserted in batches and that the last value of
+    a repeated email is stored
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :param mock_users: Mocked users
+    :return: None
+    """
+    user_settings = UserSettings(bulk=UserBulkSettings(batch_size=3))
+    users = [{"email": f"bulk{i}@test.com", "value": f"value{i}"} for i in range(7)]
+    users.append({"email": EMAIL_LIST[0], "value": "updated"})
+    users.append({"email": "bulk0@test.com", "value": "last"})
+    bulk_result = await upsert_users_bulk(
+        request=bulk_request([json.dumps(users).encode("utf-8")], "application/json"),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_settings=user_settings,
+    )
+    bulk_result_data = json.loads(bulk_result.body)["data"]
+    assert bulk_result_data["count"] == 9
+    assert [batch["count"] for batch in bulk_result_data["batches"]] == [3, 3, 3]
+    assert [batch["upserted"] for batch in bulk_result_data["batches"]] == [3, 3, 3]
+
+    results = await db_connection_mocked.query_all("SELECT * from users")
+    values = {result["email"]: result["value"] for result in results}
+    assert len(values) == len(EMAIL_LIST) + 7
+    assert values[EMAIL_LIST[0]] == "updated"
+    assert values["bulk0@test.com"] == "last"
+
+    ndjson = b"".join(json.dumps(user).encode("utf-8") + b"\n" for user in users)
+    ndjson += b'\n{"email": "bulk0@test.com", "value": "ndjson"}'
+    chunks = [ndjson[start:][:10] for start in range(0, len(ndjson), 10)]
+    bulk_result = await upsert_users_bulk(
+        request=bulk_request(chunks, "application/x-ndjson; charset=utf-8"),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_settings=user_settings,
+    )
+    bulk_result_data = json.loads(bulk_result.body)["data"]
+    assert bulk_result_data["count"] == 10
+    assert len(bulk_result_data["batches"]) == 4
+    user = await db_connection_mocked.query_one(
+        "SELECT * from users WHERE email = %s", ("bulk0@test.com",)
+    )
+    assert user is not None and user["value"] == "ndjson"
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_invalid_users(
+    db_connection_mocked: DatabaseConnection,
+    user_cache: UserCache,
+) -> None:
+    """
+    Test that nothing is stored when any of the users is invalid, even when previous batches were copied
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :return: None
+    """
+    user_settings = UserSettings(bulk=UserBulkSettings(batch_size=2))
+    users = [{"email": f"bulk{i}@test.com", "value": f"value{i}"} for i in range(5)]
+    invalid_bodies = [
+        json.dumps(users + [{"email": "not-an-email", "value": "value"}]),
+        json.dumps(users + [{"email": "bulk@test.com"}]),
+        json.dumps({"email": "bulk@test.com", "value": "value"}),
+    ]
+    for body in invalid_bodies:
+        bulk_result = await upsert_users_bulk(
+            request=bulk_request([body.encode("utf-8")], "application/json"),
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_settings=user_settings,
+        )
+        assert bulk_result.status_code == 400
+
+    ndjson = b"".join(json.dumps(user).encode("utf-8") + b"\n" for user in users)
+    bulk_result = await upsert_users_bulk(
+        request=bulk_request([ndjson, b"{"], "application/x-ndjson"),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_settings=user_settings,
+    )
+    assert bulk_result.status_code == 400
+    assert "User 5" in json.loads(bulk_result.body)["errors"]
+
+    results = await db_connection_mocked.query_all("SELECT * from users")
+    assert len(results) == 0
+
+
+@pytest.mark.asyncio
+async def test_lookup_users(
+    db_connection_mocked: DatabaseConnection, mock_users: None
+) -> None:
+    """
+    Test that the users are looked up in batches and keyed by email, and that the missing users are listed
+    :param db_connection_mocked: Database connection
+    :param mock_users: Mocked users
+    :return: None
+    """
+    user_settings = UserSettings(batch=UserBatchSettings(max_emails=8, batch_size=2))
+    emails = [
+        EmailStr(email)
+        for email in EMAIL_LIST[:4]
+        + ["missing@test.com", EMAIL_LIST[0], "other@test.com"]
+    ]
+    users_result = await get_users_associated_values(
+        users_in=UserBatchRequest(emails=emails),
+        db_connection=db_connection_mocked,
+        user_settings=user_settings,
+    )
+    users_result_data = json.loads(users_result.body)["data"]
+    assert list(users_result_data["users"]) == EMAIL_LIST[:4]
+    assert users_result_data["users"][EMAIL_LIST[0]] == {
+        "email": EMAIL_LIST[0],
+        "value": "test_value",
+    }
+    assert users_result_data["missing"] == ["missing@test.com", "other@test.com"]
+
+    users_result = await get_users_associated_values(
+        users_in=UserBatchRequest(
+            emails=[EmailStr(f"user{i}@test.com") for i in range(9)]
+        ),
+        db_connection=db_connection_mocked,
+        user_settings=user_settings,
+    )
+    assert users_result.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_delete_users(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache, mock_users: None
+) -> None:
+    """
+    Test that the users are deleted in batches and that the missing users are listed
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :param mock_users: Mocked users
+    :return: None
+    """
+    user_settings = UserSettings(batch=UserBatchSettings(batch_size=2))
+    emails = [EmailStr(email) for email in EMAIL_LIST[:3] + ["missing@test.com"]]
+    users_result = await delete_users_associated_values(
+        users_in=UserBatchRequest(emails=emails),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_settings=user_settings,
+    )
+    users_result_data = json.loads(users_result.body)["data"]
+    assert users_result_data == {
+        "deleted": EMAIL_LIST[:3],
+        "missing": ["missing@test.com"],
+    }
+
+    results = await db_connection_mocked.query_all("SELECT * from users")
+    assert sorted(result["email"] for result in results) == sorted(EMAIL_LIST[3:])
+
+
+@pytest.mark.asyncio
+async def test_delete_users_failed_batch(
+    db_connection_mocked: DatabaseConnection,
+    user_cache: UserCache,
+    mock_users: None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    Test that the users of the committed batches are invalidated when a later batch fails
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :param mock_users: Mocked users
+    :param monkeypatch: Patches the queries to fail the second batch
+    :return: None
+    """
+    for email in EMAIL_LIST[:4]:
+        user_cache.put(email, {"email": email}, user_cache.version)
+    query_all = db_connection_mocked.query_all
+    batches = 0
+
+    async def failing_query_all(*args: Any, **kwargs: Any) -> List[Any]:
+        nonlocal batches
+        batches += 1
+        if batches == 2:
+            raise RuntimeError("batch failed")
+        return await query_all(*args, **kwargs)
+
+    monkeypatch.setattr(db_connection_mocked, "query_all", failing_query_all)
+    with pytest.raises(RuntimeError):
+        await delete_users_associated_values(
+            users_in=UserBatchRequest(
+                emails=[EmailStr(email) for email in EMAIL_LIST[:4]]
+            ),
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_settings=UserSettings(batch=UserBatchSettings(batch_size=2)),
+        )
+
+    assert user_cache.get(EMAIL_LIST[0]) == (False, None)
+    assert user_cache.get(EMAIL_LIST[1]) == (False, None)
+    assert user_cache.get(EMAIL_LIST[2]) == (True, {"email": EMAIL_LIST[2]})
+
+
+@pytest.mark.asyncio
+async def test_cached_user(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache, mock_users: None
+) -> None:
+    """
+    Test that [GET] /user serves cached users and that the writes invalidate them
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :param mock_users: Mocked users
+    :return: None
+    """
+    email = EmailStr(EMAIL_LIST[0])
+    for _ in range(2):
+        user_result = await get_user_associated_value(
+            email=email,
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            if_none_match=None,
+        )
+        assert json.loads(user_result.body)["data"]["value"] == "test_value"
+    assert user_cache.stats()["hits"] == 1
+
+    await create_user_associated_value(
+        user_in=UserCreateRequest(value="new_value"),
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_writes=None,
+    )
+    user_result = await get_user_associated_value(
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        if_none_match=None,
+    )
+    assert json.loads(user_result.body)["data"]["value"] == "new_value"
+
+    await delete_user_associated_value(
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_writes=None,
+    )
+    user_result = await get_user_associated_value(
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        if_none_match=None,
+    )
+    assert user_result.status_code == 404
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_cache_notifications(
+    postgresql_mocked: Connection,
+    db_connection_mocked: DatabaseConnection,
+    mock_users: None,
+) -> None:
+    """
+    Test that the writes of one worker invalidate the users cached by another worker
+    :param postgresql_mocked: Database connection of the test
+    :param db_connection_mocked: Database connection
+    :param mock_users: Mocked users
+    :return: None
+    """
+    settings = UserCacheSettings(notify_channel="users_test")
+    writer_cache, reader_cache = UserCache(settings), UserCache(settings)
+    listener = UserCacheListener(
+        dsn=postgresql_mocked.info.dsn,
+        cache=reader_cache,
+        channel="users_test",
+        logger=logging.getLogger(__name__),
+    )
+    await listener.start()
+    try:
+        # the cache is cleared once the listener is connected
+        await wait_until(lambda: reader_cache.invalidations > 0)
+
+        email = EmailStr(EMAIL_LIST[0])
+        await get_user_associated_value(
+            email=email,
+            db_connection=db_connection_mocked,
+            user_cache=reader_cache,
+            if_none_match=None,
+        )
+        assert reader_cache.get(email)[0]
+
+        await create_user_associated_value(
+            user_in=UserCreateRequest(value="new_value"),
+            email=email,
+            db_connection=db_connection_mocked,
+            user_cache=writer_cache,
+            user_writes=None,
+        )
+        await wait_until(lambda: email not in reader_cache.entries)
+        user_result = await get_user_associated_value(
+            email=email,
+            db_connection=db_connection_mocked,
+            user_cache=reader_cache,
+            if_none_match=None,
+        )
+        assert json.loads(user_result.body)["data"]["value"] == "new_value"
+    finally:
+        await listener.stop()
+
+
+@pytest.mark.asyncio
+async def test_prepared_statements(postgresql_mocked: Connection) -> None:
+    """
+    Test that the repeated statements are prepared once per connection and that the number of
+    the prepared statements is bounded
+    :param postgresql_mocked: Database connection of the test
+    :return: None
+    """
+    db_connection = DatabaseConnection(
+        dsn=postgresql_mocked.info.dsn,
+        settings=DatabasePoolSettings(min_size=1, max_size=1, prepared_max=3),
+    )
+    await db_connection.open()
+    try:
+        for _ in range(3):
+            await db_connection.query_one(
+                "SELECT * FROM users WHERE email = %s", (EMAIL_LIST[0],)
+            )
+        prepared = await db_connection.query_all(
+            "SELECT statement FROM pg_prepared_statements", prepare=False
+        )
+        assert [statement["statement"] for statement in prepared] == [
+            "SELECT * FROM users WHERE email = $1"
+        ]
+
+        for limit in range(5):
+            await db_connection.query_all("SELECT * FROM users LIMIT %s", (limit,))
+            await db_connection.query_all(f"SELECT * FROM users LIMIT {limit}")
+        prepared = await db_connection.query_all(
+            "SELECT statement FROM pg_prepared_statements", prepare=False
+        )
+        assert len(prepared) == 3
+    finally:
+        await db_connection.close()
+
+
+async def read_streaming_response(response: StreamingResponse) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+@pytest.mark.asyncio
+async def test_export_users(
+    db_connection_mocked: DatabaseConnection, mock_users: None
+) -> None:
+    """
+    Test that all users are exported in chunks as NDJSON or CSV, sorted by email
+    :param db_connection_mocked: Database connection
+    :param mock_users: Mocked users
+    :return: None
+    """
+    user_settings = UserSettings(export=UserExportSettings(chunk_size=4))
+    export_result = await export_users(
+        accept_header=None,
+        db_connection=db_connection_mocked,
+        user_settings=user_settings,
+    )
+    assert export_result.media_type == "application/x-ndjson"
+    chunks = [chunk async for chunk in export_result.body_iterator]
+    assert len(chunks) == 2
+    users = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert users == [
+        {"email": email, "value": "test_value"} for email in sorted(EMAIL_LIST)
+    ]
+
+    export_result = await export_users(
+        accept_header="text/csv",
+        db_connection=db_connection_mocked,
+        user_settings=user_settings,
+    )
+    assert export_result.media_type == "text/csv"
+    lines = (await read_streaming_response(export_result)).decode().splitlines()
+    assert lines == ["email,value"] + [
+        f"{email},test_value" for email in sorted(EMAIL_LIST)
+    ]
+
+    # the connection of an export which was not read to the end is returned to the pool
+    export_result = await export_users(
+        accept_header=None,
+        db_connection=db_connection_mocked,
+        user_settings=user_settings,
+    )
+    body_iterator: Any = export_result.body_iterator
+    await body_iterator.__anext__()
+    await body_iterator.aclose()
+    assert len(await db_connection_mocked.query_all("SELECT * FROM users")) == 6
+    assert db_connection_mocked.pool.get_stats()["pool_available"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_replica_reads(
+    postgresql_mocked: Connection, postgresql_replica: Connection
+) -> None:
+    """
+    Test that the reads of the read-only endpoints are balanced between the replicas, that the writes go to
+    the primary and that the reads of a request go to the primary after its writes,
+    also when other requests cached the user read from the lagging replica
+    :param postgresql_mocked: Database connection of the primary
+    :param postgresql_replica: Database connection of the replica
+    :return: None
+    """
+    postgresql_replica.execute(
+        "INSERT INTO users VALUES ('replica@test.com', 'replica_value')"
+    )
+    postgresql_replica.commit()
+    db_connection = DatabaseConnection(
+        dsn=postgresql_mocked.info.dsn,
+        settings=DatabasePoolSettings(min_size=1, max_size=2),
+        replica_settings=DatabaseReplicaSettings(
+            uris=[postgresql_replica.info.dsn] * 2
+        ),
+    )
+    await db_connection.open()
+    user_cache = UserCache(UserCacheSettings())
+    try:
+        for _ in range(4):
+            users_result = await get_users(
+                offset=0, limit=10, db_connection=db_connection, if_none_match=None
+            )
+            assert [
+                user["email"] for user in json.loads(users_result.body)["data"]
+            ] == ["replica@test.com"]
+        assert [
+            pool.get_stats().get("requests_num") for pool in db_connection.replica_pools
+        ] == [2, 2]
+
+        # the reads of a request go to the primary once it has written
+        token = request_reads.set(RequestReads())
+        try:
+            email = EmailStr("primary@test.com")
+            user_result = await get_user_associated_value(
+                email=email,
+                db_connection=db_connection,
+                user_cache=user_cache,
+                if_none_match=None,
+            )
+            assert user_result.status_code == 404
+            await create_user_associated_value(
+                user_in=UserCreateRequest(value="primary_value"),
+                email=email,
+                db_connection=db_connection,
+                user_cache=user_cache,
+                user_writes=None,
+            )
+            user_result = await get_user_associated_value(
+                email=email,
+                db_connection=db_connection,
+                user_cache=user_cache,
+                if_none_match=None,
+            )
+            assert json.loads(user_result.body)["data"]["value"] == "primary_value"
+        finally:
+            request_reads.reset(token)
+
+        # once the user read from the primary is evicted, other clients cache the user missing in the replica
+        user_cache.drop([email])
+        user_result = await get_user_associated_value(
+            email=email,
+            db_connection=db_connection,
+            user_cache=user_cache,
+            if_none_match=None,
+        )
+        assert user_result.status_code == 404
+        assert user_cache.get(email) == (True, None)
+        # the writer pinned to the primary by its cookie still reads its write
+        token = request_reads.set(RequestReads(primary=True))
+        try:
+            user_result = await get_user_associated_value(
+                email=email,
+                db_connection=db_connection,
+                user_cache=user_cache,
+                if_none_match=None,
+            )
+            assert json.loads(user_result.body)["data"]["value"] == "primary_value"
+        finally:
+            request_reads.reset(token)
+    finally:
+        await db_connection.close()
+
+
+@pytest.mark.asyncio
+async def test_least_connections_replica(
+    postgresql_mocked: Connection, postgresql_replica: Connection
+) -> None:
+    """
+    Test that the reads go to the replica with the least borrowed connections
+    :param postgresql_mocked: Database connection of the primary
+    :param postgresql_replica: Database connection of the replica
+    :return: None
+    """
+    postgresql_replica.execute(
+        "INSERT INTO users VALUES ('replica@test.com', 'replica_value')"
+    )
+    postgresql_replica.commit()
+    db_connection = DatabaseConnection(
+        dsn=postgresql_mocked.info.dsn,
+        settings=DatabasePoolSettings(min_size=1, max_size=2),
+        replica_settings=DatabaseReplicaSettings(
+            uris=[postgresql_replica.info.dsn] * 2,
+            balancing=ReplicaBalancing.least_connections,
+        ),
+    )
+    await db_connection.open()
+    try:
+        # the export borrows a connection of the first replica until it is read to the end
+        chunks = db_connection.stream("SELECT * FROM users", replica=True)
+        await chunks.__anext__()
+        assert db_connection.replica_connections == [1, 0]
+        for _ in range(3):
+            await db_connection.query_all("SELECT * FROM users", replica=True)
+        await chunks.aclose()
+        assert db_connection.replica_connections == [0, 0]
+        assert [
+            pool.get_stats().get("requests_num") for pool in db_connection.replica_pools
+        ] == [1, 3]
+    finally:
+        await db_connection.close()
+
+
+@pytest.mark.asyncio
+async def test_query_metrics(
+    postgresql_mocked: Connection, caplog: pytest.LogCaptureFixture
+) -> None:
+    """
+    Test that the statements are timed with their row counts and errors, and that slow statements are logged
+    :param postgresql_mocked: Database connection of the test
+    :param caplog: Captured log records
+    :return: None
+    """
+    registry = MetricsRegistry()
+    metrics = QueryMetrics(
+        registry,
+        MetricsSettings(slow_query_threshold=0.05),
+        logging.getLogger("test_query_metrics"),
+    )
+    db_connection = DatabaseConnection(
+        dsn=postgresql_mocked.info.dsn,
+        settings=DatabasePoolSettings(min_size=1, max_size=1),
+        metrics=metrics,
+    )
+    await db_connection.open()
+    insert = "INSERT INTO users VALUES(%s, %s)"
+    select = "SELECT * FROM users WHERE email = ANY(%s)"
+    try:
+        for email in EMAIL_LIST:
+            await db_connection.execute(insert, (email, "value"))
+        with pytest.raises(Exception):
+            await db_connection.execute(insert, (EMAIL_LIST[0], "value"))
+        assert len(await db_connection.query_all(select, (EMAIL_LIST[:3],))) == 3
+        assert await db_connection.query_one(select, ([],)) is None
+        with caplog.at_level(logging.WARNING, logger="test_query_metrics"):
+            await db_connection.query_one("SELECT pg_sleep(0.1)")
+    finally:
+        await db_connection.close()
+
+    inserts = metrics.duration.labels(insert)
+    assert sum(inserts.counts) == len(EMAIL_LIST) + 1
+    assert metrics.rows.labels(insert).value == len(EMAIL_LIST)
+    assert metrics.errors.labels(insert).value == 1
+    assert sum(metrics.duration.labels(select).counts) == 2
+    assert metrics.rows.labels(select).value == 3
+    assert select not in metrics.errors.metrics
+    assert "SELECT pg_sleep(0.1)" in registry.render()
+    assert [record.getMessage()[:10] for record in caplog.records] == ["Slow query"]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_writes(
+    db_connection_mocked: DatabaseConnection,
+    user_cache: UserCache,
+    mock_users: None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    Test that concurrent writes are committed in batches of max_operations writes, that the last write of an email
+    wins and that the requests are answered once their batch is committed
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :param mock_users: Mocked users
+    :param monkeypatch: Patches the transactions to count them
+    :return: None
+    """
+    transactions = []
+    transaction = db_connection_mocked.transaction
+
+    def counted_transaction() -> Any:
+        transactions.append(time.monotonic())
+        return transaction()
+
+    monkeypatch.setattr(db_connection_mocked, "transaction", counted_transaction)
+    user_writes = UserWriteCoalescer(
+        db_connection_mocked,
+        user_cache,
+        UserWriteSettings(coalesce=True, flush_interval=0.05, max_operations=10),
+    )
+    email = EmailStr(EMAIL_LIST[0])
+    writes = [
+        create_user_associated_value(
+            user_in=UserCreateRequest(value=f"value{i}"),
+            email=EmailStr(f"user{i}@test.com"),
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_writes=user_writes,
+        )
+        for i in range(20)
+    ]
+    writes += [
+        create_user_associated_value(
+            user_in=UserCreateRequest(value="first"),
+            email=email,
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_writes=user_writes,
+        ),
+        delete_user_associated_value(
+            email=email,
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_writes=user_writes,
+        ),
+        create_user_associated_value(
+            user_in=UserCreateRequest(value="last"),
+            email=EmailStr(EMAIL_LIST[1]),
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_writes=user_writes,
+        ),
+        delete_user_associated_value(
+            email=EmailStr(EMAIL_LIST[2]),
+            db_connection=db_connection_mocked,
+            user_cache=user_cache,
+            user_writes=user_writes,
+        ),
+    ]
+    results = await asyncio.gather(*writes)
+    await user_writes.close()
+
+    assert all(result.status_code == 200 for result in results)
+    # two full batches and the rest after the flush interval
+    assert len(transactions) == 3
+    users = {
+        user["email"]: user["value"]
+        for user in await db_connection_mocked.query_all("SELECT * FROM users")
+    }
+    assert len(users) == 20 + len(EMAIL_LIST) - 2
+    assert users["user19@test.com"] == "value19"
+    assert email not in users and EMAIL_LIST[2] not in users
+    assert users[EMAIL_LIST[1]] == "last"
+
+
+@pytest.mark.asyncio
+async def test_coalesced_writes_failure(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache
+) -> None:
+    """
+    Test that all the writers of a batch get the error of the batch and nothing of it is committed
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :return: None
+    """
+    user_writes = UserWriteCoalescer(
+        db_connection_mocked,
+        user_cache,
+        UserWriteSettings(coalesce=True, flush_interval=0.01),
+    )
+    results = await asyncio.gather(
+        user_writes.upsert("user@test.com", "value"),
+        user_writes.upsert("long@test.com", "\x00"),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, Exception) for result in results)
+    assert results[0] is results[1]
+    assert await db_connection_mocked.query_all("SELECT * FROM users") == []
+
+
+@pytest.mark.asyncio
+async def test_users_etag(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache, mock_users: None
+) -> None:
+    """
+    Test that pages of users are answered with 304 while the users are not written,
+    and that every write changes their ETag
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :param mock_users: Mocked users
+    :return: None
+    """
+    response = await get_users(
+        offset=0, limit=2, db_connection=db_connection_mocked, if_none_match=None
+    )
+    etag = response.headers["etag"]
+    cursor = json.loads(response.body)["next_cursor"]
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}'):
+        response = await get_users(
+            offset=0,
+            limit=2,
+            db_connection=db_connection_mocked,
+            if_none_match=if_none_match,
+        )
+        assert response.status_code == 304
+        assert response.body == b""
+        assert response.headers["etag"] == etag
+
+    response = await get_users(
+        offset=0,
+        limit=2,
+        cursor=cursor,
+        db_connection=db_connection_mocked,
+        if_none_match=None,
+    )
+    assert response.headers["etag"] == etag
+    assert len(json.loads(response.body)["data"]) == 2
+
+    await delete_user_associated_value(
+        email=EmailStr("nobody@test.com"),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_writes=None,
+    )
+    response = await get_users(
+        offset=0, limit=2, db_connection=db_connection_mocked, if_none_match=etag
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    etag = response.headers["etag"]
+    await upsert_users_bulk(
+        request=bulk_request(
+            [b'[{"email": "new@test.com", "value": "v"}]'], "application/json"
+        ),
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_settings=UserSettings(),
+    )
+    response = await get_users(
+        offset=100, limit=2, db_connection=db_connection_mocked, if_none_match=etag
+    )
+    assert response.status_code == 200
+    assert json.loads(response.body)["data"] == []
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_user_etag(
+    db_connection_mocked: DatabaseConnection, user_cache: UserCache, mock_users: None
+) -> None:
+    """
+    Test that a cached user is answered with 304 without querying the database and that its ETag changes
+    with its value
+    :param db_connection_mocked: Database connection
+    :param user_cache: User cache
+    :param mock_users: Mocked users
+    :return: None
+    """
+    email = EmailStr(EMAIL_LIST[0])
+    response = await get_user_associated_value(
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        if_none_match=None,
+    )
+    etag = response.headers["etag"]
+    misses = user_cache.misses
+    response = await get_user_associated_value(
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        if_none_match=etag,
+    )
+    assert response.status_code == 304
+    assert user_cache.misses == misses
+
+    await create_user_associated_value(
+        user_in=UserCreateRequest(value="new_value"),
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        user_writes=None,
+    )
+    response = await get_user_associated_value(
+        email=email,
+        db_connection=db_connection_mocked,
+        user_cache=user_cache,
+        if_none_match=etag,
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
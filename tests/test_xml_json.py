@@ -1,4 +1,5 @@
 import glob
+import io
 import json
 import os
 from json import JSONDecodeError
@@ -8,6 +9,7 @@ import pytest
 from lxml import etree
 from lxml.etree import XMLSyntaxError
 
+from src.config.annotations import JSONType
 from src.core.xml_parser import XMLParser
 
 
@@ -83,3 +85,219 @@ def test_xml_parser_invalid_xml_input(xml_file: str) -> None:
     """
     with pytest.raises((XMLSyntaxError, ValueError)), open(xml_file, "r") as xml_fp:
         XMLParser.parse_xml_from_file(xml_fp)
+
+
+@pytest.mark.parametrize("json_file, xml_file", json_xml_valid_case_files())
+def test_stream_xml_parser_valid_files(xml_file: str, json_file: str) -> None:
+    """
+    Test streaming XML parsing
+    by comparing the streamed JSON text with the JSON-encoded XML file parsing output
+
+    :param xml_file: path to xml file
+    :param json_file: path to json file
+    """
+    with open(json_file, "r") as json_fp:
+        stream_parse_out = "".join(XMLParser.iter_json_from_file(xml_file))
+        xml_parse_out = XMLParser.parse_xml_from_file(xml_file)
+        assert stream_parse_out == json.dumps(
+            xml_parse_out, ensure_ascii=False, separators=(",", ":")
+        )
+        assert json.loads(stream_parse_out) == json.load(json_fp)
+
+
+@pytest.mark.parametrize("xml_file", xml_invalid_format_files())
+def test_stream_xml_parser_invalid_xml_input(xml_file: str) -> None:
+    """
+    Test streaming XML parsing exception
+    """
+    with pytest.raises((XMLSyntaxError, ValueError)), open(xml_file, "rb") as xml_fp:
+        "".join(XMLParser.iter_json_from_file(xml_fp))
+
+
+@pytest.mark.parametrize("json_file, xml_file", json_xml_valid_case_files())
+def test_direct_xml_parser_valid_files(xml_file: str, json_file: str) -> None:
+    """
+    Test direct XML to JSON text conversion
+    by comparing the JSON text with the JSON-encoded XML file parsing output
+
+    :param xml_file: path to xml file
+    :param json_file: path to json file
+    """
+    with open(json_file, "r") as json_fp:
+        direct_parse_out = XMLParser.convert_xml_to_json(xml_file)
+        xml_parse_out = XMLParser.parse_xml_from_file(xml_file)
+        assert direct_parse_out == json.dumps(
+            xml_parse_out, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        assert json.loads(direct_parse_out) == json.load(json_fp)
+
+
+@pytest.mark.parametrize("xml_file", xml_invalid_format_files())
+def test_direct_xml_parser_invalid_xml_input(xml_file: str) -> None:
+    """
+    Test direct XML to JSON text conversion exception
+    """
+    with pytest.raises((XMLSyntaxError, ValueError)), open(xml_file, "rb") as xml_fp:
+        XMLParser.convert_xml_to_json(xml_fp)
+
+
+def test_xml_parser_ignored_children() -> None:
+    """
+    Test that children of object members that are not an object nor a list are ignored by all XML parsers
+    """
+    xml_data = (
+        b'<ITEM type="object"><ITEM type="string" value="a" key="apple">'
+        b'<ITEM type="integer" value="1" key="ignored"/></ITEM></ITEM>'
+    )
+    assert XMLParser.parse_xml_from_file(io.BytesIO(xml_data)) == {"apple": "a"}
+    assert XMLParser.convert_xml_to_json(io.BytesIO(xml_data)) == b'{"apple":"a"}'
+    assert "".join(XMLParser.iter_json_from_file(io.BytesIO(xml_data))) == (
+        '{"apple":"a"}'
+    )
+
+
+@pytest.mark.parametrize(
+    "prolog",
+    [b"<!-- c -->", b"<?app x?>", b'<?xml version="1.0"?><!-- a --><!-- b -->'],
+)
+def test_stream_xml_parser_prolog(prolog: bytes) -> None:
+    """
+    Test that comments and processing instructions before the root element are ignored by the streaming parsers
+    :param prolog: nodes before the root element
+    """
+    xml_data = (
+        prolog + b'<ITEM type="list"><!-- d --><ITEM type="integer" value="1"/>'
+        b'<ITEM type="string" value="a"/></ITEM><!-- e -->'
+    )
+    expected = XMLParser.convert_xml_to_json(io.BytesIO(xml_data))
+    assert expected == b'[1,"a"]'
+    assert "".join(XMLParser.iter_json_from_file(io.BytesIO(xml_data))) == (
+        expected.decode()
+    )
+    assert "".join(XMLParser.iter_ndjson_from_file(io.BytesIO(xml_data))) == (
+        '1\n"a"\n'
+    )
+
+
+def test_stream_xml_parser_incremental_output() -> None:
+    """
+    Test that the streaming XML parsing yields JSON before the whole document is converted
+    """
+    items = "".join(f'<ITEM type="integer" value="{i}"/>' for i in range(1000))
+    xml_fp = io.BytesIO(f'<ITEM type="list">{items}</ITEM>'.encode())
+
+    chunks = XMLParser.iter_json_from_file(xml_fp, chunk_size=1)
+    assert next(chunks) == "["
+    assert json.loads("[" + "".join(chunks)) == list(range(1000))
+
+
+def test_stream_xml_parser_chunk_size() -> None:
+    """
+    Test that the streamed JSON and NDJSON are coalesced into chunks of at least the chunk size
+    and that NDJSON chunks consist of whole lines
+    """
+    items = "".join(
+        f'<ITEM type="object"><ITEM key="id" type="integer" value="{i}"/></ITEM>'
+        for i in range(100000)
+    )
+    xml_data = f'<ITEM type="list">{items}</ITEM>'.encode()
+    expected = [{"id": i} for i in range(100000)]
+
+    json_chunks = list(XMLParser.iter_json_from_file(io.BytesIO(xml_data)))
+    assert json.loads("".join(json_chunks)) == expected
+    assert 1 < len(json_chunks) <= 20
+    assert all(len(chunk) >= 64 * 1024 for chunk in json_chunks[:-1])
+
+    ndjson_chunks = list(XMLParser.iter_ndjson_from_file(io.BytesIO(xml_data)))
+    assert [json.loads(line) for line in "".join(ndjson_chunks).splitlines()] == (
+        expected
+    )
+    assert 1 < len(ndjson_chunks) <= 20
+    assert all(len(chunk) >= 64 * 1024 for chunk in ndjson_chunks[:-1])
+    assert all(chunk.endswith("\n") for chunk in ndjson_chunks)
+
+
+@pytest.mark.parametrize("json_file, xml_file", json_xml_valid_case_files())
+def test_stream_json_parser_valid_files(xml_file: str, json_file: str) -> None:
+    """
+    Test incremental XML serialization
+    by comparing it with the serialized XML element tree and the canonical xml file
+
+    :param xml_file: path to xml file
+    :param json_file: path to json file
+    """
+    with open(json_file, "r") as json_fp, open(xml_file, "r") as xml_fp:
+        xml_fp_str = xml_fp.read()
+        json_data = json.load(json_fp)
+        chunks = list(XMLParser.iter_xml_from_json(json_data, chunk_size=16))
+        assert all(len(chunk) >= 16 for chunk in chunks[:-1])
+        stream_parse_out = b"".join(chunks)
+        xml_parse_out = XMLParser.parse_xml_from_json(json_data)
+        assert stream_parse_out == etree.tostring(xml_parse_out, encoding="utf-8")
+        stream_parse_out_etree = etree.tostring(
+            etree.fromstring(stream_parse_out), method="c14n"
+        )
+        assert stream_parse_out_etree.decode("utf-8") == xml_fp_str
+
+
+def test_stream_json_parser_chunk_size() -> None:
+    """
+    Test that the incremental XML serialization yields chunks of at least the chunk size
+    """
+    json_data = [{"id": i, "tags": ["a", "b"]} for i in range(2000)]
+    xml_data = etree.tostring(XMLParser.parse_xml_from_json(json_data))
+
+    chunks = list(XMLParser.iter_xml_from_json(json_data, chunk_size=4096))
+    assert b"".join(chunks) == xml_data
+    assert len(chunks) > 10
+    assert all(len(chunk) >= 4096 for chunk in chunks[:-1])
+    with pytest.raises(TypeError):
+        XMLParser.iter_xml_from_json(json_data, 16)  # type: ignore[call-arg]
+
+
+def test_deeply_nested_document(depth: int = 100000) -> None:
+    """
+    Test that deeply nested documents are converted in both directions without recursion
+
+    :param depth: nesting depth of the document
+    """
+    json_data: JSONType = 1
+    for _ in range(depth - 1):
+        json_data = [json_data]
+
+    xml_parse_out = XMLParser.parse_xml_from_json(json_data)
+    xml_stream_out = b"".join(XMLParser.iter_xml_from_json(json_data))
+    assert xml_stream_out == etree.tostring(xml_parse_out, encoding="utf-8")
+
+    json_parse_out = XMLParser._parse_etree_to_json_type(xml_parse_out)
+    for _ in range(depth - 1):
+        assert isinstance(json_parse_out, list) and len(json_parse_out) == 1
+        json_parse_out = json_parse_out[0]
+    assert json_parse_out == 1
+
+
+@pytest.mark.parametrize("json_file, xml_file", json_xml_valid_case_files())
+def test_max_depth_exceeded(xml_file: str, json_file: str) -> None:
+    """
+    Test that documents nested deeper than the maximal depth are rejected
+
+    :param xml_file: path to xml file
+    :param json_file: path to json file
+    """
+    with open(json_file, "r") as json_fp:
+        json_data = json.load(json_fp)
+    if not isinstance(json_data, (dict, list)) or not json_data:
+        pytest.skip("document is not nested")
+
+    with pytest.raises(ValueError):
+        XMLParser.parse_xml_from_file(xml_file, max_depth=1)
+    with pytest.raises(ValueError):
+        "".join(XMLParser.iter_json_from_file(xml_file, max_depth=1))
+    with pytest.raises(ValueError):
+        XMLParser.convert_xml_to_json(xml_file, max_depth=1)
+    with pytest.raises(ValueError):
+        XMLParser.parse_xml_from_json(json_data, max_depth=1)
+    with pytest.raises(ValueError):
+        b"".join(XMLParser.iter_xml_from_json(json_data, max_depth=1))
+
+    assert XMLParser.parse_xml_from_file(xml_file, max_depth=4) == json_data
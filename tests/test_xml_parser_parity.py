@@ -0,0 +1,208 @@
+import io
+import json
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pytest
+from lxml import etree
+from lxml.etree import _Element
+
+from src.config.annotations import JSONType
+from src.core.responses import encode_json
+from src.core.xml_parser import XMLElementType, XMLParser, _decode_leaf, _encode_leaf
+
+ITEM_TYPES = [item_type.value for item_type in XMLElementType]
+ITEM_VALUES = [None, "", "0", "7", "-3", "4.1", "1e300", "true", "false", "abc", "é"]
+
+
+def reference_leaf(element: _Element) -> Any:
+    """
+    Reference leaf decoding - enum conversion followed by an if/elif chain
+    """
+    element_type = XMLElementType(element.get("type"))
+    value = element.get("value")
+    if value is None:
+        if element_type is XMLElementType.NULL:
+            return None
+        elif element_type is XMLElementType.OBJECT:
+            return {}
+        else:
+            raise ValueError("Invalid XML file schema")
+
+    if element_type is XMLElementType.STRING:
+        return value
+    elif element_type is XMLElementType.INTEGER:
+        return int(value)
+    elif element_type is XMLElementType.FLOAT:
+        return float(value)
+    elif element_type is XMLElementType.BOOLEAN:
+        return value == "true"
+    else:
+        raise NotImplementedError(f"Etree element type not supported: {element_type}")
+
+
+def reference_etree_to_json(node: _Element) -> JSONType:
+    """
+    Reference conversion - recursive, children are classified before they are converted
+    """
+    children = list(node)
+    if not children:
+        node_key = node.get("key")
+        if node_key is None:
+            return reference_leaf(node)
+        return {node_key: reference_leaf(node)}
+
+    if all(child.get("key") is None for child in children):
+        return [reference_etree_to_json(child) for child in children]
+
+    result: Dict[str, JSONType] = {}
+    for child in children:
+        child_key = child.get("key")
+        child_type = XMLElementType(child.get("type"))
+        if child_key is None:
+            raise ValueError("Invalid XML file schema")
+        if child_type in [XMLElementType.OBJECT, XMLElementType.LIST] and len(child):
+            result[child_key] = reference_etree_to_json(child)
+        else:
+            result[child_key] = reference_leaf(child)
+    return result
+
+
+def conversion_outcome(node: _Element, reference: bool) -> Tuple[str, Any]:
+    """
+    Returns the converted value or the fact that the conversion failed
+    """
+    try:
+        if reference:
+            return "value", reference_etree_to_json(node)
+        return "value", XMLParser._parse_etree_to_json_type(node)
+    except (ValueError, NotImplementedError):
+        return "error", None
+
+
+def direct_conversion_outcome(node: _Element) -> Tuple[str, Any]:
+    """
+    Returns the value converted directly to JSON text or the fact that the conversion failed
+    """
+    try:
+        json_bytes = XMLParser.convert_xml_to_json(io.BytesIO(etree.tostring(node)))
+        return "value", json.loads(json_bytes)
+    except (ValueError, NotImplementedError):
+        return "error", None
+
+
+def random_json(rng: random.Random, depth: int = 0) -> JSONType:
+    """
+    Returns a random valid JSON document, lists are not empty as they cannot be represented in XML
+    """
+    roll = rng.random()
+    if depth < 4 and roll < 0.25:
+        return {
+            f"key{i}": random_json(rng, depth + 1) for i in range(rng.randint(0, 5))
+        }
+    if depth < 4 and roll < 0.45:
+        return [random_json(rng, depth + 1) for _ in range(rng.randint(1, 5))]
+    return rng.choice([0, 7, -3, 4.1, 1e300, True, False, None, "", "text", "é"])
+
+
+def random_element(rng: random.Random, depth: int = 0) -> _Element:
+    """
+    Returns a random, possibly invalid, ITEM element tree
+    """
+    attrib: Dict[str, str] = {}
+    item_type: Optional[str] = rng.choice(ITEM_TYPES + ["object2", None])
+    if item_type is not None:
+        attrib["type"] = item_type
+    value = rng.choice(ITEM_VALUES)
+    if value is not None and rng.random() < 0.5:
+        attrib["value"] = value
+    if rng.random() < 0.5:
+        attrib["key"] = f"key{rng.randint(0, 3)}"
+
+    element = etree.Element("ITEM", attrib)
+    if depth < 3 and rng.random() < 0.4:
+        for _ in range(rng.randint(1, 4)):
+            element.append(random_element(rng, depth + 1))
+    return element
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_parity_valid_documents(seed: int) -> None:
+    """
+    Test that valid documents are converted the same way as by the reference conversion
+    and that the round trip JSON -> XML -> JSON returns the original document
+
+    :param seed: random seed of the generated document
+    """
+    json_data = random_json(random.Random(seed))
+    element = XMLParser.parse_xml_from_json(json_data)
+    xml_bytes = etree.tostring(element, encoding="utf-8")
+
+    assert XMLParser._parse_etree_to_json_type(element) == json_data
+    assert reference_etree_to_json(element) == json_data
+    assert XMLParser.parse_xml_from_file(io.BytesIO(xml_bytes)) == json_data
+
+    stream_out = "".join(XMLParser.iter_json_from_file(io.BytesIO(xml_bytes)))
+    assert json.loads(stream_out) == json_data
+    assert XMLParser.convert_xml_to_json(io.BytesIO(xml_bytes)) == encode_json(
+        json_data
+    )
+    assert b"".join(XMLParser.iter_xml_from_json(json_data)) == xml_bytes
+
+
+@pytest.mark.parametrize("seed", range(500))
+def test_parity_random_elements(seed: int) -> None:
+    """
+    Test that random, possibly invalid, documents are converted or rejected the same way as by the reference conversion
+
+    :param seed: random seed of the generated element tree
+    """
+    element = random_element(random.Random(seed))
+    outcome = conversion_outcome(element, reference=True)
+    assert conversion_outcome(element, reference=False) == outcome
+    assert direct_conversion_outcome(element) == outcome
+
+
+@pytest.mark.parametrize("item_type", ITEM_TYPES + ["object2"])
+@pytest.mark.parametrize("value", ITEM_VALUES)
+def test_parity_leaf_decoding(item_type: str, value: Optional[str]) -> None:
+    """
+    Test that the dispatch table decodes leaves the same way as the reference decoding
+
+    :param item_type: raw type attribute
+    :param value: raw value attribute
+    """
+    attrib = {"type": item_type}
+    if value is not None:
+        attrib["value"] = value
+    element = etree.Element("ITEM", attrib)
+
+    outcomes: List[Tuple[str, Any]] = []
+    for decode in (reference_leaf, XMLParser._parse_etree_node_leaf):
+        try:
+            outcomes.append(("value", decode(element)))
+        except (ValueError, NotImplementedError) as exc:
+            outcomes.append(("error", type(exc)))
+    assert outcomes[0] == outcomes[1]
+
+
+@pytest.mark.parametrize("item_type", ITEM_TYPES + ["object2"])
+@pytest.mark.parametrize("value", ITEM_VALUES + ["nan", "-inf", "1e400", "1_0", " 5 "])
+def test_parity_leaf_encoding(item_type: str, value: Optional[str]) -> None:
+    """
+    Test that leaves are encoded to the same JSON text as `JSONResponse` encodes the decoded values
+
+    :param item_type: raw type attribute
+    :param value: raw value attribute
+    """
+    outcomes: List[Tuple[str, Any]] = []
+    encoders: List[Callable[[], str]] = [
+        lambda: encode_json(_decode_leaf(item_type, value)).decode(),
+        lambda: _encode_leaf(item_type, value),
+    ]
+    for encode in encoders:
+        try:
+            outcomes.append(("value", encode()))
+        except (ValueError, NotImplementedError) as exc:
+            outcomes.append(("error", type(exc)))
+    assert outcomes[0] == outcomes[1]